@@ -1,23 +1,50 @@
 # coding=utf-8
 """Tools for analyzing the database, for the item-item algorithm."""
+import array
+import contextlib
+import hashlib
+import heapq
 import itertools
 import math
 import multiprocessing
 
-from movie_recommender import exceptions
+import numpy
+
+from movie_recommender import exceptions, metrics
 from movie_recommender.constants import (
-    JOBS_PER_PROCESS_PER_BATCH,
+    CS_TILE_SIZE,
     MIN_PAIRS_FOR_SIMILARITY,
 )
-from movie_recommender.db import calc, common, count, read, write
+from movie_recommender.db import calc, common, count, init, read, snapshot
+from movie_recommender.db import write
+
+_AVG_RATINGS = None
+"""Users' average ratings, as returned by :func:`load_avg_ratings`.
+
+If set, :func:`call_cs_tile` reads users' average ratings from here, instead
+of querying the database once per tile. Set by :func:`init_cs_worker`.
+"""
+
+_SNAPSHOT = None
+"""A :class:`movie_recommender.db.snapshot.Snapshot` of ratings and averages.
+
+If set, :func:`call_cs_tile` reads ratings from here, rather than querying the
+database. Set by :func:`init_cs_snapshot_worker`.
+"""
 
 
+@metrics.timed('phase', 'analyze_users')
 def analyze_users(overwrite, jobs, reporter=None):
     """Compute the average of each user's ratings.
 
-    :meth:`compute_similarity` makes heavy use of users' average ratings. For
-    it to work efficiently, these average ratings should be pre-computed. This
-    method does just that.
+    :func:`compute_tile_similarities` makes heavy use of users' average
+    ratings. For it to work efficiently, these average ratings should be
+    pre-computed. This method does just that.
+
+    The range of user IDs is split into shards, as by :func:`gen_caur_args`,
+    and the averages for each shard are computed with one ``GROUP BY`` query.
+    Shards are spread across ``jobs`` processes. All averages are then written
+    in one transaction.
 
     :param overwrite: Should already-computed values be re-computed?
     :param jobs: The number of processes to spawn. If ``None``, spawn one per
@@ -28,64 +55,28 @@ def analyze_users(overwrite, jobs, reporter=None):
         progress isn't reported.
     :return: Nothing.
     """
-    caur_args = gen_caur_args(overwrite, reporter)
-    jobs_per_batch = JOBS_PER_PROCESS_PER_BATCH * jobs
-    with multiprocessing.Pool(jobs) as pool:
-        while True:
-            batch = itertools.islice(caur_args, jobs_per_batch)
-            try:
-                batch_head = next(batch)  # pull val from caur_args
-            except StopIteration:
-                break
-            # chunksize chosen empirically with an R7 1700 CPU and a no-op
-            # func. For details, see JOBS_PER_PROCESS_PER_BATCH.
-            avg_ratings = tuple(pool.imap_unordered(
-                func=call_caur,
-                iterable=itertools.chain((batch_head,), batch),
-                chunksize=4,
-            ))
-            write.avg_ratings(avg_ratings)
-
-
-def call_caur(user_id):
-    """Call :meth:`movie_recommender.db.calc.avg_user_rating`."""
-    avg_rating = calc.avg_user_rating(user_id)
-    return common.AvgRating(user_id, avg_rating)
-
-
-def gen_caur_args(overwrite, reporter=None):
-    """Yield user IDs.
-
-    If ``overwrite`` is true, this function yields every user's ID. Otherwise,
-    it yields the ID of every user that isn't yet in the avgRatings database
-    table.
-
-    :param overwrite: Should already-computed values be overwritten?
-    :param reporter: A function that reports progress to the user. Must accept
-        one argument, where that argument is a multiprocessing ``Connection``
-        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
-        progress isn't reported.
-    :return: A generator that yields user IDs. These values may be passed to
-        :meth:`movie_recommender.db.calc.avg_user_rating`.
-    """
-    users = read.users()
-    if not overwrite:
-        users.difference_update(read.users_in_avg_ratings())
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    caur_args = tuple(gen_caur_args(overwrite, jobs))
 
     if reporter:
-        num_users = len(users)
-        users_yielded = 0
         conn_out, conn_in = multiprocessing.Pipe(duplex=False)
         proc = multiprocessing.Process(target=reporter, args=(conn_out,))
         proc.start()
 
-    for user in users:
-        yield user
-
-        if reporter:
-            users_yielded += 1
-            if users_yielded % JOBS_PER_PROCESS_PER_BATCH == 0:
-                conn_in.send(users_yielded / num_users)
+    avg_ratings = []
+    with multiprocessing.Pool(jobs) as pool, \
+            metrics.pool('analyze_users', jobs):
+        shards = metrics.collect(pool.imap_unordered(
+            metrics.measured(call_caur, 'analyze_users'),
+            caur_args,
+        ))
+        for i, shard in enumerate(shards):
+            avg_ratings.extend(shard)
+            if reporter:
+                conn_in.send((i + 1) / len(caur_args))
+    write.avg_ratings(avg_ratings)
+    metrics.count('users', 'analyze_users', len(avg_ratings))
 
     if reporter:
         conn_in.send(1)
@@ -93,7 +84,49 @@ def gen_caur_args(overwrite, reporter=None):
         proc.join()
 
 
-def analyze_movies(movies, users, overwrite, jobs, reporter=None):
+def call_caur(args):
+    """Call :meth:`movie_recommender.db.calc.avg_user_ratings`."""
+    return calc.avg_user_ratings(*args)
+
+
+def gen_caur_args(overwrite, jobs):
+    """Split the range of user IDs into shards.
+
+    The range from the lowest to the highest user ID in the ratings table is
+    split into ``4 * jobs`` equal shards. Having more shards than processes
+    evens out the load if user IDs aren't evenly distributed, and it lets
+    progress be reported.
+
+    :param overwrite: Should already-computed values be overwritten?
+    :param jobs: The number of processes the shards will be spread across.
+    :return: A generator that yields ``(low, high, overwrite)`` tuples. These
+        values may be passed to
+        :meth:`movie_recommender.db.calc.avg_user_ratings`.
+    """
+    with common.get_db_conn() as conn:
+        low, high = conn.execute(
+            'SELECT MIN(userId), MAX(userId) FROM ratings'
+        ).fetchone()
+    if low is None:
+        return
+    high += 1
+    num_shards = min(4 * jobs, high - low)
+    bounds = [low + (high - low) * i // num_shards for i in range(num_shards)]
+    bounds.append(high)
+    for shard_low, shard_high in zip(bounds, bounds[1:]):
+        yield (shard_low, shard_high, overwrite)
+
+
+@metrics.timed('phase', 'analyze_movies')
+def analyze_movies(  # pylint:disable=too-many-arguments
+        movies,
+        users,
+        overwrite,
+        jobs,
+        reporter=None,
+        top_k=None,
+        use_snapshot=False,
+        resume=False):
     """Analyze movies.
 
     The item-item movie prediction algorithm works by comparing a target movie
@@ -109,12 +142,32 @@ def analyze_movies(movies, users, overwrite, jobs, reporter=None):
     should be pre-computed. This function does just that. As pseudo-code, this
     function does the following::
 
-        compute_user_avg_ratings()
-        for target_movie in target_movies:
-            for movie in all_movies:
-                if target_movie == movie:
-                    continue
-                compute_similarity(target_movie, movie)
+        check_avg_ratings()
+        for tile in gen_cs_tiles(all_movies, target_movies):
+            # In a worker process:
+            scores = call_cs_tile(tile)
+            # In the main process:
+            if top_k is None:
+                write_similarities(scores)
+            else:
+                push_neighbours(scores)
+        if top_k is not None:
+            write_neighbours()
+
+    Pairs of movies are handed to worker processes in tiles, as generated by
+    :func:`gen_cs_tiles`, and each tile's scores are computed by
+    :func:`call_cs_tile`. Unless ``top_k`` is set, completed tiles are recorded
+    in a ledger, in the same transaction as their scores. The ledger is keyed
+    by :func:`run_key`, so an interrupted analysis can be resumed by calling
+    this function again with the same arguments and ``resume`` set: tiles
+    recorded in the ledger are skipped, with a set lookup per tile.
+
+    If ``top_k`` is set, similarity scores aren't written to the similarities
+    table. Instead, the ``top_k`` scores with the greatest magnitude are kept
+    for each target movie, in a bounded heap, and they're written to the
+    neighbours table once all scores have been computed. Each target movie's
+    list of neighbours is computed as a whole, so if ``overwrite`` is false,
+    only target movies without a list of neighbours are analyzed.
 
     :param movies: Movie IDs. Movies to be analyzed. These movies are merged
         into the ``target_movies`` set.
@@ -127,130 +180,430 @@ def analyze_movies(movies, users, overwrite, jobs, reporter=None):
         one argument, where that argument is a multiprocessing ``Connection``
         object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
         progress isn't reported.
+    :param top_k: If set, keep only this many neighbours per target movie. See
+        above.
+    :param use_snapshot: If true, load ratings and averages once, into a
+        :class:`movie_recommender.db.snapshot.Snapshot` shared by every
+        process, rather than having each process query the database for each
+        tile.
+    :param resume: If true, skip the tiles that an earlier analysis with the
+        same key completed. Otherwise, forget them, and analyze every tile.
     :return: Nothing.
+    :raise: ``ValueError`` if both ``top_k`` and ``resume`` are set. Neighbours
+        are only written once every tile has been analyzed, so there's nothing
+        to resume.
+    """
+    if top_k is not None and resume:
+        raise ValueError("An analysis with top_k set can't be resumed.")
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    check_avg_ratings()
+    heaps = {}  # target movie ID → heap of neighbours
+    if top_k is not None:
+        movies = movies_to_rank(movies, users, overwrite)
+        users = ()
+        overwrite = True
+        heaps.update((movie, []) for movie in movies)
+    key, tiles = plan_cs_tiles(
+        movies,
+        users,
+        overwrite,
+        reporter,
+        resume,
+        top_k is None,
+    )
+    with _make_cs_pool(jobs, use_snapshot) as pool, \
+            metrics.pool('analyze_movies', jobs):
+        for tile_ids, similarities in score_cs_tiles(pool, tiles, jobs):
+            if top_k is None:
+                write.similarities(similarities, key, tile_ids)
+            else:
+                push_neighbours(heaps, top_k, similarities)
+
+    if top_k is not None:
+        write.neighbours(
+            heaps,
+            (
+                common.Neighbour(movie, neighbour, score)
+                for movie, heap in heaps.items()
+                for _, _, neighbour, score in heap
+            ),
+        )
+
+
+def movies_to_rank(movies, users, overwrite):
+    """Get the target movies whose lists of neighbours should be computed.
+
+    The neighbours table is created first, if it doesn't exist.
+
+    :param movies: Movie IDs, as passed to :func:`analyze_movies`.
+    :param users: User IDs, as passed to :func:`analyze_movies`.
+    :param overwrite: Should already-computed lists of neighbours be
+        re-computed?
+    :return: A set of movie IDs.
     """
-    cs_args = gen_cs_args(movies, users, overwrite, reporter)
-    jobs_per_batch = JOBS_PER_PROCESS_PER_BATCH * jobs
-    with multiprocessing.Pool(jobs) as pool:
-        while True:
-            batch = itertools.islice(cs_args, jobs_per_batch)
-            try:
-                batch_head = next(batch)  # pull val from cs_args
-            except StopIteration:
-                break
-            similarities = tuple(pool.imap_unordered(
-                func=call_cs,
-                iterable=itertools.chain((batch_head,), batch),
-            ))
-            write.similarities(similarities)
-
-
-def call_cs(args):
-    """Call :meth:`movie_recommender.analyze.ii.compute_similarity`."""
-    score = compute_similarity(*args)
-    return common.Similarity(*args, score)
-
-
-def gen_cs_args(movies, users, overwrite, reporter=None):
-    """Generate pairs of movies for whom similarity should be computed.
-
-    As pseudo-code, this method does the following::
-
-        target_movies = {2, 4}
-        all_movies = {1, 2, 3, 4, 5}
-        for movie in all_movies:
-            for target_movie in target_movies:
-                if problematic(target_movie, movie):
-                    continue
-                yield (target_movie, movie)
-
-    This function will yield pairs like the following:
-
-    * 1, 2
-    * 1, 4
-    * 2, 2
-    * 2, 4
-    * 3, 2
-    * 3, 4
-    * 4, 2
-    * 4, 4
-    * 5, 2
-    * 5, 4
-
-    These pairs may be passed to
-    :meth:`movie_recommender.analyze.ii.compute_similarity`. What constitutes a
-    "problematic" pair of movie IDs?
-
-    * Within this application, it's illegal to compute the similarity between a
-      movie and itself. As a result, pairs like (2, 2) are problematic.
-    * Within this application, similarity is symmetric. It's pointless to
-      calculate the similarity between both (2, 4) and (4, 2). One of these
-      pairs is problematic.
-    * If similarity has already been calculated for a pair of movie IDs, and if
-      similarity scores shouldn't be overwritten, then that pair of movie IDs
-      is problematic.
+    with common.get_db_conn() as conn:
+        init.c_neighbours_table(conn)
+    movies = set(movies).union(read.rated_movies(users))
+    if not overwrite:
+        movies.difference_update(read.movies_with_neighbours())
+    return movies
+
+
+def plan_cs_tiles(  # pylint:disable=too-many-arguments
+        movies,
+        users,
+        overwrite,
+        reporter,
+        resume,
+        record):
+    """Get the tiles an analysis should compute, and prepare its ledger.
+
+    :param movies: Movie IDs, as passed to :func:`analyze_movies`.
+    :param users: User IDs, as passed to :func:`analyze_movies`.
+    :param overwrite: Should already-computed similarities be re-computed?
+    :param reporter: A progress reporter, as passed to :func:`gen_cs_tiles`.
+    :param resume: If true, skip the tiles recorded in the analysis' ledger.
+    :param record: Will completed tiles be recorded in the ledger? If so, and
+        if not resuming, the ledger is reset.
+    :return: A tuple ``(key, tiles)``, where ``key`` is the analysis' key, as
+        returned by :func:`run_key`, and ``tiles`` is a generator, as returned
+        by :func:`gen_cs_tiles`.
+    """
+    all_movies, target_movies = cs_tile_axes(movies, users)
+    key = run_key(all_movies, target_movies)
+    completed = read.completed_tiles(key) if resume else frozenset()
+    if not resume and record:
+        write.reset_ledger(key)
+    return key, gen_cs_tiles(
+        all_movies,
+        target_movies,
+        overwrite,
+        reporter,
+        completed,
+    )
+
+
+def score_cs_tiles(pool, tiles, jobs):
+    """Compute the similarity scores of tiles, in a pool of processes.
+
+    :param pool: A ``multiprocessing.Pool``, as yielded by
+        :func:`_make_cs_pool`.
+    :param tiles: Tiles, as yielded by :func:`gen_cs_tiles`.
+    :param jobs: The number of processes in ``pool``. Each batch holds this
+        many tiles.
+    :return: A generator which yields one ``(tile_ids, similarities)`` tuple
+        per batch of tiles, where ``tile_ids`` is a list of the batch's tile
+        IDs, and ``similarities`` is a tuple of
+        :class:`movie_recommender.db.common.Similarity` objects.
+    """
+    while True:
+        # One tile per process per batch. A tile holds thousands of pairs.
+        batch = tuple(itertools.islice(tiles, jobs))
+        if not batch:
+            break
+        tile_ids = [tile_id for tile_id, _ in batch]
+        batch = [tile for _, tile in batch]
+        similarities = tuple(itertools.chain.from_iterable(
+            _tile_similarities(tile, scores)
+            for tile, scores in zip(batch, metrics.collect(pool.map(
+                metrics.measured(call_cs_tile, 'analyze_movies'),
+                batch,
+            )))
+        ))
+        metrics.count('pairs', 'analyze_movies', len(similarities))
+        yield tile_ids, similarities
+
+
+def push_neighbours(heaps, top_k, similarities):
+    """Push similarity scores onto the heaps of the movies they describe.
+
+    :param heaps: A dict mapping movie IDs to heaps, as managed by
+        :func:`push_neighbour`. Scores of movies without a heap are ignored.
+    :param top_k: The maximum length of each heap.
+    :param similarities: An iterable of
+        :class:`movie_recommender.db.common.Similarity` objects.
+    :return: Nothing.
+    """
+    for similarity in similarities:
+        for movie, neighbour in (
+                (similarity.movie_a, similarity.movie_b),
+                (similarity.movie_b, similarity.movie_a)):
+            if movie in heaps:
+                push_neighbour(
+                    heaps[movie],
+                    top_k,
+                    neighbour,
+                    similarity.score,
+                )
+
+
+def check_avg_ratings():
+    """Verify that every user's average rating has been pre-computed.
+
+    The adjusted cosine similarity formula makes heavy use of users' average
+    ratings. For efficiency reasons, they must be precomputed. This check is
+    cheap relative to a whole analysis, but not relative to computing a single
+    similarity score, so it should be done once per analysis.
+
+    :return: Nothing.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    num_avg_ratings = count.avg_ratings()
+    num_user_ids = count.user_ids()
+    if num_avg_ratings < num_user_ids:
+        raise exceptions.MissingAverageRatingError(
+            f"""
+            The adjusted cosine similarity algorithm requires that the average
+            ratings given by each user be precomputed. However, there are
+            {num_avg_ratings} precomputed average ratings, and {num_user_ids}
+            users.
+            """
+        )
+
+
+def load_avg_ratings():
+    """Load every user's average rating into memory.
+
+    :return: An ``array.array`` of doubles, where the value at index ``i`` is
+        the average rating of the user with ID ``i``. Users without an average
+        rating, or without any ratings at all, have a value of NaN. User IDs
+        are dense in practice, so this is much more compact than a dict.
+    """
+    avg_ratings = dict(read.avg_ratings())
+    size = max(avg_ratings, default=-1) + 1
+    values = array.array('d', (math.nan,)) * size
+    for user_id, avg_rating in avg_ratings.items():
+        values[user_id] = avg_rating
+    return values
+
+
+def init_cs_worker(avg_ratings):
+    """Prepare a worker process to call :func:`call_cs_tile`.
+
+    :param avg_ratings: Users' average ratings, as returned by
+        :func:`load_avg_ratings`.
+    :return: Nothing.
+    """
+    global _AVG_RATINGS  # pylint:disable=global-statement
+    _AVG_RATINGS = avg_ratings
+
+
+def init_cs_snapshot_worker(descriptor):
+    """Prepare a worker process to call :func:`call_cs_tile` with a snapshot.
+
+    :param descriptor: A
+        :class:`movie_recommender.db.snapshot.SnapshotDescriptor` of a snapshot
+        holding ratings and average ratings.
+    :return: Nothing.
+    """
+    global _SNAPSHOT  # pylint:disable=global-statement
+    _SNAPSHOT = snapshot.Snapshot.attach(descriptor)
+
+
+@contextlib.contextmanager
+def _make_cs_pool(jobs, use_snapshot):
+    """Make a pool of processes that can call :func:`call_cs_tile`.
+
+    :param jobs: The number of processes to spawn. If ``None``, spawn one per
+        CPU.
+    :param use_snapshot: Whether the processes should compute similarity
+        scores from a snapshot. If so, the snapshot is created first, and
+        freed once the pool has been terminated.
+    :return: A context manager which yields a ``multiprocessing.Pool``.
+    """
+    if not use_snapshot:
+        with multiprocessing.Pool(
+                jobs,
+                initializer=init_cs_worker,
+                initargs=(load_avg_ratings(),)) as pool:
+            yield pool
+        return
+    arrays = snapshot.load_ratings()
+    arrays.update(snapshot.load_avg_ratings())
+    with snapshot.Snapshot.create(arrays) as snapshot_:
+        with multiprocessing.Pool(
+                jobs,
+                initializer=init_cs_snapshot_worker,
+                initargs=(snapshot_.descriptor,)) as pool:
+            yield pool
+
+
+def push_neighbour(heap, top_k, neighbour, score):
+    """Push a neighbour onto a bounded heap of a movie's neighbours.
+
+    The heap holds at most ``top_k`` neighbours. If it's full, the neighbour
+    whose similarity score has the smallest magnitude is dropped. Ties are
+    broken in favour of the neighbour with the smaller movie ID. Neighbours
+    with a score of zero are never pushed, as they don't affect predictions.
+
+    :param heap: A list, managed by the ``heapq`` module.
+    :param top_k: The maximum length of ``heap``.
+    :param neighbour: A movie ID.
+    :param score: The similarity between ``neighbour`` and the movie whose
+        neighbours are held by ``heap``.
+    :return: Nothing.
+    """
+    if score == 0:
+        return
+    item = (abs(score), -neighbour, neighbour, score)
+    if len(heap) < top_k:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def call_cs_tile(tile):
+    """Compute the similarity scores for a tile of pairs of movies.
+
+    Load the ratings of the tile's movies, and pass them to
+    :func:`compute_tile_similarities`. Ratings are read from the snapshot set
+    by :func:`init_cs_snapshot_worker` if there is one, or from the database
+    otherwise, with one query per tile.
+
+    :param tile: A tile, as yielded by :func:`gen_cs_tiles`.
+    :return: An array of similarity scores, one per true cell in the tile's
+        mask, in row-major order.
+    """
+    target_ids, movie_ids, mask = tile
+    if _SNAPSHOT is not None:
+        return compute_tile_similarities(_SNAPSHOT, *tile)[mask]
+    movies = numpy.union1d(target_ids[mask.any(0)], movie_ids[mask.any(1)])
+    arrays = snapshot.load_ratings(movies.tolist())
+    avg_ratings = load_avg_ratings() if _AVG_RATINGS is None else _AVG_RATINGS
+    arrays['avg_ratings'] = numpy.frombuffer(avg_ratings, dtype=numpy.float64)
+    return compute_tile_similarities(
+        snapshot.Snapshot(arrays, {}, False),
+        *tile,
+    )[mask]
+
+
+def _tile_similarities(tile, scores):
+    """Pair up a tile's similarity scores with the movies they describe.
+
+    :param tile: A tile, as yielded by :func:`gen_cs_tiles`.
+    :param scores: The array returned by :func:`call_cs_tile` for the tile.
+    :return: An iterator of :class:`movie_recommender.db.common.Similarity`
+        objects.
+    """
+    target_ids, movie_ids, mask = tile
+    rows, cols = numpy.nonzero(mask)
+    return map(
+        common.Similarity,
+        movie_ids[rows].tolist(),
+        target_ids[cols].tolist(),
+        scores.tolist(),
+    )
+
+
+def cs_tile_axes(movies, users):
+    """Get the movies along each axis of the tiles made by :func:`gen_cs_tiles`.
 
     :param movies: Movie IDs. Movies to be analyzed. These movies are merged
         into the ``target_movies`` set.
     :param users: User IDs. The movies these users have rated are merged into
         the ``target_movies`` set.
+    :return: A tuple of two sorted arrays of movie IDs, ``(all_movies,
+        target_movies)``.
+    """
+    all_movies = numpy.array(sorted(read.all_movies()), dtype=numpy.int64)
+    target_movies = numpy.array(
+        sorted(set(movies).union(read.rated_movies(users))),
+        dtype=numpy.int64,
+    )
+    return all_movies, target_movies
+
+
+def run_key(all_movies, target_movies):
+    """Make a key that identifies an analysis, for its ledger.
+
+    Two analyses have the same key if and only if they make the same tiles,
+    i.e. if they have the same arguments to :func:`gen_cs_tiles`, apart from
+    ``overwrite``, and the same tile size.
+
+    :param all_movies: An array of every movie ID, as returned by
+        :func:`cs_tile_axes`.
+    :param target_movies: An array of target movie IDs, as returned by
+        :func:`cs_tile_axes`.
+    :return: A string.
+    """
+    digest = hashlib.sha256(str(CS_TILE_SIZE).encode())
+    for movie_ids in (all_movies, target_movies):
+        digest.update(len(movie_ids).to_bytes(8, 'little'))
+        digest.update(movie_ids.astype('<i8').tobytes())
+    return digest.hexdigest()
+
+
+def gen_cs_tiles(  # pylint:disable=too-many-locals
+        all_movies,
+        target_movies,
+        overwrite,
+        reporter=None,
+        completed=frozenset()):
+    """Generate tiles of pairs of movies for whom similarity should be computed.
+
+    The pairs to compute are chosen by :func:`mask_pairs`, and grouped into
+    tiles. Each tile pairs a block of up to
+    :data:`movie_recommender.constants.CS_TILE_SIZE` target movies with a block
+    of up to as many movies, so that a worker process can compute a whole tile
+    at once, and return its scores as one array. Tiles without any pairs to
+    compute aren't generated.
+
+    Each tile has an ID, which depends only on its position. Tile ``(t, m)``,
+    holding the ``t``-th block of target movies and the ``m``-th block of
+    movies, has an ID of ``t * num_blocks + m``, where ``num_blocks`` is the
+    number of blocks of movies.
+
+    :param all_movies: An array of every movie ID, as returned by
+        :func:`cs_tile_axes`.
+    :param target_movies: An array of target movie IDs, as returned by
+        :func:`cs_tile_axes`.
     :param overwrite: Should already-computed similarities be re-computed?
     :param reporter: A function that reports progress to the user. Must accept
         one argument, where that argument is a multiprocessing ``Connection``
         object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
         progress isn't reported.
-    :return: A generator that yields tuples of movie IDs.
+    :param completed: A set of the IDs of tiles to skip.
+    :return: A generator that yields ``(tile_id, (target_ids, movie_ids,
+        mask))`` tuples. ``target_ids`` and ``movie_ids`` are sorted arrays of
+        movie IDs, and ``mask`` is a boolean array with one row per movie and
+        one column per target movie. The similarity between ``movie_ids[i]``
+        and ``target_ids[j]`` should be computed if ``mask[i, j]`` is true.
     """
-    # target_movies can be smaller than all_movies. This code attempts to
-    # improve efficiency by making the inner for loop iterate over the smaller
-    # set, by performing "x in y" loops on the smaller set, and by keeping a
-    # database connection open.
-    #
-    # Ideally, we would take advantage of the fact that all_movies() is a
-    # generator. This would improve streaminess. But this function is called by
-    # multiple processes, and SQLite objects can't be shared across threads or
-    # processes.
-    #
-    # In cases where most of the movies returned by this function have already
-    # been analyzed, this function is a bottleneck. However, in the presumably
-    # more common case where most movies *haven't* been analyzed,
-    # compute_similarity() is the bottleneck. Consequently, although there is
-    # value in multiprocessing in this function, one should be careful to avoid
-    # over-allocating resources here and causing pointless context switches.
-    #
-    # In addition, using processes has some overhead. Notably, when a master
-    # process calls a worker process, arguments are shipped via pickling.
-    all_movies = set(read.all_movies())
-    target_movies = set(movies).union(set(read.rated_movies(users)))
+    is_target = numpy.isin(all_movies, target_movies)
+    num_blocks = -(-len(all_movies) // CS_TILE_SIZE)
 
     if reporter:
         num_pairs = len(all_movies) * len(target_movies)
-        pairs_yielded = 0
+        pairs_tiled = 0
         conn_out, conn_in = multiprocessing.Pipe(duplex=False)
         proc = multiprocessing.Process(target=reporter, args=(conn_out,))
         proc.start()
 
-    for movie in all_movies:
-        for target_movie in target_movies:
-
-            # Skip (2, 2).
-            if movie == target_movie:
-                continue
-
-            # Skip (4, 2). Process (2, 4).
-            if movie in target_movies and movie > target_movie:
-                continue
-
-            # Overwrite an already-computed similarity score?
-            if not overwrite and similarity_computed(movie, target_movie):
-                continue
-
-            yield (movie, target_movie)
+    for start in range(0, len(target_movies), CS_TILE_SIZE):
+        target_ids = target_movies[start:start + CS_TILE_SIZE]
+        keep = None  # Masks are only made for blocks with incomplete tiles.
+        for block in range(num_blocks):
+            tile_id = start // CS_TILE_SIZE * num_blocks + block
+            row = block * CS_TILE_SIZE
+            movie_ids = all_movies[row:row + CS_TILE_SIZE]
+            if tile_id not in completed:
+                if keep is None:
+                    keep = mask_pairs(
+                        all_movies,
+                        is_target,
+                        target_ids,
+                        overwrite,
+                    )
+                mask = keep[row:row + CS_TILE_SIZE]
+                if mask.any():
+                    yield tile_id, (target_ids, movie_ids, mask)
 
             if reporter:
-                pairs_yielded += 1
-                if pairs_yielded % JOBS_PER_PROCESS_PER_BATCH == 0:
-                    conn_in.send(pairs_yielded / num_pairs)
+                pairs_tiled += len(movie_ids) * len(target_ids)
+                if tile_id not in completed:
+                    conn_in.send(pairs_tiled / num_pairs)
 
     if reporter:
         conn_in.send(1)
@@ -258,10 +611,40 @@ def gen_cs_args(movies, users, overwrite, reporter=None):
         proc.join()
 
 
+def mask_pairs(movie_ids, is_target, target_ids, overwrite):
+    """Tell which pairs of movies should have their similarity computed.
+
+    Skip pairs of a movie and itself, such as (2, 2), as it's illegal to
+    compute the similarity between a movie and itself. Similarity is
+    symmetric, so if both movies are target movies, skip (4, 2) and keep
+    (2, 4). If not overwriting, skip already-computed pairs.
+
+    :param movie_ids: A sorted array of every movie ID.
+    :param is_target: A boolean array, telling whether each movie in
+        ``movie_ids`` is a target movie.
+    :param target_ids: An array of target movie IDs.
+    :param overwrite: Should already-computed similarities be re-computed?
+    :return: A boolean array with shape ``(len(movie_ids), len(target_ids))``,
+        where cell ``(i, j)`` tells whether the similarity between movie
+        ``movie_ids[i]`` and movie ``target_ids[j]`` should be computed.
+    """
+    keep = movie_ids[:, None] != target_ids[None, :]
+    keep &= ~(is_target[:, None] & (movie_ids[:, None] > target_ids[None, :]))
+    if not overwrite:
+        for j, target_id in enumerate(target_ids.tolist()):
+            compared = read.compared_movies(target_id)
+            if compared:
+                keep[:, j] &= ~numpy.isin(movie_ids, list(compared))
+    return keep
+
+
 def compute_similarity(movie_a, movie_b):
     """Compute the similarity between two movies.
 
-    Use the "adjusted cosine similarity" formula to compute similarity.
+    Use the "adjusted cosine similarity" formula to compute similarity. This is
+    a convenience for comparing one pair of movies. It reads every user's
+    average rating, so :func:`analyze_movies` should be used to compare many
+    pairs.
 
     :param movie_a: A movie ID. A movie to compare.
     :param movie_b: A movie ID. A movie to compare.
@@ -280,31 +663,8 @@ def compute_similarity(movie_a, movie_b):
             Movie IDs: {movie_a}, {movie_b}
             """
         )
-
-    # Are there enough rating pairs to confidently compute a similarity score?
-    if count.rating_pairs(movie_a, movie_b) < MIN_PAIRS_FOR_SIMILARITY:
-        return 0
-
-    # This formula makes heavy use of users' average ratings. For efficiency
-    # reasons, they must be precomputed. Are they?
-    num_avg_ratings = count.avg_ratings()
-    num_user_ids = count.user_ids()
-    if num_avg_ratings < num_user_ids:
-        raise exceptions.MissingAverageRatingError(
-            f"""
-            The adjusted cosine similarity algorithm requires that the average
-            ratings given by each user be precomputed. However, there are
-            {num_avg_ratings} precomputed average ratings, and {num_user_ids}
-            users.
-            """
-        )
-
-    # All pre-flight checks have passed. The exception handling is stupid. See
-    # the comments in the called function.
-    try:
-        return compute_similarity_unsafe(movie_a, movie_b)
-    except ZeroDivisionError:
-        return 0
+    check_avg_ratings()
+    return compute_similarity_unsafe(movie_a, movie_b)
 
 
 def compute_similarity_unsafe(movie_a, movie_b):
@@ -312,43 +672,164 @@ def compute_similarity_unsafe(movie_a, movie_b):
 
     Use the "adjusted cosine similarity" formula to compute similarity.
     Consider using :meth:`movie_recommender.analyze.ii.compute_similarity`
-    instead.
-
-    Certain pathological data sets will cause this function to throw an
-    exception. As an example, consider the following scenario, where only one
-    user has rated both ``movie_a`` and ``movie_b``:
+    instead, which checks its arguments and users' average ratings first.
 
-    =======  ==============  ==============
-    User ID  Movie A rating  Movie B rating
-    =======  ==============  ==============
-    554      5.0             4.0
-    =======  ==============  ==============
-
-    If the average of user 554's ratings is 4.0, then division by zero will
-    occur. In this case, one can't reasonably assume that the similarity is 0,
-    or 1, or anything else. Instead, the ideal solution is to re-compute the
-    similarity between these two movies with a different formula, such as
-    cosine-based similarity or correlation-based similarity.
-
-    Also see: https://stackoverflow.com/a/40651746
+    The pair of movies is scored as a tile of one pair, by
+    :func:`call_cs_tile`. Pathological pairs of movies, such as those whose
+    formula has a denominator of zero, score 0.
 
     :param movie_a: A movie ID. A movie to compare.
     :param movie_b: A movie ID. A movie to compare.
     :return: A value between -1 and 1, inclusive.
-    :raise: ``ZeroDivisionError`` for certain pathological datasets.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
     """
-    numerator = 0
-    denominator_left = 0
-    denominator_right = 0
-    for rating_pair in read.rating_pairs(movie_a, movie_b):
-        avg_rating = read.avg_rating(rating_pair.user_id)
-        numerator += (
-            (rating_pair.rating_a - avg_rating) * (rating_pair.rating_b - avg_rating)
+    return float(call_cs_tile((
+        numpy.array([movie_b], dtype=numpy.int64),
+        numpy.array([movie_a], dtype=numpy.int64),
+        numpy.ones((1, 1), dtype=bool),
+    ))[0])
+
+
+def compute_tile_similarities(ratings, target_ids, movie_ids, mask):
+    """Compute the similarity scores for a tile of pairs of movies.
+
+    Use the "adjusted cosine similarity" formula to compute similarity. Ratings
+    and average ratings are read from a snapshot, rather than from the
+    database. The ratings of the tile's movies are mean-centred and
+    concatenated once. Then, for each target movie, its ratings are scattered
+    into a dense array indexed by user, and the sums behind the formula are
+    computed for every movie at once. If fewer than
+    :data:`movie_recommender.constants.MIN_PAIRS_FOR_SIMILARITY` users have
+    rated both movies, or if the formula's denominator is zero, the score is
+    0.
+
+    :param ratings: A :class:`movie_recommender.db.snapshot.Snapshot` with
+        ``ratings_*`` and ``avg_ratings`` arrays, holding at least the ratings
+        of the tile's movies.
+    :param target_ids: An array of target movie IDs.
+    :param movie_ids: An array of movie IDs.
+    :param mask: A boolean array with shape ``(len(movie_ids),
+        len(target_ids))``. Scores are only computed for true cells.
+    :return: An array with the same shape as ``mask``, where cell ``(i, j)`` is
+        the similarity between ``movie_ids[i]`` and ``target_ids[j]``, or 0 if
+        it wasn't computed.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    avg_ratings = ratings['avg_ratings']
+    scores = numpy.zeros(mask.shape)
+    centred_b = _concat_centred_ratings(
+        ratings,
+        movie_ids,
+        numpy.flatnonzero(mask.any(1)),
+    )
+    centred_a = numpy.zeros(len(avg_ratings))
+    rated_a = numpy.zeros(len(avg_ratings))
+    for j in numpy.flatnonzero(mask.any(0)):
+        users_a, values_a = ratings.movie_ratings(target_ids[j])
+        centred_a[users_a] = _centre(users_a, values_a, avg_ratings)
+        rated_a[users_a] = 1
+        sums = _similarity_sums(centred_a, rated_a, centred_b, len(movie_ids))
+        centred_a[users_a] = 0
+        rated_a[users_a] = 0
+        scores[:, j] = _similarity_scores(mask[:, j], *sums)
+    return scores
+
+
+def _concat_centred_ratings(ratings, movie_ids, rows):
+    """Mean-centre and concatenate the ratings of some of a tile's movies.
+
+    :param ratings: A :class:`movie_recommender.db.snapshot.Snapshot`, as
+        passed to :func:`compute_tile_similarities`.
+    :param movie_ids: An array of movie IDs.
+    :param rows: An array of indices into ``movie_ids``. The ratings of these
+        movies are concatenated.
+    :return: A tuple of three arrays of equal length, ``(users, centred,
+        rows)``. Element ``k`` of each is a rating's user ID, mean-centred
+        value, and the index of its movie in ``movie_ids``.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    columns = [ratings.movie_ratings(movie) for movie in movie_ids[rows]]
+    users = numpy.concatenate(
+        [users for users, _ in columns] + [numpy.array([], numpy.int32)]
+    )
+    centred = _centre(users, numpy.concatenate(
+        [values for _, values in columns] + [numpy.array([], numpy.float32)]
+    ), ratings['avg_ratings'])
+    return users, centred, numpy.repeat(rows, [len(ids) for ids, _ in columns])
+
+
+def _similarity_sums(centred_a, rated_a, centred_b, num_movies):
+    """Compute the sums behind the similarity between a movie and many others.
+
+    :param centred_a: An array of the target movie's mean-centred ratings,
+        indexed by user ID. Users who haven't rated it have a value of 0.
+    :param rated_a: An array, indexed by user ID, holding 1 if the user has
+        rated the target movie, and 0 otherwise.
+    :param centred_b: The other movies' ratings, as returned by
+        :func:`_concat_centred_ratings`.
+    :param num_movies: The number of other movies, i.e. the length of each
+        returned array.
+    :return: A list of four arrays, each indexed like ``movie_ids``: the
+        number of users who have rated both movies, the numerator, and the
+        left and right terms of the denominator.
+    """
+    users_b, values_b, rows_b = centred_b
+    # Users who haven't rated the target movie contribute zeros.
+    both = rated_a[users_b]
+    return [
+        numpy.bincount(rows_b, weights, num_movies)
+        for weights in (
+            both,
+            centred_a[users_b] * values_b,
+            centred_a[users_b] ** 2,
+            values_b ** 2 * both,
+        )
+    ]
+
+
+def _similarity_scores(mask, pairs, numerator, left, right):
+    """Compute similarity scores from the sums behind them.
+
+    :param mask: A boolean array. Scores are only computed for true cells.
+    :param pairs: An array of the number of users who have rated both movies.
+    :param numerator: An array of the formula's numerators.
+    :param left: An array of the left terms of the formula's denominators.
+    :param right: An array of the right terms of the formula's denominators.
+    :return: An array of similarity scores. Cells that are false in ``mask``,
+        that have fewer than
+        :data:`movie_recommender.constants.MIN_PAIRS_FOR_SIMILARITY` pairs, or
+        whose denominator is zero, are 0.
+    """
+    scores = numpy.zeros(len(mask))
+    denominator = numpy.sqrt(left) * numpy.sqrt(right)
+    valid = mask & (pairs >= MIN_PAIRS_FOR_SIMILARITY)
+    valid &= denominator != 0
+    scores[valid] = numerator[valid] / denominator[valid]
+    return scores
+
+
+def _centre(users, values, avg_ratings):
+    """Subtract each user's average rating from their ratings.
+
+    :param users: An array of user IDs.
+    :param values: An array of ratings, one per user.
+    :param avg_ratings: An array of average ratings, indexed by user ID, as
+        made by :func:`movie_recommender.db.snapshot.load_avg_ratings`.
+    :return: An array of mean-centred ratings, as doubles.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    known = users < len(avg_ratings)
+    known[known] = ~numpy.isnan(avg_ratings[users[known]])
+    if not known.all():
+        raise exceptions.MissingAverageRatingError(
+            f'No average rating for user {users[~known][0]} has been '
+            'calculated.'
         )
-        denominator_left += (rating_pair.rating_a - avg_rating)**2
-        denominator_right += (rating_pair.rating_b - avg_rating)**2
-    denominator = math.sqrt(denominator_left) * math.sqrt(denominator_right)
-    return numerator / denominator
+    return values - avg_ratings[users]
 
 
 def similarity_computed(movie_a, movie_b):
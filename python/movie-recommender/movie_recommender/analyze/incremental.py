@@ -0,0 +1,357 @@
+# coding=utf-8
+"""Tools for keeping the item-item analysis up to date as ratings arrive.
+
+:func:`movie_recommender.analyze.ii.compute_tile_similarities` computes the
+similarity between two movies from three sums over the users who have rated
+both movies: a numerator, and the two terms of the denominator. This module
+stores those sums, along with the number of users who have rated both movies,
+in the "similaritySums" table. When new ratings arrive, each affected user's
+contribution to each sum is subtracted and re-added, and the similarity score
+is re-computed from the updated sums. This only touches pairs of movies rated
+by the users who submitted new ratings.
+
+Be aware that adjusted cosine similarity centres ratings on each user's average
+rating. A new rating changes the user's average rating, and thereby changes the
+user's contribution to every pair of movies they've rated. Ingesting one rating
+from a user who has rated *n* movies touches about *n²/2* pairs of movies.
+
+Only pairs of movies that have already been analyzed (i.e. that have a row in
+the "similarities" table) are maintained. The first time such a pair is
+touched, its sums are computed from scratch and stored.
+
+Lists of neighbours, as made by ``mr-analyze ii --top-k``, can't be maintained
+this way, as a list doesn't keep the scores of the movies that didn't make the
+cut. Instead, the lists of the movies rated by the users who submitted new
+ratings are re-computed from scratch.
+"""
+import math
+from collections import namedtuple
+
+from movie_recommender import exceptions
+from movie_recommender.analyze import ii
+from movie_recommender.constants import MIN_PAIRS_FOR_SIMILARITY
+from movie_recommender.db import cache, calc, common, init, read, store
+
+
+Ingested = namedtuple(
+    'Ingested',
+    ('ratings', 'users', 'similarities', 'neighbour_lists'),
+)
+"""The number of ratings and users ingested, of similarities updated, and of
+lists of neighbours re-computed."""
+
+
+def ingest(ratings, jobs=None):
+    """Add ratings to the database, and update the affected similarities.
+
+    Ratings are inserted into the "ratings" table. If a user has already rated
+    a movie, the old rating is replaced. The "avgRatings" table is updated for
+    each user that submitted a rating, and the "similaritySums" and
+    "similarities" tables are updated for each pair of analyzed movies those
+    users have rated. The versions of these tables are incremented, so that
+    cached recommendations are refreshed, as described in
+    :mod:`movie_recommender.db.cache`. All of this is done in a single
+    transaction.
+
+    Then, the lists of neighbours of the movies those users have rated are
+    re-computed with :func:`movie_recommender.analyze.ii.analyze_movies`, in a
+    later transaction. Lists only fall short of the ``top_k`` they were made
+    with when a movie has too few neighbours, so each list is re-computed with
+    the length of the longest list as its ``top_k``.
+
+    :param ratings: An iterable of ``(user_id, movie_id, rating, timestamp)``
+        tuples. If the same user rates the same movie several times, the last
+        rating wins.
+    :param jobs: The number of processes to spawn when re-computing lists of
+        neighbours. If ``None``, spawn one per CPU.
+    :return: An :class:`Ingested` object.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the sums
+        for a pair of movies must be computed from scratch, and the average
+        rating of a user who has rated both movies hasn't been pre-computed.
+    """
+    new_ratings = {}  # user ID → {movie ID: (rating, timestamp)}
+    for user_id, movie_id, rating, timestamp in ratings:
+        new_ratings.setdefault(user_id, {})[movie_id] = (rating, timestamp)
+
+    conn = common.get_persistent_db_conn()
+    init.c_similarity_sums_table(conn)
+    init.c_table_versions_table(conn)
+    init.c_neighbours_table(conn)
+    with conn:
+        rated_movies, deltas = write_ratings(conn, new_ratings)
+        num_sums = write_sums(conn, deltas)
+    num_lists = recompute_neighbour_lists(rated_movies, jobs)
+    return Ingested(
+        sum(len(movie_ratings) for movie_ratings in new_ratings.values()),
+        len(new_ratings),
+        num_sums,
+        num_lists,
+    )
+
+
+def write_ratings(conn, new_ratings):
+    """Write users' ratings and average ratings, and sum their effects.
+
+    :param conn: A sqlite3 ``Connection`` object, in a transaction.
+    :param new_ratings: A dict mapping user IDs to dicts, which map movie IDs
+        to ``(rating, timestamp)`` tuples.
+    :return: A tuple ``(rated_movies, deltas)``. ``rated_movies`` is a set of
+        the IDs of every movie rated by the given users, and ``deltas`` is a
+        dict, as returned by :func:`sums_deltas`, holding the users' combined
+        effect on the sums of each pair of movies.
+    """
+    cache.bump_versions(conn, ('avgRatings', 'ratings'))
+    rated_movies = set()
+    deltas = {}
+    for user_id, movie_ratings in new_ratings.items():
+        old_ratings = read.user_ratings(user_id)
+        try:
+            old_avg = read.avg_rating(user_id)
+        except exceptions.MissingAverageRatingError:
+            old_avg = None
+        conn.executemany(
+            """
+            INSERT INTO ratings VALUES (?, ?, ?, ?)
+            ON CONFLICT (userId, movieId) DO UPDATE SET
+                rating=excluded.rating,
+                timestamp=excluded.timestamp
+            """,
+            (
+                (user_id, movie_id, rating, timestamp)
+                for movie_id, (rating, timestamp) in movie_ratings.items()
+            ),
+        )
+        # Average the same way as mr-analyze, so that the sums and the
+        # avgRatings table stay consistent with each other.
+        new_avg = calc.avg_user_rating(user_id)
+        conn.execute(
+            """
+            INSERT INTO avgRatings VALUES (?, ?)
+            ON CONFLICT (userId) DO UPDATE SET avgRating=excluded.avgRating
+            """,
+            (user_id, new_avg),
+        )
+        rated_movies.update(old_ratings, movie_ratings)
+        all_ratings = dict(old_ratings)
+        all_ratings.update(
+            (movie_id, rating)
+            for movie_id, (rating, _) in movie_ratings.items()
+        )
+        for pair, delta in sums_deltas(
+                old_ratings,
+                old_avg,
+                all_ratings,
+                new_avg).items():
+            deltas[pair] = add_sums(deltas.get(pair, (0, 0, 0, 0)), delta)
+    return rated_movies, deltas
+
+
+def write_sums(conn, deltas):
+    """Update the sums and similarity scores of analyzed pairs of movies.
+
+    Reads are made with the same connection as writes, so they see ratings
+    and average ratings written earlier in the same transaction.
+
+    :param conn: A sqlite3 ``Connection`` object, in a transaction.
+    :param deltas: A dict, as returned by :func:`write_ratings`.
+    :return: The number of pairs of movies updated.
+    """
+    avg_ratings = None
+    sums = {}
+    compared_movies = {}
+    for (movie_a, movie_b), delta in deltas.items():
+        if movie_a not in compared_movies:
+            compared_movies[movie_a] = read.compared_movies(movie_a)
+        if movie_b not in compared_movies[movie_a]:
+            continue
+        old_sums = read.similarity_sums(movie_a, movie_b)
+        if old_sums is None:
+            if avg_ratings is None:
+                avg_ratings = ii.load_avg_ratings()
+            sums[(movie_a, movie_b)] = compute_sums(
+                movie_a,
+                movie_b,
+                avg_ratings,
+            )
+        else:
+            sums[(movie_a, movie_b)] = add_sums(old_sums, delta)
+    if sums:
+        store.invalidate()
+        cache.bump_versions(conn, ('similarities',))
+    conn.executemany(
+        """
+        INSERT INTO similaritySums VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (movieAId, movieBId) DO UPDATE SET
+            numerator=excluded.numerator,
+            denominatorLeft=excluded.denominatorLeft,
+            denominatorRight=excluded.denominatorRight,
+            pairs=excluded.pairs
+        """,
+        (pair + tuple(sums_) for pair, sums_ in sums.items()),
+    )
+    conn.executemany(
+        """
+        INSERT INTO similarities VALUES (?, ?, ?)
+        ON CONFLICT (movieAId, movieBId) DO UPDATE SET
+            similarity=excluded.similarity
+        """,
+        (
+            pair + (similarity_from_sums(sums_),)
+            for pair, sums_ in sums.items()
+        ),
+    )
+    return len(sums)
+
+
+def recompute_neighbour_lists(movies, jobs):
+    """Re-compute the lists of neighbours of the given movies.
+
+    A user's new ratings change their average rating, and thereby the score
+    of every pair of movies they've rated. Only movies that already have a
+    list of neighbours are re-computed. See :func:`ingest`.
+
+    :param movies: Movie IDs.
+    :param jobs: The number of processes to spawn. If ``None``, spawn one per
+        CPU.
+    :return: The number of lists re-computed.
+    """
+    neighbour_counts = read.neighbour_counts()
+    stale_lists = set(movies).intersection(neighbour_counts)
+    if stale_lists:
+        ii.analyze_movies(
+            stale_lists,
+            (),
+            True,
+            jobs,
+            top_k=max(neighbour_counts.values()),
+        )
+    return len(stale_lists)
+
+
+def add_sums(sums_a, sums_b):
+    """Add two tuples of sums element-wise.
+
+    :param sums_a: A :class:`movie_recommender.db.common.SimilaritySums`, or a
+        tuple with the same shape.
+    :param sums_b: Same as ``sums_a``.
+    :return: A :class:`movie_recommender.db.common.SimilaritySums`.
+    """
+    return common.SimilaritySums(*(a + b for a, b in zip(sums_a, sums_b)))
+
+
+def compute_sums(movie_a, movie_b, avg_ratings):
+    """Compute the sums for a pair of movies from scratch.
+
+    :param movie_a: A movie ID.
+    :param movie_b: A movie ID, greater than ``movie_a``.
+    :param avg_ratings: Users' average ratings, as returned by
+        :func:`movie_recommender.analyze.ii.load_avg_ratings`.
+    :return: A :class:`movie_recommender.db.common.SimilaritySums`.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    sums = common.SimilaritySums(0, 0, 0, 0)
+    for rating_pair in read.rating_pairs(movie_a, movie_b):
+        try:
+            avg_rating = avg_ratings[rating_pair.user_id]
+        except IndexError:
+            avg_rating = math.nan
+        if math.isnan(avg_rating):
+            raise exceptions.MissingAverageRatingError(
+                'No average rating for user '
+                f'{rating_pair.user_id} has been calculated.'
+            )
+        sums = add_sums(
+            sums,
+            pair_terms(rating_pair.rating_a, rating_pair.rating_b, avg_rating),
+        )
+    return sums
+
+
+def pair_terms(rating_a, rating_b, avg_rating):
+    """Calculate one user's contribution to the sums for a pair of movies.
+
+    :param rating_a: The rating the user gave to the first movie.
+    :param rating_b: The rating the user gave to the second movie.
+    :param avg_rating: The average of the user's ratings.
+    :return: A :class:`movie_recommender.db.common.SimilaritySums`.
+    """
+    centred_a = rating_a - avg_rating
+    centred_b = rating_b - avg_rating
+    return common.SimilaritySums(
+        centred_a * centred_b,
+        centred_a ** 2,
+        centred_b ** 2,
+        1,
+    )
+
+
+def similarity_from_sums(sums):
+    """Calculate a similarity score from a pair of movies' sums.
+
+    The result matches that of
+    :func:`movie_recommender.analyze.ii.compute_tile_similarities`.
+
+    :param sums: A :class:`movie_recommender.db.common.SimilaritySums`.
+    :return: A value between -1 and 1, inclusive.
+    """
+    if sums.pairs < MIN_PAIRS_FOR_SIMILARITY:
+        return 0
+    # Rounding errors can leave a running sum of squares slightly below zero.
+    denominator_left = math.sqrt(max(sums.denominator_left, 0))
+    denominator_right = math.sqrt(max(sums.denominator_right, 0))
+    denominator = denominator_left * denominator_right
+    if denominator == 0:
+        return 0
+    return max(-1, min(1, sums.numerator / denominator))
+
+
+def sums_deltas(old_ratings, old_avg, new_ratings, new_avg):
+    """Calculate how a user's new ratings change the sums of pairs of movies.
+
+    :param old_ratings: A dict in the form ``{movie_id: rating}``. The user's
+        ratings before the change.
+    :param old_avg: The average of ``old_ratings``, as stored in the database.
+        ``None`` if the user has no average rating, in which case the user
+        contributes nothing to the old sums.
+    :param new_ratings: A dict in the form ``{movie_id: rating}``. The user's
+        ratings after the change.
+    :param new_avg: The average of ``new_ratings``.
+    :return: A dict in the form ``{(movie_a, movie_b): sums}``, where ``movie_a
+        < movie_b``, and ``sums`` is a
+        :class:`movie_recommender.db.common.SimilaritySums` to be added to the
+        pair's sums.
+    """
+    if old_avg is None:
+        old_ratings = {}
+    if old_avg == new_avg:
+        changed = {
+            movie for movie, rating in new_ratings.items()
+            if old_ratings.get(movie) != rating
+        }
+        changed.update(set(old_ratings) - set(new_ratings))
+    else:
+        changed = set(old_ratings) | set(new_ratings)
+    movies = sorted(set(old_ratings) | set(new_ratings))
+
+    deltas = {}
+    for i, movie_a in enumerate(movies):
+        for movie_b in movies[i + 1:]:
+            if movie_a not in changed and movie_b not in changed:
+                continue
+            delta = (0, 0, 0, 0)
+            if movie_a in new_ratings and movie_b in new_ratings:
+                delta = pair_terms(
+                    new_ratings[movie_a],
+                    new_ratings[movie_b],
+                    new_avg,
+                )
+            if movie_a in old_ratings and movie_b in old_ratings:
+                old_terms = pair_terms(
+                    old_ratings[movie_a],
+                    old_ratings[movie_b],
+                    old_avg,
+                )
+                delta = add_sums(delta, tuple(-term for term in old_terms))
+            deltas[(movie_a, movie_b)] = common.SimilaritySums(*delta)
+    return deltas
@@ -0,0 +1,264 @@
+# coding=utf-8
+"""Tools for analyzing the database with sparse matrix arithmetic.
+
+:mod:`movie_recommender.analyze.ii` computes each similarity score with several
+SQL queries. This module computes the same scores, but does so by loading the
+ratings table into memory once, and by computing scores for whole blocks of
+movies as sparse matrix products.
+"""
+import multiprocessing
+
+import numpy
+from scipy import sparse
+
+from movie_recommender import exceptions, metrics
+from movie_recommender.analyze import ii
+from movie_recommender.constants import (
+    MATRIX_BLOCK_SIZE,
+    MIN_PAIRS_FOR_SIMILARITY,
+)
+from movie_recommender.db import common, count, read, write
+
+
+class RatingMatrix():
+    """A mean-centred user × movie rating matrix.
+
+    Rows are users, and columns are movies. Users and movies are referenced by
+    dense indices, rather than by their IDs. Cell ``(u, m)`` holds the rating
+    user ``u`` gave to movie ``m``, minus the average of user ``u``'s ratings.
+    """
+
+    def __init__(self, movie_ids, user_indices, movie_indices, centred):
+        """Initialize instance attributes.
+
+        :param movie_ids: A sorted array of movie IDs. Element ``i`` is the ID
+            of the movie in column ``i``.
+        :param user_indices: An array of user indices, one per rating.
+        :param movie_indices: An array of movie indices, one per rating.
+        :param centred: An array of mean-centred ratings, one per rating.
+        """
+        self.movie_ids = movie_ids
+        num_users = user_indices.max() + 1 if len(user_indices) else 0
+        shape = (num_users, len(movie_ids))
+        coords = (user_indices, movie_indices)
+        self._centred = sparse.csc_matrix((centred, coords), shape=shape)
+        self._squared = sparse.csc_matrix((centred ** 2, coords), shape=shape)
+        self._rated = sparse.csc_matrix(
+            (numpy.ones(len(centred)), coords),
+            shape=shape,
+        )
+        self._centred_t = self._centred.T.tocsr()
+        self._squared_t = self._squared.T.tocsr()
+        self._rated_t = self._rated.T.tocsr()
+
+    @classmethod
+    def from_db(cls):
+        """Load the ratings and avgRatings tables into a new matrix.
+
+        :return: A new :class:`RatingMatrix`.
+        :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+            average of a user's ratings hasn't been pre-computed.
+        """
+        movie_ids = numpy.array(sorted(read.all_movies()), dtype=numpy.int64)
+        ratings = numpy.fromiter(
+            read.ratings(),
+            dtype=[('user', numpy.int64), ('movie', numpy.int64),
+                   ('rating', numpy.float64)],
+            count=count.ratings(),
+        )
+        user_ids, user_indices = numpy.unique(
+            ratings['user'],
+            return_inverse=True,
+        )
+
+        avg_ratings = dict(read.avg_ratings())
+        try:
+            user_avgs = numpy.array(
+                [avg_ratings[user_id] for user_id in user_ids.tolist()],
+                dtype=numpy.float64,
+            )
+        except KeyError as err:
+            raise exceptions.MissingAverageRatingError(
+                f'No average rating for user {err.args[0]} has been '
+                'calculated.'
+            ) from err
+
+        # Ratings for movies absent from the movies table can't be compared.
+        movie_indices = numpy.searchsorted(movie_ids, ratings['movie'])
+        known = movie_indices < len(movie_ids)
+        known[known] = (
+            movie_ids[movie_indices[known]] == ratings['movie'][known]
+        )
+        return cls(
+            movie_ids,
+            user_indices[known],
+            movie_indices[known],
+            ratings['rating'][known] - user_avgs[user_indices[known]],
+        )
+
+    def similarities(self, targets):
+        """Compute the similarity between some movies and every movie.
+
+        Use the "adjusted cosine similarity" formula to compute similarity.
+        The result is the same as calling
+        :func:`movie_recommender.analyze.ii.compute_tile_similarities` on each
+        pair of movies, including the handling of pairs with too few ratings or
+        with a zero denominator.
+
+        :param targets: An array of movie indices.
+        :return: An array with shape ``(len(self.movie_ids), len(targets))``,
+            where cell ``(i, j)`` is the similarity between movie ``i`` and
+            movie ``targets[j]``.
+        """
+        centred = self._centred[:, targets]
+        squared = self._squared[:, targets]
+        rated = self._rated[:, targets]
+        numerator = (self._centred_t @ centred).toarray()
+        denominator_left = numpy.sqrt((self._squared_t @ rated).toarray())
+        denominator_right = numpy.sqrt((self._rated_t @ squared).toarray())
+        denominator = denominator_left * denominator_right
+        pairs = (self._rated_t @ rated).toarray()
+        valid = (pairs >= MIN_PAIRS_FOR_SIMILARITY) & (denominator != 0)
+        scores = numpy.zeros(numerator.shape)
+        numpy.divide(numerator, denominator, out=scores, where=valid)
+        return scores
+
+
+@metrics.timed('phase', 'analyze_movies')
+def analyze_movies(movies, users, overwrite, reporter=None, top_k=None):
+    """Analyze movies.
+
+    This function has the same effect as
+    :func:`movie_recommender.analyze.ii.analyze_movies`. However, it loads all
+    ratings into memory, and it computes similarity scores
+    :data:`movie_recommender.constants.MATRIX_BLOCK_SIZE` target movies at a
+    time, with sparse matrix products. Users' average ratings must already be
+    computed.
+
+    If ``top_k`` is set, each block's neighbours are chosen with
+    :func:`select_neighbours` and written to the neighbours table, and the
+    similarities table is left alone.
+
+    :param movies: Movie IDs. Movies to be analyzed. These movies are merged
+        into the ``target_movies`` set.
+    :param users: User IDs. The movies these users have rated are merged into
+        the ``target_movies`` set.
+    :param overwrite: Should already-computed values be re-computed?
+    :param reporter: A function that reports progress to the user. Must accept
+        one argument, where that argument is a multiprocessing ``Connection``
+        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
+        progress isn't reported.
+    :param top_k: If set, keep only this many neighbours per target movie.
+    :return: Nothing.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    matrix = RatingMatrix.from_db()
+    movie_ids = matrix.movie_ids
+    targets = target_indices(
+        movie_ids,
+        set(movies).union(read.rated_movies(users)) if top_k is None
+        else ii.movies_to_rank(movies, users, overwrite),
+    )
+    is_target = numpy.zeros(len(movie_ids), dtype=bool)
+    is_target[targets] = True
+
+    if reporter:
+        conn_out, conn_in = multiprocessing.Pipe(duplex=False)
+        proc = multiprocessing.Process(target=reporter, args=(conn_out,))
+        proc.start()
+
+    for start in range(0, len(targets), MATRIX_BLOCK_SIZE):
+        block = targets[start:start + MATRIX_BLOCK_SIZE]
+        scores = matrix.similarities(block)
+        metrics.count('pairs', 'analyze_movies', scores.size)
+        if top_k is not None:
+            _write_neighbours(movie_ids, block, scores, top_k)
+        else:
+            _write_block(
+                movie_ids,
+                movie_ids[block],
+                is_target,
+                scores,
+                overwrite,
+            )
+        if reporter:
+            conn_in.send(
+                min(start + MATRIX_BLOCK_SIZE, len(targets)) / len(targets)
+            )
+
+    if reporter:
+        conn_in.send(1)
+        conn_in.close()
+        proc.join()
+
+
+def target_indices(movie_ids, target_ids):
+    """Get the indices of target movies in a :class:`RatingMatrix`.
+
+    :param movie_ids: A sorted array of every movie ID, as held by a
+        :class:`RatingMatrix`.
+    :param target_ids: A set of target movie IDs.
+    :return: A sorted array of indices into ``movie_ids``. Movies without any
+        ratings aren't in ``movie_ids``, and are skipped.
+    """
+    target_ids = numpy.array(sorted(target_ids), dtype=numpy.int64)
+    target_ids = target_ids[numpy.isin(target_ids, movie_ids)]
+    return numpy.searchsorted(movie_ids, target_ids)
+
+
+def select_neighbours(scores, top_k):
+    """Select the strongest neighbours of a movie.
+
+    Neighbours are chosen the same way as by
+    :func:`movie_recommender.analyze.ii.push_neighbour`: the ``top_k`` non-zero
+    scores with the greatest magnitude are chosen, and ties are broken in favour
+    of the smaller movie ID.
+
+    :param scores: An array of similarity scores, one per movie, in order of
+        movie ID.
+    :param top_k: The maximum number of neighbours to select.
+    :return: An array of indices into ``scores``.
+    """
+    candidates = numpy.flatnonzero(scores)
+    strengths = numpy.abs(scores[candidates])
+    if len(candidates) > top_k:
+        # Discard most candidates cheaply, but keep every candidate tied with
+        # the weakest of the strongest, so ties can be broken by movie ID.
+        threshold = numpy.partition(strengths, -top_k)[-top_k]
+        keep = strengths >= threshold
+        candidates = candidates[keep]
+        strengths = strengths[keep]
+    return candidates[numpy.lexsort((candidates, -strengths))[:top_k]]
+
+
+def _write_block(movie_ids, block_ids, is_target, scores, overwrite):
+    """Write a block of similarity scores to the similarities table."""
+    keep = ii.mask_pairs(movie_ids, is_target, block_ids, overwrite)
+    rows, cols = numpy.nonzero(keep)
+    write.similarities(
+        common.Similarity(movie_a, movie_b, score)
+        for movie_a, movie_b, score in zip(
+            movie_ids[rows].tolist(),
+            block_ids[cols].tolist(),
+            scores[rows, cols].tolist(),
+        )
+    )
+
+
+def _write_neighbours(movie_ids, block, scores, top_k):
+    """Write the lists of neighbours of a block of target movies."""
+    block_ids = movie_ids[block]
+    neighbours = []
+    for j, target in enumerate(block.tolist()):
+        column = scores[:, j]
+        column[target] = 0
+        chosen = select_neighbours(column, top_k)
+        neighbours.extend(
+            common.Neighbour(block_ids[j].item(), neighbour, score)
+            for neighbour, score in zip(
+                movie_ids[chosen].tolist(),
+                column[chosen].tolist(),
+            )
+        )
+    write.neighbours(block_ids.tolist(), neighbours)
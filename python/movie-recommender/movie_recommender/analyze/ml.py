@@ -1,16 +1,30 @@
 # coding=utf-8
 """Tools for analyses needed by the machine learning prediction algorithm."""
+import math
 import multiprocessing
 
-from movie_recommender import exceptions
-from movie_recommender.constants import GENRES
-from movie_recommender.db import common, read
+from movie_recommender import exceptions, metrics
+from movie_recommender.constants import (
+    GENRE_BITS,
+    GENRES,
+    JOBS_PER_PROCESS_PER_BATCH,
+    ML_TASKS_PER_PROCESS,
+)
+from movie_recommender.db import common, count, init, read, write
+from movie_recommender.graph import Point
 from movie_recommender.predict import ml
 
 
+@metrics.timed('phase', 'analyze_users')
 def analyze_users(user_ids, overwrite, jobs):
     """Analyze users, to find out which predictor works best for them.
 
+    The users are split into tasks by :func:`schedule`, and the tasks are
+    handed to a pool of processes, most expensive first, one at a time. As
+    tasks complete, their results are written in batches by this process.
+
+    The "movieFeatures" table is created first, if it's missing.
+
     :param user_ids: An iterable of user IDs. The users for which analyses are
         being performed.
     :param overwrite: If a user has already been analyzed, should the analysis
@@ -18,15 +32,82 @@ def analyze_users(user_ids, overwrite, jobs):
     :param jobs: The number of processes to spawn. If none, spawn one per CPU.
     :returns: Nothing.
     """
-    # The amount of time it takes to analyze a user depends on the number of
-    # movies they've rated. If analysis of a user who has rated many movies
-    # kicks off late in execution, then that one analysis will greatly lengthen
-    # execution time. Anecdotally, this problem can be seen with data sets as
-    # small as 64 users. An improvement would be to sort (user_id, overwrite)
-    # tuples by the number of movies each user has rated.
-    pfu_args = tuple((user_id, overwrite) for user_id in user_ids)
-    with multiprocessing.Pool(jobs) as pool:
-        pool.starmap(analyze_user, pfu_args)
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    with common.get_db_conn() as conn:
+        init.cpop_movie_features_table(conn)
+    user_ids = set(user_ids)
+    if not overwrite:
+        user_ids.difference_update(read.users_in_predictors())
+    # calc_sse() makes one prediction per rated movie per type of predictor.
+    ratings_per_user = count.ratings_per_user()
+    num_predictors = len(GENRES) + 1
+    costs = {
+        user_id: ratings_per_user.get(user_id, 0) * num_predictors
+        for user_id in user_ids
+    }
+
+    pending = []
+    with multiprocessing.Pool(jobs) as pool, \
+            metrics.pool('analyze_users', jobs):
+        for predictors in metrics.collect(pool.imap_unordered(
+                func=metrics.measured(call_calc_predictors, 'analyze_users'),
+                iterable=schedule(costs, jobs),
+                chunksize=1)):
+            pending.extend(predictors)
+            if len(pending) >= JOBS_PER_PROCESS_PER_BATCH:
+                write.predictors(pending)
+                pending.clear()
+    write.predictors(pending)
+    metrics.count('users', 'analyze_users', len(user_ids))
+
+
+def schedule(costs, jobs):
+    """Split users into tasks, most expensive first.
+
+    Analyzing a user means making a leave-one-out prediction for each movie
+    they've rated, with each type of predictor. Each prediction takes constant
+    time, as described in :func:`calc_sse`, so the cost of analyzing a user
+    grows linearly with the number of movies they've rated, times the number
+    of types of predictor. Ratings per user follow a long-tailed distribution,
+    so a few users cost far more than the rest. If an expensive user is
+    analyzed late, that one analysis lengthens the whole run. So users are
+    ordered by cost, and the most expensive are handed out first.
+    Expensive users get a task each, and cheap users are packed together into
+    tasks, so that dispatching them doesn't dominate their cost. See
+    :data:`movie_recommender.constants.ML_TASKS_PER_PROCESS`.
+
+    :param costs: A dict in the form ``{user_id: cost}``.
+    :param jobs: The number of processes that will run the tasks.
+    :return: A list of tuples of user IDs, in descending order of cost.
+    """
+    target = sum(costs.values()) / (jobs * ML_TASKS_PER_PROCESS)
+    tasks = []
+    task = []
+    task_cost = 0
+    for user_id in sorted(costs, key=lambda key: (-costs[key], key)):
+        task.append(user_id)
+        task_cost += costs[user_id]
+        if task_cost >= target:
+            tasks.append(tuple(task))
+            task = []
+            task_cost = 0
+    if task:
+        tasks.append(tuple(task))
+    return tasks
+
+
+def call_calc_predictors(user_ids):
+    """Find the best predictor for each of the given users.
+
+    :param user_ids: An iterable of user IDs.
+    :return: A list of :class:`movie_recommender.db.common.UserPredictor`
+        objects.
+    """
+    return [
+        common.UserPredictor(user_id, min_sse(calc_sse(user_id)))
+        for user_id in user_ids
+    ]
 
 
 def analyze_user(user_id, overwrite):
@@ -38,78 +119,138 @@ def analyze_user(user_id, overwrite):
         be overwritten?
     :returns: Nothing.
     """
+    if not overwrite and user_id in read.users_in_predictors():
+        return
     with common.get_db_conn() as conn:
-        # What if a user already has a predictor?
-        if not overwrite and conn.execute(
-                'SELECT * FROM predictors WHERE userId=?',
-                (user_id,)
-        ).fetchall():
-            return
-
-        # Create a personalized predictor for this user. SQLite added
-        # support for UPSERT in version 3.24.0, which was released on
-        # 2018-06-24. See: https://www.sqlite.org/lang_UPSERT.html
-        sses = calc_sse(user_id)
-        predictor = min_sse(sses)
-        with conn:
-            conn.execute(
-                """
-                INSERT INTO predictors VALUES (?, ?)
-                ON CONFLICT (userId) DO UPDATE SET predictor=?
-                """,
-                (user_id, predictor, predictor)
-            )
+        init.cpop_movie_features_table(conn)
+    write.predictors(call_calc_predictors((user_id,)))
 
 
 def calc_sse(user_id):
     """Calculate the SSE for each type of predictor for the given user.
 
-    .. WARNING:: This function may take a long time to execute.
+    Each movie the user has rated is selected in turn to serve as the control,
+    and each type of predictor is made from the remaining movies and used to
+    predict the control's rating. The user's ratings are read once, and each
+    prediction is made by :func:`make_loo_predictor` in constant time.
 
     :param user_id: A user ID.
     :return: A dict in the form ``{predictor_name: sum_of_squared_errors}``.
     """
-    sses = {}  # predictor name → sum of squared errors
-
-    # Repeatedly select one movie to serve as the control, and make predictors
-    # from the remaining movies.
-    for movie_id in read.rated_movies((user_id,)):
-        predictors = {'year': ml.make_year_predictor(user_id, movie_id)}
-        for genre in GENRES:
-            predictors[f'genre:{genre}'] = (
-                ml.make_genre_predictor(genre, user_id, movie_id)
+    rated_movies = read.rated_movie_details(user_id)
+    points = {'year': {}}  # predictor name → {movie ID: point}
+    for movie_id, rated_movie in rated_movies.items():
+        if rated_movie.year is not None:
+            points['year'][movie_id] = Point(
+                rated_movie.year,
+                rated_movie.rating,
             )
+    # GENRES is a set, and its order varies from process to process. Sort it,
+    # so that min_sse() breaks ties the same way in every process.
+    for genre in sorted(GENRES):
+        genre_bit = GENRE_BITS[genre]
+        points[f'genre:{genre}'] = {
+            movie_id: Point(
+                1 if rated_movie.genres & genre_bit else 0,
+                rated_movie.rating,
+            )
+            for movie_id, rated_movie in rated_movies.items()
+        }
+    predictors = {
+        pred_name: make_loo_predictor(tuple(pred_points.values()))
+        for pred_name, pred_points in points.items()
+    }
 
-        # See how well each predictor predicts the control. If we're using a
-        # year-based predictor, then two errors can occur:
-        #
-        # * The movie for which a prediction is being made doesn't have a
-        #   year.
-        # * The movie for which a prediction is being made does have a
-        #   year, but all of the _other_ movies the user has rated don't
-        #   have a year.
-        #
-        # In either case, we respond by not calculating an SSE for the
-        # predictor.
-        #
-        # It is possible to encounter this problem for every combination of
-        # (control movie, other movies) for a user. In this case, we set the
-        # SSE for that type of predictor to "infinite." Other areas of the code
-        # base must be prepared to find out that a predictor has an infinite
-        # SSE.
+    # See how well each predictor predicts each control. If we're using a
+    # year-based predictor, then two errors can occur:
+    #
+    # * The movie for which a prediction is being made doesn't have a year.
+    # * The movie for which a prediction is being made does have a year, but
+    #   all of the _other_ movies the user has rated don't have a year.
+    #
+    # In either case, we respond by not calculating an SSE for the predictor.
+    #
+    # It is possible to encounter this problem for every control. In this
+    # case, we set the SSE for that type of predictor to "infinite." Other
+    # areas of the code base must be prepared to find out that a predictor has
+    # an infinite SSE.
+    #
+    # min_sse() breaks ties in favour of the SSE inserted into the dict last.
+    # The controls are visited in the same order as before this function was
+    # optimized, so that the year-based predictor's SSE is inserted before or
+    # after the genre-based predictors' SSEs, as it was before.
+    sses = {}  # predictor name → sum of squared errors
+    for movie_id in read.rated_movies((user_id,)):
         for pred_name, pred in predictors.items():
+            point = points[pred_name].get(movie_id)
+            if point is None:
+                continue
             try:
-                predicted_rating = pred(movie_id)
-            except (exceptions.NoMovieYearError, exceptions.EmptyGraphError):
+                predicted_rating = pred(point)
+            except exceptions.EmptyGraphError:
                 continue
-            actual_rating = read.rating(user_id, movie_id)
             sses.setdefault(pred_name, 0)
-            sses[pred_name] += (predicted_rating - actual_rating) ** 2
+            sses[pred_name] += (predicted_rating - point.y) ** 2
 
     sses.setdefault('year', float('inf'))
     return sses
 
 
+def make_loo_predictor(points):
+    """Make a leave-one-out predictor from the given points.
+
+    The returned predictor accepts one of the given points, and predicts its y
+    coordinate from the line of best fit through the *other* points, in the
+    same way as a predictor made by
+    :func:`movie_recommender.predict.ml.make_year_predictor` or
+    :func:`movie_recommender.predict.ml.make_genre_predictor`. Rather than
+    fitting a new line for each point left out, the sums that define the line
+    of best fit through all points are computed once, and the left-out point's
+    terms are subtracted from them. This is equivalent to correcting each
+    residual by its leverage, but it yields the prediction itself, which must
+    be clamped before its error is calculated.
+
+    :param points: A tuple of :class:`movie_recommender.graph.Point` objects,
+        where each x coordinate is an integer.
+    :return: A function which accepts a point from ``points`` and returns a
+        predicted rating.
+    """
+    # Shifting the x coordinates doesn't change the line of best fit, and
+    # keeps the sums of years small.
+    shift = min((point.x for point in points), default=0)
+    num_points = len(points)
+    total_x = sum(point.x - shift for point in points)
+    total_xx = sum((point.x - shift) ** 2 for point in points)
+    total_y = math.fsum(point.y for point in points)
+    total_xy = math.fsum((point.x - shift) * point.y for point in points)
+
+    def predictor(point):
+        """Predict the y coordinate of the given point from the other points.
+
+        :param point: One of the points the predictor was made from.
+        :return: A predicted rating.
+        :raise movie_recommender.exceptions.EmptyGraphError: If there are no
+            other points.
+        """
+        others = num_points - 1
+        if others == 0:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the average point of an empty graph."
+            )
+        x = point.x - shift
+        sum_x = total_x - x
+        sum_y = total_y - point.y
+        # m = (n * sum(x * y) - sum(x) * sum(y)) / (n * sum(x^2) - sum(x)^2)
+        denominator = others * (total_xx - x ** 2) - sum_x ** 2
+        if denominator == 0:  # The line of best fit is vertical.
+            return ml.clamp_rating(sum_y / others)
+        sum_xy = total_xy - x * point.y
+        slope = (others * sum_xy - sum_x * sum_y) / denominator
+        return ml.clamp_rating(sum_y / others + slope * (x - sum_x / others))
+
+    return predictor
+
+
 def min_sse(sses):
     """Select the best predictor from the given choices.
 
@@ -2,14 +2,18 @@
 """Recommend movies for a user."""
 import argparse
 import functools
+import sys
 
 from movie_recommender.db import read
-from movie_recommender.analyze import ii, ml
+from movie_recommender.analyze import ii, matrix, ml
 from movie_recommender.cli.utils import (
     add_jobs_flag,
+    add_metrics_flags,
     add_progress_flags,
+    report_metrics,
     report_progress,
     to_movie_id,
+    to_positive_int,
     to_user_id,
 )
 
@@ -29,6 +33,7 @@ def main():
     add_ml_subcommand(subparsers)
     args = parser.parse_args()
     args.func(args)
+    report_metrics(args)
 
 
 def add_ii_subcommand(subparsers):
@@ -60,9 +65,48 @@ def add_ii_subcommand(subparsers):
         nargs='+',
         type=to_user_id,
     )
+    parser.add_argument(
+        '--engine',
+        choices=('sql', 'snapshot', 'matrix'),
+        default='sql',
+        help="""\
+        How to compute similarity scores. "sql" queries the database for the
+        ratings of each tile of pairs of movies, spread across --jobs
+        processes. "snapshot" loads all ratings once, into memory shared by
+        --jobs processes, which compute scores for each tile without querying
+        the database. "matrix" loads all ratings into memory once, and
+        computes scores for blocks of movies with sparse matrix products, in a
+        single process. "matrix" is much faster, but "snapshot" and "matrix"
+        need enough memory to hold the ratings table. Default is "sql".
+        """,
+    )
+    parser.add_argument(
+        '--top-k',
+        help="""\
+        Keep only the N most similar movies for each analyzed movie, and store
+        them as a list of neighbours, instead of storing a similarity score for
+        every pair of movies. Similarity is measured by magnitude, so strongly
+        dissimilar movies are kept too. This greatly reduces the size of the
+        database. Predictions for an analyzed movie consider only its
+        neighbours.
+        """,
+        metavar='N',
+        type=to_positive_int,
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="""\
+        Resume an interrupted analysis, by skipping the work it recorded as
+        done. Pass the same --movie-ids and --user-ids as the interrupted
+        analysis. Without this flag, an analysis starts from scratch. Can't be
+        combined with --top-k or --engine matrix.
+        """,
+    )
     add_jobs_flag(parser)
     add_overwrite_flags(parser)
     add_progress_flags(parser)
+    add_metrics_flags(parser)
     parser.set_defaults(func=handle_ii)
 
 
@@ -85,6 +129,7 @@ def add_ml_subcommand(subparsers):
     )
     add_jobs_flag(parser)
     add_overwrite_flags(parser)
+    add_metrics_flags(parser)
     parser.set_defaults(func=handle_ml)
 
 
@@ -114,6 +159,12 @@ def add_overwrite_flags(parser):
 
 def handle_ii(args):
     """Handle the "ii" subcommand."""
+    if args.resume and (args.top_k is not None or args.engine == 'matrix'):
+        print(
+            "--resume can't be combined with --top-k or --engine matrix.",
+            file=sys.stderr,
+        )
+        exit(1)
     if args.movie_ids is None and args.user_ids is None:
         movie_ids = set(read.all_movies())
         user_ids = set()
@@ -133,13 +184,25 @@ def handle_ii(args):
         au_reporter = None
         am_reporter = None
     ii.analyze_users(args.overwrite, args.jobs, au_reporter)
-    ii.analyze_movies(
-        movie_ids,
-        user_ids,
-        args.overwrite,
-        args.jobs,
-        am_reporter,
-    )
+    if args.engine == 'matrix':
+        matrix.analyze_movies(
+            movie_ids,
+            user_ids,
+            args.overwrite,
+            am_reporter,
+            args.top_k,
+        )
+    else:
+        ii.analyze_movies(
+            movie_ids,
+            user_ids,
+            args.overwrite,
+            args.jobs,
+            am_reporter,
+            args.top_k,
+            args.engine == 'snapshot',
+            args.resume,
+        )
 
 
 def handle_ml(args):
@@ -4,9 +4,13 @@ import argparse
 import sys
 from pathlib import Path
 
+import numpy
+
 from movie_recommender import exceptions
+from movie_recommender.analyze import incremental
+from movie_recommender.cli.utils import add_jobs_flag
 from movie_recommender.constants import DATASETS
-from movie_recommender.db import common, init
+from movie_recommender.db import common, init, store
 
 
 def main():
@@ -24,7 +28,10 @@ def parse_args():
     )
     subparsers = parser.add_subparsers(dest='subcommand', required=True)
     _add_create_subcommand(subparsers)
+    _add_export_store_subcommand(subparsers)
+    _add_ingest_subcommand(subparsers)
     _add_load_path_subcommand(subparsers)
+    _add_reindex_subcommand(subparsers)
     _add_save_path_subcommand(subparsers)
     return parser.parse_args()
 
@@ -36,12 +43,56 @@ def handle_create(args):
         if path.exists():
             path.unlink()
     try:
-        init.cpop_db(args.dataset)
+        loads = init.cpop_db(args.dataset)
     except (
             exceptions.DatabaseAlreadyExistsError,
             exceptions.DatasetAbsentError) as err:
         print(err, file=sys.stderr)
         exit(1)
+    for load in loads:
+        rate = load.rows / load.seconds if load.seconds else float('inf')
+        print(
+            f'{load.table}: {load.rows} rows in {load.seconds:.2f}s '
+            f'({rate:.0f} rows/s)'
+        )
+
+
+def handle_export_store(args):  # pylint:disable=unused-argument
+    """Handle the "export-store" subcommand."""
+    try:
+        neighbours = store.export()
+    except exceptions.DatabaseNotFoundError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    print(f'Exported {neighbours} neighbours to {store.get_path()}')
+
+
+def handle_ingest(args):
+    """Handle the "ingest" subcommand."""
+    try:
+        with args.ratings as handle:
+            ingested = incremental.ingest(
+                (
+                    rating
+                    for chunk in common.parse_numeric_csv(
+                        handle,
+                        (numpy.int64, numpy.int64, numpy.float64, numpy.int64),
+                    )
+                    for rating in chunk
+                ),
+                args.jobs,
+            )
+    except (
+            exceptions.DatabaseNotFoundError,
+            exceptions.MissingAverageRatingError,
+            ValueError) as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    print(
+        f'Ingested {ingested.ratings} ratings from {ingested.users} users, '
+        f'updated {ingested.similarities} similarity scores, and '
+        f're-computed {ingested.neighbour_lists} lists of neighbours.'
+    )
 
 
 def handle_load_path(args):  # pylint:disable=unused-argument
@@ -52,6 +103,15 @@ def handle_load_path(args):  # pylint:disable=unused-argument
         exit(1)
 
 
+def handle_reindex(args):  # pylint:disable=unused-argument
+    """Handle the "reindex" subcommand."""
+    try:
+        init.reindex()
+    except exceptions.DatabaseNotFoundError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
 def handle_save_path(args):  # pylint:disable=unused-argument
     """Handle the "save-path" subcommand."""
     print(common.get_save_path())
@@ -78,6 +138,49 @@ def _add_create_subcommand(subparsers):
     parser_create.set_defaults(func=handle_create)
 
 
+def _add_export_store_subcommand(subparsers):
+    """Add the export-store subcommand to an argparse subparsers object."""
+    parser_export_store = subparsers.add_parser(
+        'export-store',
+        help='Export similarity scores to a memory-mapped file.',
+        description="""\
+        Export the similarities table of the database found by "load-path" to
+        a similarity store: a binary file beside the database, which readers
+        memory-map and share through the operating system's file cache.
+        Predictions read non-zero similarity scores from the store rather than
+        the database, and scores are rounded to single precision. The store is
+        deleted whenever similarity scores are written, e.g. by "mr-analyze
+        ii" or "mr-db ingest", and it must then be exported again.
+        """
+    )
+    parser_export_store.set_defaults(func=handle_export_store)
+
+
+def _add_ingest_subcommand(subparsers):
+    """Add the ingest subcommand to an argparse subparsers object."""
+    parser_ingest = subparsers.add_parser(
+        'ingest',
+        help='Add new ratings to the database.',
+        description="""\
+        Add new ratings to the database found by "load-path", and update the
+        analyses they affect. Ratings are read from a CSV file in the same
+        format as the dataset's ratings.csv, header row included. If a user has
+        already rated a movie, the old rating is replaced. Users' average
+        ratings are updated, as are the similarity scores of every analyzed
+        pair of movies rated by the ingested users. Lists of neighbours made by
+        "mr-analyze ii --top-k" can't be updated, so the lists of the movies
+        rated by the ingested users are re-computed, across --jobs processes.
+        """
+    )
+    parser_ingest.add_argument(
+        'ratings',
+        help='A CSV file of ratings. Use "-" to read from stdin.',
+        type=argparse.FileType(),
+    )
+    add_jobs_flag(parser_ingest)
+    parser_ingest.set_defaults(func=handle_ingest)
+
+
 def _add_load_path_subcommand(subparsers):
     """Add the load-path subcommand to an argparse subparsers object."""
     parser_load_path = subparsers.add_parser(
@@ -93,6 +196,23 @@ def _add_load_path_subcommand(subparsers):
     parser_load_path.set_defaults(func=handle_load_path)
 
 
+def _add_reindex_subcommand(subparsers):
+    """Add the reindex subcommand to an argparse subparsers object."""
+    parser_reindex = subparsers.add_parser(
+        'reindex',
+        help='Add missing tables and indices to an existing database.',
+        description="""\
+        Add missing tables and indices to the database found by "load-path".
+        Databases created by older versions of this application lack some
+        tables, such as the neighbours and movieFeatures tables, and some
+        indices, without which queries are slow. Tables that are computed from
+        the dataset, such as movieFeatures, are given any rows they lack.
+        Nothing that already exists is dropped or changed.
+        """
+    )
+    parser_reindex.set_defaults(func=handle_reindex)
+
+
 def _add_save_path_subcommand(subparsers):
     """Add the save-path subcommand to an argparse subparsers object."""
     parser_save_path = subparsers.add_parser(
@@ -1,20 +1,37 @@
 # coding=utf-8
 """Make a graph from a pair of columns in a CSV file, and analyze it."""
 import argparse
+import array
 import csv
+import multiprocessing
+import os
+import sys
 from collections import namedtuple
 
-from movie_recommender.graph import Graph, Point
+import numpy
+
+from movie_recommender.cli import utils
+from movie_recommender.constants import CSV_CHUNK_BYTES
+from movie_recommender.graph import Point, StreamingGraph
 
 
 def main():
     """Parse arguments and call business logic."""
     args = parse_args()
-    graph = Graph(tuple(get_points(
-        args.input,
-        Columns(args.x_column, args.y_column),
-        header_rows=args.header_rows,
-    )))
+    columns = Columns(args.x_column, args.y_column)
+    if args.jobs > 1 and args.input is not sys.stdin:
+        args.input.close()
+        graph = summarize_file(
+            args.input.name,
+            columns,
+            header_rows=args.header_rows,
+            jobs=args.jobs,
+        )
+    else:
+        with args.input as handle:
+            for _ in range(args.header_rows):
+                handle.readline()
+            graph = summarize_lines(iter_chunks(handle), columns)
     print(f'y = {graph.slope:g} × x + {graph.y_intercept:g}')
     print(f'sse = {graph.sse:g}')
 
@@ -23,7 +40,12 @@ def parse_args():
     """Parse CLI arguments."""
     parser = argparse.ArgumentParser(
         description="""\
-        Make a graph from a pair of columns in a CSV file, and analyze it.
+        Make a graph from a pair of columns in a CSV file, and analyze it. The
+        file is read in chunks, and only a summary of the points read so far is
+        kept in memory, so files of any size may be graphed. If more than one
+        job is requested, the file is split into byte ranges at line breaks,
+        and each range is summarized by a separate process. Quoted fields must
+        not contain line breaks. Input from stdin is read by a single process.
         """,
     )
     parser.add_argument(
@@ -54,6 +76,7 @@ def parse_args():
         Defaults to "0".
         """,
     )
+    utils.add_jobs_flag(parser)
     return parser.parse_args()
 
 
@@ -73,6 +96,35 @@ References the values 0, 10, 3, and 13.
 """
 
 
+def get_coordinates(input_stream, columns, *, header_rows=0):
+    """Consume an input stream, collecting the x and y coordinates of points.
+
+    This is like :func:`get_points`, but the coordinates are collected into a
+    pair of arrays, for use with :class:`movie_recommender.graph.ArrayGraph`.
+
+    :param input_stream: A `text I/O`_ stream, or any other iterable of
+        strings, where each line is CSV data.
+    :param Columns columns: The columns to read from the CSV file.
+    :param header_rows: The number of header rows in the input file. Header
+        rows are ignored.
+    :returns: A pair of float64 NumPy arrays: the x and y coordinates.
+
+    .. _text I/O: https://docs.python.org/3/library/io.html#text-i-o
+    """
+    x = array.array('d')
+    y = array.array('d')
+    reader = csv.reader(input_stream)
+    for current_line, row in enumerate(reader, start=1):
+        if current_line <= header_rows:
+            continue
+        x.append(float(row[columns.x]))
+        y.append(float(row[columns.y]))
+    return (
+        numpy.frombuffer(x, dtype=numpy.float64),
+        numpy.frombuffer(y, dtype=numpy.float64),
+    )
+
+
 def get_points(input_stream, columns, *, header_rows=0):
     """Consume an input stream, yielding an x,y point for each line.
 
@@ -96,3 +148,122 @@ def get_points(input_stream, columns, *, header_rows=0):
         x = float(row[columns.x])
         y = float(row[columns.y])
         yield Point(x, y)
+
+
+def iter_chunks(handle):
+    """Read lines from a text stream, in chunks.
+
+    :param handle: A `text I/O`_ stream.
+    :returns: A generator yielding lists of lines, each list about
+        :data:`movie_recommender.constants.CSV_CHUNK_BYTES` long.
+
+    .. _text I/O: https://docs.python.org/3/library/io.html#text-i-o
+    """
+    while True:
+        lines = handle.readlines(CSV_CHUNK_BYTES)
+        if not lines:
+            break
+        yield lines
+
+
+def iter_range_chunks(path, start, end):
+    """Read lines from a byte range of a file, in chunks.
+
+    :param path: The path to a UTF-8 encoded file.
+    :param start: The byte offset at which to start reading. It must fall at
+        the start of a line.
+    :param end: The byte offset at which to stop reading. It must fall at the
+        start of a line, or at the end of the file.
+    :returns: A generator yielding lists of lines, each list about
+        :data:`movie_recommender.constants.CSV_CHUNK_BYTES` long.
+    """
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        remaining = end - start
+        partial_line = b''
+        while remaining > 0:
+            data = partial_line + handle.read(min(CSV_CHUNK_BYTES, remaining))
+            remaining = end - handle.tell()
+            if remaining > 0:
+                # A line break can't fall inside a multi-byte character, so
+                # splitting there is safe.
+                data, _, partial_line = data.rpartition(b'\n')
+            lines = data.decode().split('\n')
+            if not lines[-1]:
+                lines.pop()
+            if lines:
+                yield lines
+
+
+def split_file(path, jobs, *, header_rows=0):
+    """Split a file into byte ranges, each starting at the start of a line.
+
+    :param path: The path to a file.
+    :param jobs: The number of ranges to split the file into. Fewer ranges are
+        returned if the file is too short.
+    :param header_rows: The number of header rows in the file. These are
+        excluded from the ranges.
+    :returns: A list of ``(start, end)`` byte offsets.
+    """
+    with open(path, 'rb') as handle:
+        for _ in range(header_rows):
+            handle.readline()
+        offsets = [handle.tell()]
+        size = os.fstat(handle.fileno()).st_size
+        for i in range(1, jobs):
+            handle.seek(offsets[0] + (size - offsets[0]) * i // jobs)
+            handle.readline()
+            offsets.append(max(offsets[-1], min(handle.tell(), size)))
+        offsets.append(size)
+    return [
+        (start, end)
+        for start, end in zip(offsets[:-1], offsets[1:])
+        if start < end
+    ]
+
+
+def summarize_file(path, columns, *, header_rows=0, jobs=1):
+    """Summarize the points in a CSV file, with several processes.
+
+    :param path: The path to a CSV file. Fields must not contain line breaks.
+    :param Columns columns: The columns to read from the CSV file.
+    :param header_rows: The number of header rows in the input file. Header
+        rows are ignored.
+    :param jobs: The number of processes to spawn.
+    :returns: A :class:`movie_recommender.graph.StreamingGraph`.
+    """
+    ranges = split_file(path, jobs, header_rows=header_rows)
+    graph = StreamingGraph()
+    with multiprocessing.Pool(jobs) as pool:
+        for range_graph in pool.starmap(
+                summarize_range,
+                ((path, start, end, columns) for start, end in ranges)):
+            graph.merge(range_graph)
+    return graph
+
+
+def summarize_range(path, start, end, columns):
+    """Summarize the points in a byte range of a CSV file.
+
+    :param path: The path to a CSV file.
+    :param start: The byte offset at which to start reading. It must fall at
+        the start of a line.
+    :param end: The byte offset at which to stop reading. It must fall at the
+        start of a line, or at the end of the file.
+    :param Columns columns: The columns to read from the CSV file.
+    :returns: A :class:`movie_recommender.graph.StreamingGraph`.
+    """
+    return summarize_lines(iter_range_chunks(path, start, end), columns)
+
+
+def summarize_lines(chunks, columns):
+    """Summarize the points in chunks of lines of CSV data.
+
+    :param chunks: An iterable of lists of lines, as strings.
+    :param Columns columns: The columns to read from the CSV data.
+    :returns: A :class:`movie_recommender.graph.StreamingGraph`.
+    """
+    graph = StreamingGraph()
+    for lines in chunks:
+        graph.add_points(*get_coordinates(lines, columns))
+    return graph
@@ -101,7 +101,9 @@ def handle_ml(args):
     # Make a predictor of that type.
     try:
         predictor = ml.make_predictor(args.user_id, args.predictor)
-    except exceptions.NoSuchPredictorError as err:
+    except (
+            exceptions.MissingMovieFeaturesError,
+            exceptions.NoSuchPredictorError) as err:
         print(err, file=sys.stderr)
         exit(1)
 
@@ -7,13 +7,16 @@ import sys
 
 from movie_recommender import exceptions
 from movie_recommender.cli.utils import (
+    add_cache_flags,
     add_jobs_flag,
+    add_metrics_flags,
     add_progress_flags,
+    report_metrics,
     report_progress,
 )
 from movie_recommender.cli.utils import to_user_id
 from movie_recommender.constants import REASONS
-from movie_recommender.db import read
+from movie_recommender.db import cache, read
 from movie_recommender.predict.ml import make_predictor
 from movie_recommender.recommend import ii, ml
 
@@ -30,6 +33,7 @@ def main():
     add_ml_subcommand(subparsers)
     args = parser.parse_args()
     args.func(args)
+    report_metrics(args)
 
 
 def add_ii_subcommand(subparsers):
@@ -40,10 +44,26 @@ def add_ii_subcommand(subparsers):
         help=helptext,
         description=helptext,
     )
+    parser.add_argument(
+        '--engine',
+        choices=('batch', 'pool', 'snapshot'),
+        default='batch',
+        help="""\
+        How to predict ratings. "batch" predicts a rating for every movie at
+        once, with a single query, in this process. "pool" predicts a rating
+        for each movie separately, spread across --jobs processes. "snapshot"
+        is like "pool", but similarity scores are loaded once, into memory
+        shared by the processes, rather than queried for each movie. All yield
+        the same recommendations. --jobs and --progress only affect "pool" and
+        "snapshot". Default is "batch".
+        """,
+    )
     add_jobs_flag(parser)
     add_user_id_flag(parser)
     add_count_flag(parser)
     add_progress_flags(parser)
+    add_cache_flags(parser)
+    add_metrics_flags(parser)
     parser.set_defaults(func=handle_ii)
 
 
@@ -59,9 +79,22 @@ def add_ml_subcommand(subparsers):
         '--predictor',
         help='The type of univariate predictor to use, e.g. "year".',
     )
+    parser.add_argument(
+        '--engine',
+        choices=('batch', 'per-movie'),
+        default='batch',
+        help="""\
+        How to predict ratings. "batch" predicts a rating for every movie at
+        once, from features precomputed by "mr-db create" or "mr-db reindex".
+        "per-movie" calls the predictor once for each movie. Both yield the
+        same recommendations. Default is "batch".
+        """,
+    )
     add_user_id_flag(parser)
     add_count_flag(parser)
     add_format_flag(parser)
+    add_cache_flags(parser)
+    add_metrics_flags(parser)
     parser.set_defaults(func=handle_ml)
 
 
@@ -101,14 +134,19 @@ def add_user_id_flag(parser):
 
 def handle_ii(args):
     """Handle the "ii" subcommand."""
-    reporter = report_progress if args.progress else None
-    recommendations = ii.recommend(
-        args.user_id,
-        args.count,
-        args.jobs,
-        reporter,
-    )
-    for rec in recommendations:
+    def recommend():
+        if args.engine == 'batch':
+            return ii.recommend_batched(args.user_id, args.count)
+        reporter = report_progress if args.progress else None
+        return ii.recommend(
+            args.user_id,
+            args.count,
+            args.jobs,
+            reporter,
+            args.engine == 'snapshot',
+        )
+
+    for rec in _recommend(args, 'ii', '', recommend):
         movie = read.title(rec.movie)
         pred_rating = f'{rec.pred_rating:.1f}'
         reason = REASONS[rec.reason]
@@ -125,20 +163,56 @@ def handle_ml(args):
             print(err, file=sys.stderr)
             exit(1)
 
-    # Make a predictor of that type.
+    # Make recommendations with a predictor of that type.
+    def recommend():
+        if args.engine == 'batch':
+            return ml.recommend_batched(
+                args.user_id,
+                args.count,
+                args.predictor,
+            )
+        return ml.recommend(
+            args.user_id,
+            args.count,
+            make_predictor(args.user_id, args.predictor),
+        )
+
     try:
-        predictor = make_predictor(args.user_id, args.predictor)
-    except exceptions.NoSuchPredictorError as err:
+        recommendations = _recommend(args, 'ml', args.predictor, recommend)
+    except (
+            exceptions.MissingMovieFeaturesError,
+            exceptions.NoSuchPredictorError) as err:
         print(err, file=sys.stderr)
         exit(1)
-
-    # Make recommendations.
     formatter = _FORMATTERS[args.format]
-    recommendations = ml.recommend(args.user_id, args.count, predictor)
     for line in formatter(recommendations):
         print(line)
 
 
+def _recommend(args, algorithm, predictor, recommend):
+    """Call ``recommend``, or get its result from the cache.
+
+    :param args: Parsed CLI arguments, with ``user_id``, ``count`` and
+        ``cache`` attributes.
+    :param algorithm: The algorithm ``recommend`` uses, e.g. "ii".
+    :param predictor: The type of predictor ``recommend`` uses, or an empty
+        string.
+    :param recommend: A function which accepts no arguments, and returns an
+        iterable of recommendations.
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects.
+    """
+    if not args.cache:
+        return tuple(recommend())
+    return cache.recommendations(
+        args.user_id,
+        algorithm,
+        predictor,
+        args.count,
+        recommend,
+    )
+
+
 def _format_csv(recommendations):
     """Yield recommendations, formatted as CSV."""
     output = io.StringIO()
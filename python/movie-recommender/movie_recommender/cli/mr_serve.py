@@ -0,0 +1,60 @@
+# coding=utf-8
+"""Answer requests for recommendations and predictions over a socket."""
+import argparse
+import asyncio
+import sys
+
+from movie_recommender import exceptions
+from movie_recommender.serve import Server
+
+
+def main():
+    """Parse arguments and call business logic."""
+    args = parse_args()
+    try:
+        asyncio.run(Server().serve(
+            socket_path=args.socket,
+            host=args.host,
+            port=args.port,
+            listening=_print_address,
+        ))
+    except exceptions.DatabaseNotFoundError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
+def parse_args():
+    """Parse CLI arguments."""
+    parser = argparse.ArgumentParser(
+        description="""\
+        Answer requests for recommendations and predictions, until interrupted.
+        The database is opened once, and requests from concurrent clients are
+        answered in batches. Requests and responses are JSON objects, one per
+        line. For example, send '{"command": "recommend", "algorithm": "ii",
+        "user": 1, "count": 5}' or '{"command": "predict", "algorithm": "ml",
+        "user": 1, "movie": 10}'. Once clients can connect, the address is
+        printed.
+        """,
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        '--socket',
+        help='Listen on a Unix socket at this path.',
+    )
+    group.add_argument(
+        '--port',
+        help='Listen on this TCP port. If 0, pick a free port.',
+        type=int,
+    )
+    default_host = '127.0.0.1'
+    parser.add_argument(
+        '--host',
+        default=default_host,
+        help=f'With --port, listen on this host, instead of {default_host}.',
+    )
+    return parser.parse_args()
+
+
+def _print_address(address):
+    """Print the address being listened on."""
+    print(f'Listening on {address}', flush=True)
@@ -1,11 +1,37 @@
 # coding=utf-8
 """Utilities for the CLI interfaces."""
+import json
 import multiprocessing
 import sys
+import time
 
+from movie_recommender import metrics
 from movie_recommender.db import common
 
 
+def add_cache_flags(parser):
+    """Add the ``--{no-,}cache`` flags to a parser."""
+    # See: https://stackoverflow.com/a/15008806
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument(
+        '--cache',
+        action='store_true',
+        dest='cache',
+        help="""\
+        Reuse recommendations cached in the database, if the data they were
+        made from hasn't changed since, and cache new recommendations. This is
+        the default.
+        """,
+    )
+    group.add_argument(
+        '--no-cache',
+        action='store_false',
+        dest='cache',
+        help='Neither read nor write cached recommendations.',
+    )
+    group.set_defaults(cache=True)
+
+
 def add_jobs_flag(parser):
     """Add the ``--jobs`` flag to a parser."""
     default = multiprocessing.cpu_count()
@@ -18,6 +44,28 @@ def add_jobs_flag(parser):
     )
 
 
+def add_metrics_flags(parser):
+    """Add the ``--stats`` and ``--prometheus`` flags to a parser."""
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help="""\
+        Once done, print statistics to stderr, as JSON: each phase's wall time
+        and throughput, the number of SQL queries of each type and the time
+        they took, how busy worker processes were, and how long batch writes
+        took.
+        """,
+    )
+    parser.add_argument(
+        '--prometheus',
+        help="""\
+        Once done, write the same statistics to this file, in the Prometheus
+        text format, e.g. for the node exporter's textfile collector.
+        """,
+        metavar='PATH',
+    )
+
+
 def add_progress_flags(parser):
     """Add the ``--{no-,}progress`` flags to a parser."""
     # See: https://stackoverflow.com/a/15008806
@@ -37,6 +85,56 @@ def add_progress_flags(parser):
     group.set_defaults(progress=True)
 
 
+def estimate_remaining(start, now):
+    """Estimate how long it'll take to finish some work.
+
+    The rate of progress observed between ``start`` and ``now`` is assumed to
+    hold for the rest of the work. Progress made before ``start``, such as work
+    skipped when resuming an analysis, doesn't count towards the rate.
+
+    :param start: A ``(time, progress)`` tuple, where ``time`` is in seconds
+        and ``progress`` is a value from 0 to 1, inclusive.
+    :param now: A ``(time, progress)`` tuple, recorded after ``start``.
+    :return: A number of seconds, or ``None`` if there's too little information
+        for an estimate, or if the work is done.
+    """
+    elapsed = now[0] - start[0]
+    done = now[1] - start[1]
+    if elapsed < 1 or done <= 0 or now[1] >= 1:
+        return None
+    return elapsed * (1 - now[1]) / done
+
+
+def format_duration(seconds):
+    """Format a duration for humans, e.g. "1h 05m" or "3m 20s".
+
+    :param seconds: A non-negative number of seconds.
+    :return: A string. Only the two largest units are shown.
+    """
+    seconds = round(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f'{hours}h {minutes:02}m'
+    if minutes:
+        return f'{minutes}m {seconds:02}s'
+    return f'{seconds}s'
+
+
+def report_metrics(args):
+    """Report metrics, as requested by the flags of :func:`add_metrics_flags`.
+
+    :param args: Parsed CLI arguments, with ``stats`` and ``prometheus``
+        attributes.
+    :return: Nothing.
+    """
+    if args.stats:
+        print(json.dumps(metrics.stats(), indent=2, sort_keys=True),
+              file=sys.stderr)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+
+
 def report_progress(conn_out, prefix=''):
     """Tell the user how much work has been done.
 
@@ -49,14 +147,19 @@ def report_progress(conn_out, prefix=''):
         return.
     :return: Nothing.
     """
+    start = None
     while True:
         progress = conn_out.recv()
+        now = time.monotonic()
+        if start is None:
+            start = (now, progress)
+        message = f'{progress * 100:.0f}%'
+        remaining = estimate_remaining(start, (now, progress))
+        if remaining is not None:
+            message += f', about {format_duration(remaining)} left'
         # \r is carriage return. The other is an ANSI escape code. See:
         # https://en.wikipedia.org/wiki/ANSI_escape_code
-        print(
-            '\r\033[K' + prefix + f'{progress * 100:.0f}%',
-            end='',
-        )
+        print('\r\033[K' + prefix + message, end='')
         sys.stdout.flush()
         if progress == 1:
             conn_out.close()
@@ -87,6 +190,19 @@ def to_movie_id(arg):
     return movie_id
 
 
+def to_positive_int(arg):
+    """Cast the given string argument to a positive integer, if possible.
+
+    :param arg: A string argument passed on the command line.
+    :return: An integer greater than zero.
+    :raise: ``ValueError`` if ``arg`` isn't a positive integer.
+    """
+    value = int(arg)
+    if value < 1:
+        raise ValueError(f'{value} is not a positive integer.')
+    return value
+
+
 def to_user_id(arg):
     """Cast the given string argument to a user ID, if possible.
 
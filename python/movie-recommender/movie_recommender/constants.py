@@ -24,6 +24,45 @@ REASONS = {
 }
 """Reasons that a movie recommendation might be given, with item-item."""
 
+CSV_CHUNK_BYTES = 2**22
+"""The approximate number of bytes read at a time from large CSV files.
+
+See :func:`movie_recommender.db.common.parse_numeric_csv`. Each chunk is parsed
+and inserted into the database as a unit. Larger chunks amortize per-chunk
+overhead, at the cost of memory. A MovieLens ratings file has about 25 bytes
+per row, so the default is about 170,000 rows per chunk.
+"""
+
+CS_TILE_SIZE = 2**6
+"""The width and height of a tile of pairs of movies, in ``mr-analyze ii``.
+
+:func:`movie_recommender.analyze.ii.gen_cs_tiles` groups the pairs of movies
+to compare into tiles, each pairing up to this many target movies with up to
+this many other movies. Each tile is sent to a worker process as one task, and
+its similarity scores are returned as one array. The worker loads each movie's
+ratings once per tile, and compares them with array arithmetic. Increasing this
+value reduces the number of tasks, and the number of times each movie's
+ratings are loaded, at the cost of worse load balancing across processes.
+"""
+
+DB_CACHED_STATEMENTS = 2**8
+"""The number of prepared statements each database connection should cache.
+
+SQLite compiles each SQL statement before executing it. Connections remember
+the most recently compiled statements, and re-use them when the same SQL text
+is executed again. The item-item analysis executes a handful of distinct
+statements millions of times, so the cache only needs to be big enough to hold
+every distinct statement in the application.
+"""
+
+DB_MMAP_SIZE = 2**30
+"""The max number of bytes of the database that SQLite may memory-map.
+
+Reading memory-mapped pages avoids a copy from the OS page cache to SQLite's
+page cache, and lets every process reading the database share the same pages.
+See: https://www.sqlite.org/mmap.html
+"""
+
 DB_NAME = 'db.db'
 """The basename of Movie Recommender's database file."""
 
@@ -33,10 +72,13 @@ DATASETS = {
         'http://files.grouplens.org/datasets/movielens/ml-latest-small.zip'
     ),
     'ml-20m': 'http://files.grouplens.org/datasets/movielens/ml-20m.zip',
+    'synthetic': None,
 }
 """Datasets this application can manage.
 
-The "fixture" dataset can be created on the fly by this application.
+The "fixture" and "synthetic" datasets can be created on the fly by this
+application. The former is tiny and hand-written, and the latter is randomly
+generated. See :func:`movie_recommender.datasets.write_synthetic_dataset`.
 """
 
 GENRES = {
@@ -68,6 +110,14 @@ themselves, but hard-coding names is quicker, and it avoids issues that arise
 when not all genres are represented by a dataset.
 """
 
+GENRE_BITS = {genre: 1 << i for i, genre in enumerate(sorted(GENRES))}
+"""A bit for each of the :data:`GENRES`.
+
+The genres of a movie are stored in the "movieFeatures" table as the sum of
+their bits. Genres are sorted before bits are assigned, so that bits don't
+depend on the order in which a set is iterated.
+"""
+
 JOBS_PER_PROCESS_PER_BATCH = 2**8
 """Jobs processed by each process in each batch of work.
 
@@ -101,6 +151,29 @@ across processes and makes the pickled objects sent to each process smaller.
 Make sure to perform empirical measurements when setting this value!
 """
 
+MATRIX_BLOCK_SIZE = 2**8
+"""The number of target movies analyzed at once by the matrix engine.
+
+:func:`movie_recommender.analyze.matrix.analyze_movies` computes the similarity
+between a block of target movies and every other movie with a handful of sparse
+matrix products. Each product yields a dense array with one row per movie and
+one column per target movie in the block, so increasing this value speeds up
+the analysis at the cost of memory. With 60,000 movies, a block of 256 movies
+needs several hundred megabytes.
+"""
+
+ML_TASKS_PER_PROCESS = 2**4
+"""The number of tasks per process that ``mr-analyze ml`` aims to create.
+
+:func:`movie_recommender.analyze.ml.schedule` estimates the cost of analyzing
+each user, which is linear in the number of movies they've rated, and packs
+users into tasks whose costs are roughly the total cost divided by
+``ML_TASKS_PER_PROCESS * processes``. Users who cost more than that, such as
+users with thousands of ratings, get a task to themselves. Having several tasks
+per process lets the tasks be balanced across processes. But each task has
+dispatch overhead, so creating too many tasks for cheap users wastes time.
+"""
+
 MAX_RATING = 5.0
 """The max rating that a user can assign to a movie."""
 
@@ -147,6 +220,12 @@ analyses are desired.
 """
 assert MIN_PAIRS_FOR_SIMILARITY >= 1
 
+SIMILARITY_STORE_NAME = 'similarities.bin'
+"""The basename of the similarity store, which sits beside the database.
+
+See :mod:`movie_recommender.db.store`.
+"""
+
 XDG_RESOURCE = 'movie-recommender'
 """The basename of the directories this application uses for data.
 
@@ -2,13 +2,44 @@
 """Tools for working with Movie Recommender's datasets."""
 import os
 import zipfile
+from collections import namedtuple
 from urllib.parse import urlsplit
 
+import numpy
 import requests
 from xdg import BaseDirectory
 
 from movie_recommender import exceptions
-from movie_recommender.constants import DATASETS, XDG_RESOURCE
+from movie_recommender.constants import DATASETS, GENRES, XDG_RESOURCE
+
+SyntheticShape = namedtuple(
+    'SyntheticShape',
+    (
+        'users',
+        'movies',
+        'min_ratings',
+        'ratings_exponent',
+        'popularity_exponent',
+        'genre_exponent',
+        'mean_age',
+    ),
+    defaults=(610, 9700, 20, 1.2, 1.0, 1.0, 25),
+)
+"""The shape of a dataset made by :func:`write_synthetic_dataset`.
+
+``users`` and ``movies`` are the number of each. Each user rates at least
+``min_ratings`` movies. The number of ratings per user follows a power law: it
+is ``min_ratings`` times a Pareto-distributed value with shape
+``ratings_exponent``, so smaller exponents make for heavier raters. Each movie's
+chance of being rated is proportional to ``rank ** -popularity_exponent``,
+where ``rank`` is the movie's rank by popularity. Movies have one to three
+genres, and each genre's chance of being chosen is similarly proportional to
+``rank ** -genre_exponent``. Movies' ages are exponentially distributed, with a
+mean of ``mean_age`` years before 2018.
+
+The defaults approximate the number of users and movies in the
+ml-latest-small dataset.
+"""
 
 
 class Dataset():
@@ -34,12 +65,12 @@ class Dataset():
     def download(self):
         """Download this dataset into the application cache directory.
 
-        Short circuit if the dataset is "fixture," or if the dataset is already
-        downloaded.
+        Short circuit if the dataset is generated by this application, such as
+        "fixture," or if the dataset is already downloaded.
 
         :return: Nothing.
         """
-        if self.name == 'fixture':
+        if DATASETS[self.name] is None:
             return
         cache_dir = BaseDirectory.save_cache_path(XDG_RESOURCE)
         archive_url = DATASETS[self.name]
@@ -57,9 +88,9 @@ class Dataset():
 
         :return: The path to where this dataset is downloaded.
         :raise movie_recommender.exceptions.DatasetAbsentError: If this
-            dataset's name is "fixture."
+            dataset is generated by this application, such as "fixture."
         """
-        if self.name == 'fixture':
+        if DATASETS[self.name] is None:
             raise exceptions.DatasetAbsentError(
                 f"Dataset {self.name} can't be downloaded."
             )
@@ -94,6 +125,9 @@ class Dataset():
         if self.name == 'fixture':
             self._install_fixture()
             return
+        if self.name == 'synthetic':
+            self._install_synthetic()
+            return
         if self.installed():
             return
         download_path = self.download_path()
@@ -118,6 +152,19 @@ class Dataset():
         _write_ratings_csv(os.path.join(fixture_dir, 'ratings.csv'))
         _write_tags_csv(os.path.join(fixture_dir, 'tags.csv'))
 
+    def _install_synthetic(self):
+        """Install the "synthetic" dataset.
+
+        Short circuit if this dataset is already installed. The dataset has
+        the default :class:`SyntheticShape`.
+
+        :return: Nothing.
+        """
+        if self.installed():
+            return
+        data_dir = BaseDirectory.save_data_path(XDG_RESOURCE)
+        write_synthetic_dataset(os.path.join(data_dir, self.name))
+
     def install_path(self):
         """Return the path to where this dataset is installed.
 
@@ -158,6 +205,206 @@ def get_installed_datasets():
     return paths
 
 
+def write_synthetic_dataset(dataset_dir, shape=SyntheticShape(), seed=0):
+    """Write a random dataset, shaped like the MovieLens datasets.
+
+    The dataset's files have the same columns as the MovieLens datasets'. Movie
+    IDs have gaps, as in MovieLens. About 1% of movies have no year in their
+    title, and about 1% have no genres. Each user's ratings are the sum of a
+    global mean, the user's bias, the movie's quality, a bonus for the user's
+    favourite genre, a per-user preference for older or newer movies, and
+    noise, rounded to the nearest half star. This gives the item-item and
+    machine learning algorithms some structure to find.
+
+    :param dataset_dir: The directory to write "links.csv", "movies.csv",
+        "ratings.csv" and "tags.csv" to. Created if it doesn't exist.
+    :param shape: A :class:`SyntheticShape`.
+    :param seed: A seed for the random number generator. The same seed and
+        shape always yield the same dataset.
+    :return: The number of ratings written.
+    """
+    rnd = numpy.random.default_rng(seed)
+    os.makedirs(dataset_dir, exist_ok=True)
+    movies = _synthetic_movies(rnd, shape)
+    _write_synthetic_movies_csv(
+        os.path.join(dataset_dir, 'movies.csv'),
+        movies['ids'],
+        movies['years'],
+        [
+            [_SYNTHETIC_GENRES[i] for i in numpy.flatnonzero(has_genre)]
+            for has_genre in movies['genres']
+        ],
+    )
+    links_path = os.path.join(dataset_dir, 'links.csv')
+    with open(links_path, 'w', encoding='utf-8') as handle:
+        handle.write('movieId,imdbId,tmdbId\n')
+        for movie_id in movies['ids'].tolist():
+            handle.write(f'{movie_id},{movie_id * 7:07},{movie_id * 3}\n')
+    return _write_synthetic_ratings(dataset_dir, rnd, shape, movies)
+
+
+def _synthetic_movies(rnd, shape):
+    """Make the movies of a dataset for :func:`write_synthetic_dataset`.
+
+    :param rnd: A ``numpy.random.Generator``.
+    :param shape: A :class:`SyntheticShape`.
+    :return: A dict of arrays, each with one element per movie. "ids" holds
+        movie IDs, "years" holds years, or 0 if a movie's title has no year,
+        and "genres" is a boolean array with one column per element of
+        :data:`_SYNTHETIC_GENRES`.
+    """
+    movie_ids = numpy.cumsum(rnd.integers(1, 4, shape.movies))
+    years = numpy.clip(
+        2018 - rnd.exponential(shape.mean_age, shape.movies).astype(int),
+        1902,
+        2018,
+    )
+    has_year = rnd.random(shape.movies) >= 0.01
+    genre_weights = _power_law(
+        rnd,
+        len(_SYNTHETIC_GENRES),
+        shape.genre_exponent,
+    )
+    genres = numpy.zeros((shape.movies, len(_SYNTHETIC_GENRES)), dtype=bool)
+    for i, num_genres in enumerate(rnd.integers(1, 4, shape.movies)):
+        if rnd.random() < 0.01:
+            continue
+        genres[i, rnd.choice(
+            len(_SYNTHETIC_GENRES),
+            num_genres,
+            replace=False,
+            p=genre_weights,
+        )] = True
+    return {
+        'ids': movie_ids,
+        'years': numpy.where(has_year, years, 0),
+        'genres': genres,
+    }
+
+
+def _write_synthetic_ratings(dataset_dir, rnd, shape, movies):
+    """Write the "ratings.csv" and "tags.csv" files of a synthetic dataset.
+
+    :param dataset_dir: The directory to write the files to.
+    :param rnd: A ``numpy.random.Generator``.
+    :param shape: A :class:`SyntheticShape`.
+    :param movies: A dict of arrays, as returned by :func:`_synthetic_movies`.
+    :return: The number of ratings written.
+    """
+    num_written = 0
+    ratings_path = os.path.join(dataset_dir, 'ratings.csv')
+    tags_path = os.path.join(dataset_dir, 'tags.csv')
+    with open(ratings_path, 'w', encoding='utf-8') as ratings, \
+            open(tags_path, 'w', encoding='utf-8') as tags:
+        ratings.write('userId,movieId,rating,timestamp\n')
+        tags.write('userId,movieId,tag,timestamp\n')
+        for user_id, movie_ids, values in _synthetic_ratings(
+                rnd,
+                shape,
+                movies):
+            timestamps = rnd.integers(828000000, 1540000000, len(movie_ids))
+            ratings.writelines(
+                f'{user_id},{movie_id},{value},{timestamp}\n'
+                for movie_id, value, timestamp in zip(
+                    movie_ids.tolist(),
+                    values.tolist(),
+                    timestamps.tolist(),
+                )
+            )
+            # A user may have no ratings if shape.min_ratings is 0.
+            if len(movie_ids) and rnd.random() < 0.1:
+                tags.write(
+                    f'{user_id},{movie_ids[0]},'
+                    f'{rnd.choice(_SYNTHETIC_TAGS)},{timestamps[0]}\n'
+                )
+            num_written += len(movie_ids)
+    return num_written
+
+
+def _synthetic_ratings(rnd, shape, movies):
+    """Make each user's ratings for :func:`_write_synthetic_ratings`.
+
+    :param rnd: A ``numpy.random.Generator``.
+    :param shape: A :class:`SyntheticShape`.
+    :param movies: A dict of arrays, as returned by :func:`_synthetic_movies`.
+    :return: A generator which yields a ``(user_id, movie_ids, values)``
+        tuple per user, where ``movie_ids`` is a sorted array of the IDs of
+        the movies the user has rated, and ``values`` is an array of ratings.
+    """
+    log_popularity = numpy.log(
+        _power_law(rnd, shape.movies, shape.popularity_exponent)
+    )
+    quality = rnd.normal(0, 0.5, shape.movies)
+    ages = numpy.where(movies['years'] > 0, 1990 - movies['years'], 0)
+    num_ratings = numpy.minimum(
+        shape.min_ratings * (1 + rnd.pareto(shape.ratings_exponent,
+                                            shape.users)),
+        shape.movies,
+    ).astype(int)
+    for user_id, count in enumerate(num_ratings.tolist(), start=1):
+        chosen = _choose_movies(rnd, log_popularity, count)
+        values = 3.5 + rnd.normal(0, 0.5) + quality[chosen]
+        values += 0.5 * movies['genres'][
+            chosen,
+            rnd.integers(len(_SYNTHETIC_GENRES)),
+        ]
+        values += rnd.normal(0, 0.01) * ages[chosen]
+        values += rnd.normal(0, 0.7, count)
+        values = numpy.clip(numpy.round(values * 2) / 2, 0.5, 5)
+        yield user_id, movies['ids'][chosen], values
+
+
+def _choose_movies(rnd, log_popularity, count):
+    """Choose movies by popularity, without replacement.
+
+    See: https://en.wikipedia.org/wiki/Gumbel_distribution
+
+    :param rnd: A ``numpy.random.Generator``.
+    :param log_popularity: An array of the logarithms of each movie's
+        probability of being chosen.
+    :param count: The number of movies to choose.
+    :return: A sorted array of indices into ``log_popularity``.
+    """
+    keys = log_popularity + rnd.gumbel(size=len(log_popularity))
+    return numpy.sort(numpy.argpartition(-keys, count - 1)[:count])
+
+
+def _power_law(rnd, size, exponent):
+    """Make probabilities proportional to ``rank ** -exponent``.
+
+    :param rnd: A ``numpy.random.Generator``, which ranks the elements.
+    :param size: The number of probabilities.
+    :param exponent: A non-negative number.
+    :return: An array of probabilities, which sum to 1, in random order.
+    """
+    weights = rnd.permutation(size) + 1.0
+    weights **= -exponent
+    return weights / weights.sum()
+
+
+def _write_synthetic_movies_csv(path, movie_ids, years, genres):
+    """Write a "movies.csv" file for :func:`write_synthetic_dataset`.
+
+    :param path: The path to where the file should be written.
+    :param movie_ids: An array of movie IDs.
+    :param years: An array of years, one per movie. If 0, the movie's title
+        has no year.
+    :param genres: A list of lists of genre names, one per movie.
+    :return: Nothing.
+    """
+    with open(path, 'w', encoding='utf-8') as handle:
+        handle.write('movieId,title,genres\n')
+        for movie_id, year, genres_ in zip(
+                movie_ids.tolist(),
+                years.tolist(),
+                genres):
+            title = f'Movie {movie_id}'
+            if year:
+                title += f' ({year})'
+            genres_ = '|'.join(genres_) or '(no genres listed)'
+            handle.write(f'{movie_id},{title},{genres_}\n')
+
+
 def _write_links_csv(path):
     """Write a bogus "links.csv" file.
 
@@ -178,7 +425,7 @@ def _write_movies_csv(path):
     :param path: The path to where the bogus file should be written.
     :return: Nothing.
     """
-    with open(path, 'w') as handle:
+    with open(path, 'w', encoding='utf-8') as handle:
         handle.write('movieId,title,genres\n')
 
         # Movies users may have rated
@@ -241,3 +488,10 @@ def _write_tags_csv(path):
         handle.write('userId,movieId,tag,timestamp\n')
         handle.write('2,60756,funny,1445714994\n')
         handle.write('2,60756,Highly quotable,1445714996\n')
+
+
+_SYNTHETIC_GENRES = sorted(GENRES - {'(no genres listed)'})
+"""Genres given to movies by :func:`write_synthetic_dataset`."""
+
+_SYNTHETIC_TAGS = ('classic', 'funny', 'overrated', 'slow', 'twist ending')
+"""Tags written by :func:`write_synthetic_dataset`."""
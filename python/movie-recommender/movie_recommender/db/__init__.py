@@ -4,11 +4,20 @@
 There are *numerous* functions for working with Movie Recommender's database.
 The functions are split into themed modules, to ease the burden of navigation.
 
+Most functions in these modules call
+:func:`movie_recommender.db.common.get_db_conn` without arguments, and thereby
+share one long-lived connection per process. Opening a SQLite connection is
+cheap, but not *that* cheap: the item-item analysis issues several queries per
+pair of movies, and used to spend most of its time opening and closing
+connections.
+
 Many of the functions in this module return a set of results from the database,
 instead of a generator yielding results from the database. It's typically
 preferable to implement functions like this as a generator. But in SQLite,
-reads block writes, and keeping connections open will cause pending writes to
-time out.
+reads block writes, and keeping statements open will cause pending writes to
+time out. Databases are put in write-ahead logging mode, which lets readers and
+a writer proceed concurrently, but older databases and some file systems don't
+support that mode.
 
 A better solution is to implement such functions as generators, and to ask
 callers to worry about issues like immediately draining generators, or using
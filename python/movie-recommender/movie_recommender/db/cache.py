@@ -0,0 +1,135 @@
+# coding=utf-8
+"""A cache of top-n recommendations, in the "recommendations" table.
+
+Making recommendations for a user means predicting a rating for every movie
+they haven't rated. The result only changes when the data it's made from
+changes, so it's cached, keyed by user, algorithm, predictor and count.
+
+Cached recommendations are never deleted. Instead, each is stamped with the
+number of movies the user has rated, and with a version of the tables it was
+made from. Functions that write to those tables, such as the ones in
+:mod:`movie_recommender.db.write`, call :func:`bump_versions` in the same
+transaction. A cached entry whose stamp doesn't match the current stamp is
+stale, and it's replaced the next time it's requested.
+
+Exporting the similarity store doesn't change the stamp. The store rounds
+scores to single precision, which may change predicted ratings in their last
+digits, but not their order in practice.
+"""
+import json
+
+from movie_recommender.db import common, init
+from movie_recommender.predict.common import Prediction
+
+DEPENDENCIES = {
+    'ii': ('avgRatings', 'neighbours', 'ratings', 'similarities'),
+    'ml': ('predictors', 'ratings'),
+}
+"""The tables that each algorithm's recommendations are made from."""
+
+
+def bump_versions(conn, tables):
+    """Increment the versions of the given tables.
+
+    Call this in the same transaction as the writes to the tables, and create
+    the "tableVersions" table beforehand, with
+    :func:`movie_recommender.db.init.c_table_versions_table`.
+
+    :param conn: A sqlite3 ``Connection`` object.
+    :param tables: An iterable of table names.
+    :return: Nothing.
+    """
+    conn.executemany(
+        """
+        INSERT INTO tableVersions VALUES (?, 1)
+        ON CONFLICT (tableName) DO UPDATE SET version=version + 1
+        """,
+        ((table,) for table in tables),
+    )
+
+
+def recommendations(user, algorithm, predictor, count, recommend):
+    """Get cached recommendations, or make and cache them.
+
+    :param user: A user ID.
+    :param algorithm: A key from :data:`DEPENDENCIES`.
+    :param predictor: The type of predictor used to make recommendations, e.g.
+        "year", or an empty string if the algorithm doesn't use one.
+    :param count: The number of recommendations requested.
+    :param recommend: A function which accepts no arguments, and returns an
+        iterable of :class:`movie_recommender.predict.common.Prediction`
+        objects. Called if there are no fresh cached recommendations.
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects.
+    """
+    with common.get_db_conn() as conn:
+        init.c_recommendations_table(conn)
+        init.c_table_versions_table(conn)
+        # Stamp before making recommendations, so that if the data changes in
+        # the meantime, the entry is stale when next read.
+        stamp = _stamp(conn, user, algorithm)
+        key = (user, algorithm, predictor, count)
+        row = conn.execute(
+            """
+            SELECT ratings, version, predictions FROM recommendations
+            WHERE userId=? AND algorithm=? AND predictor=? AND count=?
+            """,
+            key,
+        ).fetchone()
+        if row is not None and tuple(row[:2]) == stamp:
+            return tuple(Prediction(*pred) for pred in json.loads(row[2]))
+
+        predictions = tuple(recommend())
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO recommendations VALUES '
+                '(?, ?, ?, ?, ?, ?, ?)',
+                key + stamp + (json.dumps([
+                    (float(pred.pred_rating), int(pred.movie), pred.reason)
+                    for pred in predictions
+                ]),),
+            )
+    return predictions
+
+
+def version():
+    """Get a version of all of the data in the database.
+
+    :return: The sum of the versions of every table with a version. It changes
+        whenever any table is written to by a function that calls
+        :func:`bump_versions`.
+    """
+    with common.get_db_conn() as conn:
+        init.c_table_versions_table(conn)
+        return _version(conn, ())
+
+
+def _stamp(conn, user, algorithm):
+    """Get the stamp of the data that a user's recommendations are made from.
+
+    :param conn: A sqlite3 ``Connection`` object.
+    :param user: A user ID.
+    :param algorithm: A key from :data:`DEPENDENCIES`.
+    :return: A ``(ratings, version)`` tuple, where ``ratings`` is the number of
+        movies the user has rated, and ``version`` is the sum of the versions
+        of the algorithm's :data:`DEPENDENCIES`. Versions only ever increase,
+        so the sum changes whenever any of them does.
+    """
+    ratings = conn.execute(
+        'SELECT COUNT(*) FROM ratings WHERE userId=?',
+        (user,),
+    ).fetchone()[0]
+    return (ratings, _version(conn, DEPENDENCIES[algorithm]))
+
+
+def _version(conn, tables):
+    """Get the sum of the versions of the given tables.
+
+    :param conn: A sqlite3 ``Connection`` object.
+    :param tables: A tuple of table names. If empty, every table.
+    :return: An integer.
+    """
+    query = 'SELECT COALESCE(SUM(version), 0) FROM tableVersions'
+    if tables:
+        query += f" WHERE tableName IN ({', '.join('?' * len(tables))})"
+    return conn.execute(query, tables).fetchone()[0]
@@ -1,6 +1,6 @@
 # coding=utf-8
 """Functions for calculating values with a database query."""
-from movie_recommender import exceptions
+from movie_recommender import exceptions, metrics
 from movie_recommender.db import common
 
 
@@ -44,3 +44,107 @@ def avg_user_rating(user):
             """,
             (user,)
         ).fetchone()[0]
+
+
+@metrics.timed('sql', 'avg_user_ratings')
+def avg_user_ratings(low, high, overwrite):
+    """Calculate the average of the movie ratings of a range of users.
+
+    :param low: A user ID. The lowest user ID in the range.
+    :param high: A user ID. The range stops just short of this user ID.
+    :param overwrite: If false, skip users already in the avgRatings table.
+    :return: A list of :class:`movie_recommender.db.common.AvgRating` objects.
+    """
+    missing = ''
+    if not overwrite:
+        missing = 'AND userId NOT IN (SELECT userId FROM avgRatings)'
+    query = f"""
+        SELECT userId, AVG(rating)
+        FROM ratings
+        WHERE userId >= ? AND userId < ?
+        {missing}
+        GROUP BY userId
+    """
+    with common.get_db_conn() as conn:
+        return [
+            common.AvgRating(*row)
+            for row in conn.execute(query, (low, high))
+        ]
+
+
+@metrics.timed('sql', 'weighted_ratings')
+def weighted_ratings(user, normalize=None):
+    """Calculate similarity-weighted sums of a user's ratings.
+
+    For each movie the user hasn't rated, sum the user's ratings of similar
+    movies, weighted by similarity. This is everything
+    :func:`movie_recommender.predict.ii.predict_rating` needs, calculated for
+    every movie with a single query. As with
+    :func:`movie_recommender.db.read.similar_movies_for_user`, a movie's
+    neighbours are used if it has a list of neighbours, and the similarities
+    table is used otherwise.
+
+    :param user: A user ID.
+    :param normalize: A function which is applied to each of the user's ratings
+        before they're summed, such as
+        :func:`movie_recommender.predict.ii.normalize_rating`. If ``None``,
+        ratings are summed as-is.
+    :return: A generator yielding tuples of the form ``(movie_id,
+        weighted_sum, abs_similarity_sum)``, where ``weighted_sum`` is the sum
+        of ``similarity * normalize(rating)``, and ``abs_similarity_sum`` is
+        the sum of ``abs(similarity)``. Only movies with at least one similar
+        rated movie are yielded.
+    """
+    query = """
+        WITH rated (movieId, rating) AS (
+            SELECT movieId, normalize(rating) FROM ratings WHERE userId = ?
+        ), similar (movieId, similarity, rating) AS (
+            SELECT similarities.movieBId, similarities.similarity, rated.rating
+            FROM rated
+            INNER JOIN similarities ON similarities.movieAId = rated.movieId
+            UNION ALL
+            SELECT similarities.movieAId, similarities.similarity, rated.rating
+            FROM rated
+            INNER JOIN similarities ON similarities.movieBId = rated.movieId
+        )
+        SELECT movieId, SUM(similarity * rating), SUM(ABS(similarity))
+        FROM similar
+        WHERE similarity != 0
+        AND movieId NOT IN (SELECT movieId FROM rated)
+        {unlisted}
+        GROUP BY movieId
+    """
+    neighbours_query = """
+        UNION ALL
+        SELECT
+            neighbours.movieId,
+            SUM(neighbours.similarity * rated.rating),
+            SUM(ABS(neighbours.similarity))
+        FROM rated
+        INNER JOIN neighbours ON neighbours.neighbourId = rated.movieId
+        WHERE neighbours.similarity != 0
+        AND neighbours.movieId NOT IN (SELECT movieId FROM rated)
+        GROUP BY neighbours.movieId
+    """
+    with common.get_db_conn() as conn:
+        conn.create_function(
+            'normalize',
+            1,
+            (lambda rating: rating) if normalize is None else normalize,
+        )
+        # Databases created by older versions of this application lack the
+        # neighbours table. See: movie_recommender.db.init.reindex()
+        if conn.execute(
+                """
+                SELECT 1 FROM sqlite_master
+                WHERE type = 'table' AND name = 'neighbours'
+                """).fetchone():
+            query = query.format(unlisted="""
+                AND NOT EXISTS (
+                    SELECT 1 FROM neighbours
+                    WHERE neighbours.movieId = similar.movieId
+                )
+            """) + neighbours_query
+        else:
+            query = query.format(unlisted='')
+        yield from conn.execute(query, (user,))
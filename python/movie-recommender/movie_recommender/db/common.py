@@ -2,48 +2,307 @@
 """Objects used by the other database management modules."""
 import contextlib
 import csv
+import os
 import sqlite3
+import threading
+import weakref
 from collections import namedtuple
 from pathlib import Path
 
+import numpy
 from xdg import BaseDirectory
 
 from movie_recommender import exceptions
-from movie_recommender.constants import DB_NAME, XDG_RESOURCE
+from movie_recommender.constants import (
+    CSV_CHUNK_BYTES,
+    DB_CACHED_STATEMENTS,
+    DB_MMAP_SIZE,
+    DB_NAME,
+    GENRE_BITS,
+    XDG_RESOURCE,
+)
 
 
 AvgRating = namedtuple('AvgRating', ('user_id', 'avg_rating'))
 """The average of a user's movie ratings."""
 
 
+MovieFeatures = namedtuple(
+    'MovieFeatures',
+    ('movie_ids', 'years', 'genres'),
+)
+"""Several movies' years and genre bitmasks, as parallel NumPy arrays.
+
+Years are floats, and movies without a year have a year of NaN. See
+:data:`movie_recommender.constants.GENRE_BITS`.
+"""
+
+
+Neighbour = namedtuple('Neighbour', ('movie', 'neighbour', 'score'))
+"""A movie, one of its most similar movies, and their similarity score."""
+
+
+RatedMovie = namedtuple('RatedMovie', ('year', 'genres', 'rating'))
+"""A movie's year and genre bitmask, and the rating a user gave to it.
+
+The year is ``None`` if the movie doesn't have one. See
+:data:`movie_recommender.constants.GENRE_BITS`.
+"""
+
+
 RatingPair = namedtuple('RatingPair', ('user_id', 'rating_a', 'rating_b'))
 """A pair of ratings that a user has given to a pair of movies."""
 
 
+UserPredictor = namedtuple('UserPredictor', ('user_id', 'predictor'))
+"""A user and the name of the predictor that works best for them."""
+
+
 Similarity = namedtuple('Similarity', ('movie_a', 'movie_b', 'score'))
 """A pair of movies and their similarity score."""
 
 
+SimilaritySums = namedtuple(
+    'SimilaritySums',
+    ('numerator', 'denominator_left', 'denominator_right', 'pairs'),
+)
+"""The sums from which a pair of movies' similarity score is computed."""
+
+
+_LOCAL = threading.local()
+"""This thread's persistent database connections.
+
+``conns`` is a dict of :class:`_PersistentConn` objects, keyed by the
+``db_path`` passed to :func:`get_persistent_db_conn`, and ``pid`` is the ID of
+the process that made it. See :func:`_thread_conns`.
+"""
+
+_PERSISTENT_CONNS = weakref.WeakSet()
+"""Every thread's :class:`_PersistentConn` objects.
+
+Lets :func:`close_db_conns` close connections opened by other threads.
+"""
+
+
+class _PersistentConn():
+    """A persistent connection to a database, re-opened when it goes stale.
+
+    The connection is closed when this object is garbage collected, e.g. when
+    the thread that made it exits, or when the interpreter exits.
+    """
+
+    def __init__(self, path):
+        """Remember the database to connect to.
+
+        :param path: The path to a SQLite 3 database.
+        """
+        self.path = path
+        self.conn = None
+        self.file_id = None
+        self._finalizer = None
+
+    def get(self):
+        """Get the connection, opening a new one if needed.
+
+        A new connection is opened if there's none, if it was closed, or if
+        the database's file was deleted or replaced since it was opened.
+
+        :return: A sqlite3 ``Connection`` object.
+        """
+        if (self._finalizer is None or not self._finalizer.alive or
+                _file_id(self.path) != self.file_id):
+            self.close()
+            self.conn = connect(self.path)
+            self.file_id = _file_id(self.path)
+            self._finalizer = weakref.finalize(
+                self,
+                _close_if_owner,
+                self.conn,
+                os.getpid(),
+            )
+        return self.conn
+
+    def close(self):
+        """Close the connection, if one is open.
+
+        :return: Nothing.
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+
+
+def _close_if_owner(conn, pid):
+    """Close a connection, if it was opened by this process.
+
+    A forked child inherits its parent's connections, and SQLite connections
+    must not be used, or closed, across a fork.
+
+    :param conn: A sqlite3 ``Connection`` object.
+    :param pid: The ID of the process that opened ``conn``.
+    :return: Nothing.
+    """
+    if os.getpid() == pid:
+        conn.close()
+
+
+def _file_id(path):
+    """Identify the file at the given path.
+
+    :param path: A path.
+    :return: A ``(device, inode)`` tuple, or ``None`` if there's no file.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _thread_conns():
+    """Get this thread's persistent connections.
+
+    :return: The dict held by :data:`_LOCAL`. If this process was forked, the
+        inherited dict is replaced by an empty one.
+    """
+    if getattr(_LOCAL, 'pid', None) != os.getpid():
+        _LOCAL.pid = os.getpid()
+        _LOCAL.conns = {}
+    return _LOCAL.conns
+
+
 @contextlib.contextmanager
 def get_db_conn(db_path=None):
     """Return a context manager which yields a database connection.
 
+    If ``db_path`` is ``None``, the connection yielded is this process'
+    persistent connection to Movie Recommender's database, as returned by
+    :func:`get_persistent_db_conn`. It is *not* closed when this context
+    manager exits, so that many short-lived calls to this function are cheap.
+
+    Otherwise, a new connection to ``db_path`` is opened, and it is closed when
+    this context manager exits.
+
     :param db_path: The path to a SQLite 3 database.
-    :return: A sqlite3 `Connection`_ object. It will automatically be closed
-        when this context manager exits.
+    :return: A sqlite3 `Connection`_ object.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
     if db_path is None:
-        db_path = get_load_path()
-    conn = sqlite3.connect(db_path)
+        yield get_persistent_db_conn()
+        return
+    conn = connect(db_path)
     try:
         yield conn
     finally:
         conn.close()
 
 
+def get_persistent_db_conn(db_path=None):
+    """Return this thread's long-lived connection to a database.
+
+    One connection is opened per thread and database, and it is re-used by
+    every subsequent call from the same thread with the same argument. This
+    lets the workers in a ``multiprocessing.Pool`` each keep one connection
+    open for their entire lifetime, instead of opening and closing a
+    connection for every query. A forked child doesn't use the connections it
+    inherits from its parent, as SQLite connections must not be used across a
+    fork.
+
+    A new connection is opened if the database's file has been deleted or
+    replaced since the connection was opened, e.g. by ``mr-db create``. A
+    connection is closed when the thread that opened it exits.
+
+    :param db_path: The path to a SQLite 3 database. If ``None``, the path
+        returned by :func:`get_load_path` is used. This lookup is done the
+        first time this thread asks for a connection.
+    :return: A sqlite3 `Connection`_ object. Don't close it. Instead, call
+        :func:`close_db_conns`.
+    :raises movie_recommender.exceptions.DatabaseNotFoundError: If
+        ``db_path`` is ``None`` and no database is found.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    conns = _thread_conns()
+    if db_path not in conns:
+        conns[db_path] = _PersistentConn(
+            get_load_path() if db_path is None else db_path
+        )
+        _PERSISTENT_CONNS.add(conns[db_path])
+    return conns[db_path].get()
+
+
+def close_db_conns():
+    """Close the persistent connections opened by this process's threads.
+
+    This is automatically done when the interpreter exits. Connections
+    inherited from a parent process are left alone, as they belong to the
+    parent.
+
+    :return: Nothing.
+    """
+    for persistent in list(_PERSISTENT_CONNS):
+        persistent.close()
+
+
+def connect(db_path):
+    """Open a new connection to a database, and tune it for this application.
+
+    More specifically:
+
+    * Let the connection cache up to
+      :data:`movie_recommender.constants.DB_CACHED_STATEMENTS` prepared
+      statements, so that repeatedly executing a query doesn't mean repeatedly
+      compiling it.
+    * Put the database in `write-ahead logging`_ mode, so that readers and
+      writers don't block each other. This setting is persistent, and
+      switching an existing database to this mode requires that no other
+      connections hold locks on it. If that isn't possible, the database is
+      left in its current mode.
+    * Let SQLite read the database through memory-mapped I/O. See
+      :data:`movie_recommender.constants.DB_MMAP_SIZE`.
+
+    :param db_path: The path to a SQLite 3 database.
+    :return: A sqlite3 `Connection`_ object.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    .. _write-ahead logging: https://www.sqlite.org/wal.html
+    """
+    # Connections are never shared between threads. But persistent connections
+    # may be closed by a thread other than the one that opened them. For
+    # example, a multiprocessing.Pool consumes its task iterable in a helper
+    # thread, close_db_conns() is called from the main thread, and a thread's
+    # connections are closed by whichever thread collects them once it exits.
+    conn = sqlite3.connect(
+        db_path,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+    except sqlite3.OperationalError:
+        pass
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    return conn
+
+
+def genre_bitmask(genres):
+    """Encode the given genres as a bitmask.
+
+    :param genres: An iterable of genre names, such as ``('Action',
+        'Comedy')``. Names not in :data:`movie_recommender.constants.GENRES`
+        are ignored.
+    :return: The sum of the genres' bits. See
+        :data:`movie_recommender.constants.GENRE_BITS`.
+    """
+    bitmask = 0
+    for genre in genres:
+        bitmask |= GENRE_BITS.get(genre, 0)
+    return bitmask
+
+
 def get_load_path():
     """Return the path to Movie Recommender's database.
 
@@ -97,3 +356,51 @@ def parse_csv(handle, caster=lambda fields: fields, header_rows=1):
         if current_line <= header_rows:
             continue
         yield caster(tuple(row))
+
+
+def parse_numeric_csv(handle, dtypes, header_rows=1):
+    """Read a CSV file of numbers, and yield chunks of parsed rows.
+
+    This is a fast alternative to :func:`parse_csv`, for use with large files.
+    Rather than parsing each row with a ``csv.reader`` and a Python callback,
+    it reads :data:`movie_recommender.constants.CSV_CHUNK_BYTES` at a time,
+    parses the whole chunk with NumPy, and casts each column in one pass.
+
+    Only simple files are supported: each field must be a number, and each
+    row must have one field per element of ``dtypes``. Blank lines are
+    ignored. The MovieLens
+    ``ratings.csv`` files meet these criteria. Numbers are parsed as doubles
+    before being cast, so integers must be smaller than 2**53.
+
+    :param handle: The handle to an input stream.
+    :param dtypes: A tuple of NumPy types, one per column, such as
+        ``(numpy.int64, numpy.float64)``.
+    :param header_rows: The number of header rows in the input file. Header
+        rows are ignored.
+    :return: A generator yielding lists of tuples, where each tuple represents
+        a row in the input file.
+    :raise: ``ValueError`` if a chunk of the file can't be parsed.
+    """
+    for _ in range(header_rows):
+        handle.readline()
+    while True:
+        lines = handle.readlines(CSV_CHUNK_BYTES)
+        if not lines:
+            break
+        rows = [line for line in map(str.strip, lines) if line]
+        if not rows:
+            continue
+        # Check each row's width, so that a row with extra fields can't spill
+        # over into a made-up row.
+        values = numpy.fromstring(','.join(rows), sep=',')
+        if values.size != len(rows) * len(dtypes) or any(
+                row.count(',') != len(dtypes) - 1 for row in rows):
+            raise ValueError(
+                f'Unable to parse {len(lines)} rows of CSV data into '
+                f'{len(dtypes)} numeric columns. First row: {lines[0]!r}'
+            )
+        values = values.reshape(-1, len(dtypes))
+        yield list(zip(*(
+            values[:, i].astype(dtype).tolist()
+            for i, dtype in enumerate(dtypes)
+        )))
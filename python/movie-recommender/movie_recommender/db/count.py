@@ -1,5 +1,6 @@
 # coding=utf-8
 """Functions for counting rows in the database."""
+from movie_recommender import metrics
 from movie_recommender.db import common
 
 
@@ -14,6 +15,18 @@ def avg_ratings():
         ).fetchone()[0]
 
 
+def nonzero_similarities():
+    """Count the non-zero similarity scores in the similarities table.
+
+    :return: An integer.
+    """
+    with common.get_db_conn() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM similarities WHERE similarity != 0'
+        ).fetchone()[0]
+
+
+@metrics.timed('sql', 'count_rating_pairs')
 def rating_pairs(movie_a, movie_b):
     """Count the number of rating pairs for the given movies.
 
@@ -53,6 +66,26 @@ def rating_pairs(movie_a, movie_b):
     return row[0]
 
 
+def ratings():
+    """Count the number of ratings in the current dataset.
+
+    :return: An integer.
+    """
+    with common.get_db_conn() as conn:
+        return conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0]
+
+
+def ratings_per_user():
+    """Count the number of ratings each user has given.
+
+    :return: A dict in the form ``{user_id: count}``.
+    """
+    with common.get_db_conn() as conn:
+        return dict(conn.execute(
+            'SELECT userId, COUNT(*) FROM ratings GROUP BY userId'
+        ))
+
+
 def unrated_movies(user_id):
     """Count the number of movies the given user hasn't rated.
 
@@ -1,9 +1,18 @@
 # coding=utf-8
 """Functions for initializing the database."""
+import time
+from collections import namedtuple
 from pathlib import Path
 
+import numpy
+
 from movie_recommender import datasets, exceptions
-from movie_recommender.db import common
+from movie_recommender.constants import GENRE_BITS, SIMILARITY_STORE_NAME
+from movie_recommender.db import common, read
+
+
+TableLoad = namedtuple('TableLoad', ('table', 'rows', 'seconds'))
+"""The number of rows loaded into a table, and how long it took."""
 
 
 def cpop_db(dataset):
@@ -16,9 +25,13 @@ def cpop_db(dataset):
       maps userId → predictorName.)
     * Populate the dataset tables.
 
+    While the database is being created, SQLite neither journals writes nor
+    waits for them to reach the disk. If this function is interrupted, the
+    database may be corrupt, and it should be re-created.
+
     :param dataset: The dataset to populate the new database with. Use one of
         the keys from :data:`movie_recommender.constants.DATASETS`.
-    :return: Nothing
+    :return: A tuple of :class:`TableLoad` objects, one per populated table.
     :raises DatabaseAlreadyExistsError: If the target database already exists.
     :raises DatasetAbsentError: If the referenced dataset isn't installed.
     """
@@ -38,27 +51,74 @@ def cpop_db(dataset):
             'installed.'.format(dataset)
         )
 
+    # A similarity store left over from a deleted database would be stale.
+    try:
+        Path(save_path.parent, SIMILARITY_STORE_NAME).unlink()
+    except FileNotFoundError:
+        pass
+
     # Create and populate a new database.
+    loads = []
     with common.get_db_conn(save_path) as conn:
-        cpop_links_table(
-            conn,
-            Path(installed_datasets[dataset], 'links.csv'),
-        )
-        cpop_movies_table(
-            conn,
-            Path(installed_datasets[dataset], 'movies.csv'),
-        )
-        cpop_ratings_table(
-            conn,
-            Path(installed_datasets[dataset], 'ratings.csv'),
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        for table, cpop_table in (
+                ('links', cpop_links_table),
+                ('movies', cpop_movies_table),
+                ('ratings', cpop_ratings_table),
+                ('tags', cpop_tags_table)):
+            start = time.perf_counter()
+            rows = cpop_table(
+                conn,
+                Path(installed_datasets[dataset], f'{table}.csv'),
+            )
+            loads.append(TableLoad(table, rows, time.perf_counter() - start))
+        start = time.perf_counter()
+        rows = cpop_movie_features_table(conn)
+        loads.append(
+            TableLoad('movieFeatures', rows, time.perf_counter() - start)
         )
-        cpop_tags_table(
-            conn,
-            Path(installed_datasets[dataset], 'tags.csv'),
+        start = time.perf_counter()
+        rows = cpop_movie_genres_table(conn)
+        loads.append(
+            TableLoad('movieGenres', rows, time.perf_counter() - start)
         )
         c_predictors_table(conn)
         c_similarities_table(conn)
+        c_similarity_sums_table(conn)
+        c_neighbours_table(conn)
         c_avg_ratings_table(conn)
+        c_recommendations_table(conn)
+        c_table_versions_table(conn)
+        c_analysis_ledger_table(conn)
+        c_indices(conn)
+        conn.execute('PRAGMA journal_mode=WAL')
+    return tuple(loads)
+
+
+def reindex():
+    """Create any missing indices and tables in the current database.
+
+    Databases created by older versions of this application lack some of the
+    indices created by :func:`c_indices`, and the tables created by
+    :func:`c_similarity_sums_table`, :func:`c_neighbours_table`,
+    :func:`cpop_movie_features_table`, :func:`cpop_movie_genres_table`,
+    :func:`c_recommendations_table`, :func:`c_table_versions_table` and
+    :func:`c_analysis_ledger_table`. Call this function to add them.
+
+    :return: Nothing.
+    :raise movie_recommender.exceptions.DatabaseNotFoundError: If no database
+        is found.
+    """
+    with common.get_db_conn() as conn:
+        c_similarity_sums_table(conn)
+        c_neighbours_table(conn)
+        cpop_movie_features_table(conn)
+        cpop_movie_genres_table(conn)
+        c_recommendations_table(conn)
+        c_table_versions_table(conn)
+        c_analysis_ledger_table(conn)
+        c_indices(conn)
 
 
 def cpop_links_table(connection, csv_path):
@@ -66,7 +126,7 @@ def cpop_links_table(connection, csv_path):
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``links.csv`` file.
-    :return: Nothing.
+    :return: The number of rows inserted.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
@@ -81,13 +141,13 @@ def cpop_links_table(connection, csv_path):
                 )
             """)
         with connection:
-            connection.executemany(
+            return connection.executemany(
                 'INSERT INTO links VALUES (?, ?, ?)',
                 common.parse_csv(
                     handle,
                     lambda fields: (int(fields[0]), fields[1], fields[2]),
                 )
-            )
+            ).rowcount
 
 
 def cpop_movies_table(connection, csv_path):
@@ -95,7 +155,7 @@ def cpop_movies_table(connection, csv_path):
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``movies.csv`` file.
-    :return: Nothing.
+    :return: The number of rows inserted.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
@@ -110,25 +170,123 @@ def cpop_movies_table(connection, csv_path):
                 )
             """)
         with connection:
-            connection.executemany(
+            return connection.executemany(
                 'INSERT INTO movies VALUES (?, ?, ?)',
                 common.parse_csv(
                     handle,
                     lambda fields: (int(fields[0]), fields[1], fields[2]),
                 )
+            ).rowcount
+
+
+def cpop_movie_features_table(connection):
+    """Create and populate the "movieFeatures" table, if it's incomplete.
+
+    Each row holds a movie's release year, and a bitmask of its genres, as
+    computed by :func:`movie_recommender.db.read.year` and
+    :func:`movie_recommender.db.common.genre_bitmask`. The year is NULL if the
+    movie's title doesn't include one. Computing these once lets predictors
+    compare many movies' features in one query, without parsing titles and
+    genre lists. The table is populated from the "movies" table, so it must be
+    populated first. Movies already in this table are left alone.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: The number of rows inserted.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS movieFeatures (
+                movieId INTEGER PRIMARY KEY,
+                year INTEGER,
+                genres INTEGER NOT NULL
+            )
+            """
+        )
+        rows = []
+        for movie_id, title, genres in connection.execute(
+                """
+                SELECT movieId, title, genres FROM movies WHERE movieId NOT IN
+                (SELECT movieId FROM movieFeatures)
+                """):
+            try:
+                year = read.year(title)
+            except exceptions.NoMovieYearError:
+                year = None
+            rows.append((
+                movie_id,
+                year,
+                common.genre_bitmask(genres.split('|')),
+            ))
+        return connection.executemany(
+            'INSERT INTO movieFeatures VALUES (?, ?, ?)',
+            rows,
+        ).rowcount
+
+
+def cpop_movie_genres_table(connection):
+    """Create and populate the "movieGenres" table, if it's incomplete.
+
+    This table is an inverted index of the genre bitmasks in the
+    "movieFeatures" table: it holds a ``(genre, movieId)`` row for each genre
+    of each movie, and its primary key is ordered by genre, so that the movies
+    in a genre can be found without scanning every movie. The table is
+    populated from the "movieFeatures" table, so that table must be populated
+    first. Movies already in this table are left alone.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: The number of rows inserted.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS movieGenres (
+                genre TEXT,
+                movieId INTEGER,
+                PRIMARY KEY (genre, movieId)
+            ) WITHOUT ROWID
+            """
+        )
+        rows = []
+        for movie_id, genres in connection.execute(
+                """
+                SELECT movieId, genres FROM movieFeatures WHERE movieId NOT IN
+                (SELECT movieId FROM movieGenres)
+                """):
+            rows.extend(
+                (genre, movie_id)
+                for genre, bit in GENRE_BITS.items()
+                if genres & bit
             )
+        return connection.executemany(
+            'INSERT INTO movieGenres VALUES (?, ?)',
+            rows,
+        ).rowcount
 
 
 def cpop_ratings_table(connection, csv_path):
     """Create and populate the "ratings" table.
 
+    The ratings file is by far the largest file in a dataset, so it is loaded
+    with :func:`movie_recommender.db.common.parse_numeric_csv`. The table's
+    unique index on ``(userId, movieId)`` is created after the rows are
+    inserted, as building an index in one pass is much faster than updating it
+    after every insert. This index serves as the table's primary key.
+
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``ratings.csv`` file.
-    :return: Nothing.
+    :return: The number of rows inserted.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
+    rows = 0
     with open(csv_path) as handle:
         with connection:
             connection.execute("""\
@@ -136,23 +294,22 @@ def cpop_ratings_table(connection, csv_path):
                     userId integer,
                     movieId integer,
                     rating real,
-                    timestamp integer,
-                    PRIMARY KEY (userId, movieId)
+                    timestamp integer
                 )
             """)
-        with connection:
-            connection.executemany(
-                'INSERT INTO ratings VALUES (?, ?, ?, ?)',
-                common.parse_csv(
+            for chunk in common.parse_numeric_csv(
                     handle,
-                    lambda fields: (
-                        int(fields[0]),
-                        int(fields[1]),
-                        float(fields[2]),
-                        int(fields[3]),
-                    )
-                )
-            )
+                    (numpy.int64, numpy.int64, numpy.float64, numpy.int64)):
+                rows += connection.executemany(
+                    'INSERT INTO ratings VALUES (?, ?, ?, ?)',
+                    chunk,
+                ).rowcount
+        with connection:
+            connection.execute("""\
+                CREATE UNIQUE INDEX ratingsPrimaryKey
+                ON ratings (userId, movieId)
+            """)
+    return rows
 
 
 def cpop_tags_table(connection, csv_path):
@@ -160,7 +317,7 @@ def cpop_tags_table(connection, csv_path):
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``tags.csv`` file.
-    :return: Nothing.
+    :return: The number of rows inserted.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
@@ -177,7 +334,7 @@ def cpop_tags_table(connection, csv_path):
                 )
             """)
         with connection:
-            connection.executemany(
+            return connection.executemany(
                 'INSERT INTO tags VALUES (?, ?, ?, ?)',
                 common.parse_csv(
                     handle,
@@ -188,7 +345,80 @@ def cpop_tags_table(connection, csv_path):
                         int(fields[3]),
                     )
                 )
-            )
+            ).rowcount
+
+
+def c_indices(connection):
+    """Create secondary indices, unless they already exist.
+
+    * ``ratings (movieId, userId, rating)`` lets queries for a movie's ratings,
+      like :func:`movie_recommender.db.read.rating_pairs`, read only the
+      relevant part of the index rather than scanning the ratings table.
+    * ``similarities (movieBId, movieAId, similarity)`` does the same for
+      queries that look up similarity scores by their second movie, like
+      :func:`movie_recommender.db.read.similar_movies_for_user`. The primary
+      key already serves lookups by the first movie.
+    * ``movieFeatures (year, movieId)`` serves queries that select movies by
+      release year, such as a range of years, or every movie with a year.
+
+    The indices include every column the queries read, so that the queries
+    needn't touch the tables at all.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS ratingsMovieId
+            ON ratings (movieId, userId, rating)
+            """
+        )
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS similaritiesMovieBId
+            ON similarities (movieBId, movieAId, similarity)
+            """
+        )
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS movieFeaturesYear
+            ON movieFeatures (year, movieId)
+            """
+        )
+
+
+def c_analysis_ledger_table(connection):
+    """Create the "analysisLedger" table, unless it already exists.
+
+    Each row records that a tile of pairs of movies has been analyzed by
+    ``mr-analyze ii``, and that its similarity scores have been written. Rows
+    are written in the same transaction as the scores. A run is identified by
+    a key, which changes whenever the tiles would. See
+    :func:`movie_recommender.analyze.ii.analyze_movies`.
+
+    Databases created by older versions of this application lack this table.
+    It's created when first needed.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysisLedger (
+                runKey TEXT,
+                tileId INTEGER,
+                PRIMARY KEY (runKey, tileId)
+            ) WITHOUT ROWID
+            """
+        )
 
 
 def c_avg_ratings_table(connection):
@@ -211,6 +441,46 @@ def c_avg_ratings_table(connection):
         )
 
 
+def c_neighbours_table(connection):
+    """Create the "neighbours" table, unless it already exists.
+
+    Where the "similarities" table stores a score for every pair of movies,
+    this table stores, for some movies, only the movies most similar to them.
+    It's populated by ``mr-analyze ii --top-k``. Each row holds a movie, one of
+    its neighbours, and their similarity score. Unlike the "similarities"
+    table, rows aren't symmetric: if movie 8 is among movie 5's neighbours,
+    movie 5 needn't be among movie 8's neighbours.
+
+    Rows are clustered by movie, so that fetching a movie's neighbours reads
+    one short range of the table. An index on ``(neighbourId, movieId,
+    similarity)`` serves the reverse lookup: which movies count a given movie
+    among their neighbours.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS neighbours (
+                movieId INTEGER,
+                neighbourId INTEGER CHECK(movieId != neighbourId),
+                similarity REAL,
+                PRIMARY KEY (movieId, neighbourId)
+            ) WITHOUT ROWID
+            """
+        )
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS neighboursNeighbourId
+            ON neighbours (neighbourId, movieId, similarity)
+            """
+        )
+
+
 def c_predictors_table(connection):
     """Create the "predictors" table.
 
@@ -231,6 +501,40 @@ def c_predictors_table(connection):
         )
 
 
+def c_recommendations_table(connection):
+    """Create the "recommendations" table, unless it already exists.
+
+    Each row caches a user's top recommendations, as made by an algorithm with
+    a predictor, along with the versions of the data they were made from. The
+    predictor is an empty string for algorithms without predictors. See
+    :mod:`movie_recommender.db.cache`.
+
+    Databases created by older versions of this application lack this table.
+    It's created when first needed.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recommendations (
+                userId INTEGER,
+                algorithm TEXT,
+                predictor TEXT,
+                count INTEGER,
+                ratings INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                predictions TEXT NOT NULL,
+                PRIMARY KEY (userId, algorithm, predictor, count)
+            )
+            """
+        )
+
+
 def c_similarities_table(connection):
     """Create the "similarities" table.
 
@@ -278,3 +582,65 @@ def c_similarities_table(connection):
             )
             """
         )
+
+
+def c_similarity_sums_table(connection):
+    """Create the "similaritySums" table, unless it already exists.
+
+    Each row holds the sums from which a pair of movies' similarity score is
+    computed, so that :mod:`movie_recommender.analyze.incremental` can update
+    the score as new ratings arrive, without re-reading every rating of both
+    movies. Like the "similarities" table, only pairs where ``movieAId <
+    movieBId`` are stored. ``denominatorLeft`` is the sum of squares for
+    ``movieAId``, and ``denominatorRight`` is the sum of squares for
+    ``movieBId``.
+
+    Databases created by older versions of this application lack this table.
+    It's created when first needed.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS similaritySums (
+                movieAId INTEGER,
+                movieBId INTEGER CHECK(movieAId < movieBId),
+                numerator REAL,
+                denominatorLeft REAL,
+                denominatorRight REAL,
+                pairs INTEGER,
+                PRIMARY KEY (movieAId, movieBId)
+            )
+            """
+        )
+
+
+def c_table_versions_table(connection):
+    """Create the "tableVersions" table, unless it already exists.
+
+    Each row holds a table's version: a number which is incremented whenever
+    the table is written to. See :mod:`movie_recommender.db.cache`.
+
+    Databases created by older versions of this application lack this table.
+    It's created when first needed.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tableVersions (
+                tableName TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            """
+        )
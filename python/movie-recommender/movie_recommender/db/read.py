@@ -1,8 +1,13 @@
 # coding=utf-8
 """Functions for reading rows from the database."""
-from movie_recommender import exceptions
-from movie_recommender.constants import YEAR_MATCHER
-from movie_recommender.db import common
+import contextlib
+import sqlite3
+
+import numpy
+
+from movie_recommender import exceptions, metrics
+from movie_recommender.constants import GENRE_BITS, YEAR_MATCHER
+from movie_recommender.db import common, store
 
 
 def all_movies():
@@ -15,6 +20,7 @@ def all_movies():
             yield row[0]
 
 
+@metrics.timed('sql', 'avg_rating')
 def avg_rating(user_id):
     """Get the average of a user's ratings, from the avgRatings table.
 
@@ -35,6 +41,63 @@ def avg_rating(user_id):
     return row[0]
 
 
+@metrics.timed('sql', 'avg_ratings')
+def avg_ratings():
+    """Yield every row in the avgRatings table.
+
+    :return: A generator yielding
+        :class:`movie_recommender.db.common.AvgRating` objects.
+    """
+    with common.get_db_conn() as conn:
+        for row in conn.execute('SELECT userId, avgRating FROM avgRatings'):
+            yield common.AvgRating(*row)
+
+
+@metrics.timed('sql', 'compared_movies')
+def compared_movies(movie_id):
+    """Get the movies for which a similarity with the given movie is computed.
+
+    :param movie_id: A movie ID.
+    :return: A set of movie IDs.
+    """
+    with common.get_db_conn() as conn:
+        compared = {
+            row[0] for row in conn.execute(
+                'SELECT movieBId FROM similarities WHERE movieAId=?',
+                (movie_id,),
+            )
+        }
+        compared.update(
+            row[0] for row in conn.execute(
+                'SELECT movieAId FROM similarities WHERE movieBId=?',
+                (movie_id,),
+            )
+        )
+    return compared
+
+
+def completed_tiles(run_key):
+    """Get the tiles that an analysis has recorded as complete.
+
+    :param run_key: The key of an analysis, as made by
+        :func:`movie_recommender.analyze.ii.run_key`.
+    :return: A set of tile IDs. Empty if the "analysisLedger" table doesn't
+        exist.
+    """
+    with common.get_db_conn() as conn:
+        try:
+            return {
+                row[0] for row in conn.execute(
+                    'SELECT tileId FROM analysisLedger WHERE runKey=?',
+                    (run_key,),
+                )
+            }
+        except sqlite3.OperationalError as err:
+            if 'no such table' not in str(err):
+                raise
+            return set()
+
+
 def genres(movie_id):
     """Get the genres of the given movie.
 
@@ -52,6 +115,90 @@ def genres(movie_id):
     return genres_strings[0].split('|')
 
 
+def movie_genres(movie_id):
+    """Get the genres of the given movie, as a bitmask.
+
+    :param movie_id: A movie ID.
+    :return: The sum of the bits of the given movie's genres. See
+        :data:`movie_recommender.constants.GENRE_BITS`.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    with common.get_db_conn() as conn, _movie_features_required():
+        row = conn.execute(
+            'SELECT genres FROM movieFeatures WHERE movieId=?',
+            (movie_id,)
+        ).fetchone()
+    if not row:
+        raise ValueError(f'Movie ID {movie_id} not in database.')
+    return row[0]
+
+
+def movie_year(movie_id):
+    """Get the release year of the given movie.
+
+    :param movie_id: A movie ID.
+    :return: The release year of the given movie.
+    :raise movie_recommender.exceptions.NoMovieYearError: If the given movie
+        doesn't have a release year.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    with common.get_db_conn() as conn, _movie_features_required():
+        row = conn.execute(
+            'SELECT year FROM movieFeatures WHERE movieId=?',
+            (movie_id,)
+        ).fetchone()
+    if not row:
+        raise ValueError(f'Movie ID {movie_id} not in database.')
+    if row[0] is None:
+        raise exceptions.NoMovieYearError(
+            f"Can't find year in title of movie {movie_id}."
+        )
+    return row[0]
+
+
+def movies_in_genre(genre):
+    """Get the IDs of the movies in the given genre.
+
+    :param genre: A genre name, as a string.
+    :return: A set of movie IDs.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieGenres" table.
+    """
+    with common.get_db_conn() as conn, _movie_features_required():
+        return {
+            row[0] for row in conn.execute(
+                'SELECT movieId FROM movieGenres WHERE genre=?',
+                (genre,),
+            )
+        }
+
+
+def neighbour_counts():
+    """Count the neighbours in each movie's list of neighbours.
+
+    :return: A dict in the form ``{movie_id: count}``, with an entry for each
+        movie that has a list of neighbours.
+    """
+    with common.get_db_conn() as conn:
+        return dict(conn.execute(
+            'SELECT movieId, COUNT(*) FROM neighbours GROUP BY movieId'
+        ))
+
+
+def movies_with_neighbours():
+    """Get the IDs of the movies that have a list of neighbours.
+
+    :return: A set of movie IDs.
+    """
+    with common.get_db_conn() as conn:
+        return {
+            row[0]
+            for row in conn.execute('SELECT DISTINCT movieId FROM neighbours')
+        }
+
+
 def predictor_name(user_id):
     """Get the personalized predictor name for the given user.
 
@@ -74,6 +221,15 @@ def predictor_name(user_id):
     return row[0]
 
 
+def predictor_names():
+    """Get the personalized predictor name of every user that has one.
+
+    :return: A dict in the form ``{user_id: predictor_name}``.
+    """
+    with common.get_db_conn() as conn:
+        return dict(conn.execute('SELECT userId, predictor FROM predictors'))
+
+
 def rated_movies(user_ids):
     """Get the IDs of the movies the given users have rated.
 
@@ -93,6 +249,79 @@ def rated_movies(user_ids):
         }
 
 
+def rated_movie_details(user_id):
+    """Get the year and genres of each movie the given user has rated.
+
+    :param user_id: A user ID.
+    :return: A dict in the form ``{movie_id: rated_movie}``, where
+        ``rated_movie`` is a :class:`movie_recommender.db.common.RatedMovie`.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    with common.get_db_conn() as conn, _movie_features_required():
+        return {
+            row[0]: common.RatedMovie(*row[1:])
+            for row in conn.execute(
+                """
+                SELECT movieId, movieFeatures.year, movieFeatures.genres,
+                    ratings.rating
+                FROM ratings JOIN movieFeatures USING (movieId)
+                WHERE ratings.userId=?
+                """,
+                (user_id,),
+            )
+        }
+
+
+def rated_in_genre(genre, user_id, forbidden_movie=None):
+    """Get whether each movie the given user has rated is in a genre.
+
+    :param genre: A genre name, as a string.
+    :param user_id: A user ID.
+    :param forbidden_movie: A movie ID. A movie to skip.
+    :return: A list of ``(in_genre, rating)`` tuples, where ``in_genre`` is 1
+        if the movie is in the given genre, and 0 otherwise.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    query = """
+            SELECT movieFeatures.genres & ? != 0, ratings.rating
+            FROM movieFeatures JOIN ratings USING (movieId)
+            WHERE ratings.userId=?
+            """
+    params = [GENRE_BITS.get(genre, 0), user_id]
+    if forbidden_movie:
+        query += 'AND movieId != ?'
+        params.append(forbidden_movie)
+    with common.get_db_conn() as conn, _movie_features_required():
+        return conn.execute(query, params).fetchall()
+
+
+def rated_years(user_id, forbidden_movie=None):
+    """Get the year of each movie the given user has rated, and the rating.
+
+    Movies without a year are skipped.
+
+    :param user_id: A user ID.
+    :param forbidden_movie: A movie ID. A movie to skip.
+    :return: A list of ``(year, rating)`` tuples.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    query = """
+            SELECT movieFeatures.year, ratings.rating
+            FROM movieFeatures JOIN ratings USING (movieId)
+            WHERE ratings.userId=? AND movieFeatures.year IS NOT NULL
+            """
+    params = [user_id]
+    if forbidden_movie:
+        query += 'AND movieId != ?'
+        params.append(forbidden_movie)
+    with common.get_db_conn() as conn, _movie_features_required():
+        return conn.execute(query, params).fetchall()
+
+
+@metrics.timed('sql', 'rating')
 def rating(user_id, movie_id):
     """Get the rating that the given user gave to the given movie.
 
@@ -101,16 +330,27 @@ def rating(user_id, movie_id):
     :return: A movie rating. (A float.)
     """
     with common.get_db_conn() as conn:
-        ratings = tuple(
+        values = tuple(
             row[0] for row in conn.execute(
                 'SELECT rating FROM ratings WHERE userId=? and movieId=?',
                 (user_id, movie_id)
             )
         )
-    assert len(ratings) == 1
-    return ratings[0]
+    assert len(values) == 1
+    return values[0]
+
 
+@metrics.timed('sql', 'ratings')
+def ratings():
+    """Yield every rating in the ratings table.
 
+    :return: A generator yielding ``(user_id, movie_id, rating)`` tuples.
+    """
+    with common.get_db_conn() as conn:
+        yield from conn.execute('SELECT userId, movieId, rating FROM ratings')
+
+
+@metrics.timed('sql', 'rating_pairs')
 def rating_pairs(movie_a, movie_b):
     """Yield pairs of ratings for the given movies.
 
@@ -164,9 +404,15 @@ def rating_pairs(movie_a, movie_b):
             yield common.RatingPair(row[0], row[1], row[2])
 
 
+@metrics.timed('sql', 'similar_movies_for_user')
 def similar_movies_for_user(movie, user):
     """Yield movies similar to ``movie`` that ``user`` has rated.
 
+    If ``movie`` has a list of neighbours, as created by ``mr-analyze ii
+    --top-k``, only those neighbours are considered. Otherwise, every movie
+    with a similarity score is considered, and scores are read from the
+    similarity store if there is one. See :mod:`movie_recommender.db.store`.
+
     .. NOTE:: A "similar" movie is one with a non-zero similarity score. This
         includes negative similarity scores!
 
@@ -175,8 +421,32 @@ def similar_movies_for_user(movie, user):
     :return: A generator yielding tuples of the form ``(movie_id,
         similarity)``.
     """
-    rated_movies_ = rated_movies((user,))
     with common.get_db_conn() as conn:
+        if _has_neighbours(conn, movie):
+            yield from conn.execute(
+                """
+                SELECT neighbours.neighbourId, neighbours.similarity
+                FROM neighbours
+                INNER JOIN ratings
+                ON ratings.userId = ?
+                AND ratings.movieId = neighbours.neighbourId
+                WHERE neighbours.movieId = ? AND neighbours.similarity != 0
+                """,
+                (user, movie),
+            )
+            return
+
+        rated_movies_ = rated_movies((user,))
+        store_ = store.get_store()
+        if store_ is not None:
+            neighbour_ids, scores = store_.neighbours(movie)
+            rated = numpy.isin(neighbour_ids, tuple(rated_movies_))
+            yield from zip(
+                neighbour_ids[rated].tolist(),
+                scores[rated].tolist(),
+            )
+            return
+
         # There's probably some clever technique for expressing the following
         # queries as a single SQL query.
         for row in conn.execute(
@@ -199,15 +469,66 @@ def similar_movies_for_user(movie, user):
                 yield row
 
 
+@contextlib.contextmanager
+def _movie_features_required():
+    """Raise a helpful error if the "movieFeatures" table is missing.
+
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If a query
+        made in this context fails because the table is missing.
+    """
+    try:
+        yield
+    except sqlite3.OperationalError as err:
+        # Databases created by older versions of this application lack the
+        # movieFeatures table. See: movie_recommender.db.init.reindex()
+        if 'no such table' in str(err):
+            raise exceptions.MissingMovieFeaturesError(
+                'The database lacks precomputed movie features. Please add '
+                'them with "mr-db reindex".'
+            ) from err
+        raise
+
+
+def _has_neighbours(conn, movie):
+    """Tell whether the given movie has a list of neighbours.
+
+    :param conn: A sqlite3 ``Connection`` object.
+    :param movie: A movie ID.
+    :return: ``True`` or ``False``.
+    """
+    try:
+        row = conn.execute(
+            'SELECT 1 FROM neighbours WHERE movieId = ? LIMIT 1',
+            (movie,),
+        ).fetchone()
+    except sqlite3.OperationalError as err:
+        # Databases created by older versions of this application lack the
+        # neighbours table. See: movie_recommender.db.init.reindex()
+        if 'no such table' in str(err):
+            return False
+        raise
+    return row is not None
+
+
+@metrics.timed('sql', 'similarity')
 def similarity(movie_a, movie_b):
     """Return the similarity score for the two given movies.
 
+    The score is read from the similarity store if the store holds it, and from
+    the database otherwise. See :mod:`movie_recommender.db.store`.
+
     :param movie_a: A movie ID.
     :param movie_b: A movie ID.
     :return: The similarity score for the pair of movies.
     :raise movie_recommender.exceptions.MissingSimilarityError: If no
         similarity score has been computed for this pair of movies.
     """
+    store_ = store.get_store()
+    if store_ is not None:
+        score = store_.similarity(movie_a, movie_b)
+        if score is not None:
+            return score
+
     movies = [movie_a, movie_b]
     movies.sort()
     with common.get_db_conn() as conn:
@@ -229,6 +550,30 @@ def similarity(movie_a, movie_b):
     return row[0]
 
 
+def similarity_sums(movie_a, movie_b):
+    """Return the sums from which the two given movies' similarity is computed.
+
+    :param movie_a: A movie ID.
+    :param movie_b: A movie ID.
+    :return: A :class:`movie_recommender.db.common.SimilaritySums`, or ``None``
+        if no sums have been stored for this pair of movies.
+    """
+    movies = [movie_a, movie_b]
+    movies.sort()
+    with common.get_db_conn() as conn:
+        row = conn.execute(
+            """
+            SELECT numerator, denominatorLeft, denominatorRight, pairs
+            FROM similaritySums
+            WHERE movieAId=? AND movieBId=?
+            """,
+            movies,
+        ).fetchone()
+    if not row:
+        return None
+    return common.SimilaritySums(*row)
+
+
 def title(movie_id):
     """Get the title of the given movie.
 
@@ -245,6 +590,31 @@ def title(movie_id):
     return row[0]
 
 
+def users_in_predictors():
+    """Get the ID of every user in the predictors table.
+
+    :return: A set of user IDs.
+    """
+    with common.get_db_conn() as conn:
+        return {
+            row[0]
+            for row in conn.execute('SELECT userId FROM predictors')
+        }
+
+
+def user_ratings(user_id):
+    """Get every rating the given user has given.
+
+    :param user_id: A user ID.
+    :return: A dict in the form ``{movie_id: rating}``.
+    """
+    with common.get_db_conn() as conn:
+        return dict(conn.execute(
+            'SELECT movieId, rating FROM ratings WHERE userId=?',
+            (user_id,),
+        ))
+
+
 def users():
     """Get the ID of every user.
 
@@ -269,6 +639,39 @@ def users_in_avg_ratings():
         }
 
 
+def unrated_movie_features(user_id):
+    """Get the features of each movie the given user hasn't rated.
+
+    :param user_id: A user ID.
+    :return: A :class:`movie_recommender.db.common.MovieFeatures`.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    with common.get_db_conn() as conn, _movie_features_required():
+        cursor = conn.execute(
+            """
+            SELECT movieId, year, genres FROM movieFeatures
+            WHERE movieId NOT IN
+            (SELECT movieId FROM ratings WHERE userId=?)
+            """,
+            (user_id,),
+        )
+        rows = numpy.array(
+            cursor.fetchall(),
+            dtype=[
+                ('movie_id', numpy.int64),
+                ('year', numpy.float64),  # A NULL year becomes NaN.
+                ('genres', numpy.int64),
+            ],
+        )
+    return common.MovieFeatures(
+        rows['movie_id'],
+        rows['year'],
+        rows['genres'],
+    )
+
+
+@metrics.timed('sql', 'unrated_movies')
 def unrated_movies(user_id):
     """Yield the ID of each movie the given user hasn't rated.
 
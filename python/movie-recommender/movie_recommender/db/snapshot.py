@@ -0,0 +1,334 @@
+# coding=utf-8
+"""A copy of the model's tables, in memory shared by a pool of processes.
+
+When work is spread across a ``multiprocessing.Pool``, each worker queries the
+database for the rows it needs, and reads the same rows as every other worker.
+A snapshot is loaded once, by the parent process, into
+``multiprocessing.shared_memory`` blocks. Workers are handed a
+:class:`SnapshotDescriptor`, which names the blocks, and they attach to the
+blocks rather than copying them. Every worker reads the same pages of memory,
+and tasks need only carry IDs.
+
+A snapshot holds named NumPy arrays. The loaders in this module produce the
+following groups of arrays. Each group is keyed by movie, like the similarity
+store in :mod:`movie_recommender.db.store`: ``*_movie_ids`` is a sorted array
+of movie IDs, and movie ``i``'s entries are elements ``*_offsets[i]`` to
+``*_offsets[i + 1]`` of the group's other arrays.
+
+======================  ======================================================
+Arrays                  Contents
+======================  ======================================================
+``ratings_*``           Each movie's ratings. ``ratings_user_ids`` is sorted
+                        per movie, and ``ratings_values`` holds the ratings.
+                        See :func:`load_ratings`.
+``avg_ratings``         Users' average ratings, indexed by user ID. See
+                        :func:`load_avg_ratings`.
+``neighbours_*``        Each movie's non-zero similarity scores.
+                        ``neighbours_ids`` is sorted per movie, and
+                        ``neighbours_scores`` holds the scores. See
+                        :func:`load_neighbours`.
+======================  ======================================================
+
+The snapshot is not updated when the database is written to. It's meant to
+live as long as one pool.
+"""
+import sqlite3
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy
+
+from movie_recommender import metrics
+from movie_recommender.db import common, count, read
+
+SnapshotDescriptor = namedtuple('SnapshotDescriptor', ('arrays',))
+"""The shared memory blocks behind a :class:`Snapshot`.
+
+``arrays`` is a tuple of ``(name, block_name, dtype, shape)`` tuples, where
+``dtype`` is a NumPy type string, such as ``'<f8'``. Descriptors are small, and
+cheap to pickle.
+"""
+
+
+class Snapshot():
+    """Named NumPy arrays in shared memory.
+
+    Create a snapshot with :meth:`create`, and attach to it from other
+    processes with :meth:`attach`. Arrays are read with ``snapshot[name]``.
+    Use a snapshot as a context manager to release its memory. The creator of
+    a snapshot also frees the blocks, so it must outlive the other processes'
+    use of it.
+    """
+
+    def __init__(self, arrays, blocks, owner):
+        """Initialize instance attributes.
+
+        :param arrays: A dict in the form ``{name: array}``, where each array
+            is a view of a block.
+        :param blocks: A dict in the form ``{name: block}``, where each block
+            is a ``multiprocessing.shared_memory.SharedMemory`` object. If
+            empty, the arrays may be ordinary arrays, and the snapshot is
+            private to this process.
+        :param owner: Whether this process created the blocks, and should free
+            them.
+        """
+        self._arrays = arrays
+        self._blocks = blocks
+        self._owner = owner
+
+    @classmethod
+    def create(cls, arrays):
+        """Copy arrays into new shared memory blocks.
+
+        :param arrays: A dict in the form ``{name: array}``.
+        :return: A new :class:`Snapshot`, which owns the blocks.
+        """
+        blocks = {}
+        views = {}
+        try:
+            for name, array in arrays.items():
+                array = numpy.ascontiguousarray(array)
+                # A block can't be empty.
+                block = shared_memory.SharedMemory(
+                    create=True,
+                    size=max(array.nbytes, 1),
+                )
+                blocks[name] = block
+                views[name] = numpy.ndarray(
+                    array.shape,
+                    array.dtype,
+                    buffer=block.buf,
+                )
+                views[name][...] = array
+        except BaseException:
+            cls(views, blocks, True).close()
+            raise
+        return cls(views, blocks, True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Attach to the shared memory blocks of an existing snapshot.
+
+        :param descriptor: A :class:`SnapshotDescriptor`.
+        :return: A new :class:`Snapshot`, which doesn't own the blocks.
+        """
+        blocks = {}
+        views = {}
+        for name, block_name, dtype, shape in descriptor.arrays:
+            blocks[name] = shared_memory.SharedMemory(name=block_name)
+            views[name] = numpy.ndarray(
+                shape,
+                numpy.dtype(dtype),
+                buffer=blocks[name].buf,
+            )
+            views[name].flags.writeable = False
+        return cls(views, blocks, False)
+
+    @property
+    def descriptor(self):
+        """Get a :class:`SnapshotDescriptor` for this snapshot."""
+        return SnapshotDescriptor(tuple(
+            (name, self._blocks[name].name, array.dtype.str, array.shape)
+            for name, array in self._arrays.items()
+        ))
+
+    def __getitem__(self, name):
+        """Get the array with the given name."""
+        return self._arrays[name]
+
+    def __contains__(self, name):
+        """Tell whether this snapshot holds an array with the given name."""
+        return name in self._arrays
+
+    def __enter__(self):
+        """Return this snapshot."""
+        return self
+
+    def __exit__(self, *args):
+        """Release this snapshot's memory. See :meth:`close`."""
+        self.close()
+
+    def close(self):
+        """Release this snapshot's memory.
+
+        This process stops using the blocks. If it created them, they're also
+        freed. Arrays read from this snapshot mustn't be used afterwards.
+
+        :return: Nothing.
+        """
+        self._arrays = {}
+        for block in self._blocks.values():
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._blocks = {}
+
+    def movie_ratings(self, movie):
+        """Get a movie's ratings.
+
+        :param movie: A movie ID.
+        :return: A tuple of two arrays, ``(user_ids, ratings)``. User IDs are
+            sorted. Both are empty if the movie has no ratings.
+        """
+        return self._entries('ratings', movie, 'user_ids', 'values')
+
+    def neighbours(self, movie):
+        """Get a movie's neighbours, i.e. its non-zero similarity scores.
+
+        :param movie: A movie ID.
+        :return: A tuple of two arrays, ``(neighbour_ids, scores)``. Neighbour
+            IDs are sorted. Both are empty if the movie has no neighbours.
+        """
+        return self._entries('neighbours', movie, 'ids', 'scores')
+
+    def _entries(self, group, movie, *names):
+        """Get a movie's entries in a group of arrays.
+
+        :param group: The prefix of the group's arrays, e.g. "ratings".
+        :param movie: A movie ID.
+        :param names: The suffixes of the arrays to slice.
+        :return: A tuple of array slices, one per name.
+        """
+        movie_ids = self._arrays[f'{group}_movie_ids']
+        i = numpy.searchsorted(movie_ids, movie)
+        if i == len(movie_ids) or movie_ids[i] != movie:
+            return tuple(self._arrays[f'{group}_{name}'][:0] for name in names)
+        offsets = self._arrays[f'{group}_offsets']
+        start, stop = offsets[i], offsets[i + 1]
+        return tuple(
+            self._arrays[f'{group}_{name}'][start:stop] for name in names
+        )
+
+
+def load_avg_ratings():
+    """Load users' average ratings, for a snapshot.
+
+    :return: A dict with an ``avg_ratings`` array, where the value at index
+        ``i`` is the average rating of the user with ID ``i``, as in
+        :func:`movie_recommender.analyze.ii.load_avg_ratings`. Users without an
+        average rating have a value of NaN.
+    """
+    avg_ratings = numpy.array(
+        [tuple(avg_rating) for avg_rating in read.avg_ratings()],
+        dtype=[('user', numpy.int64), ('avg_rating', numpy.float64)],
+    )
+    size = avg_ratings['user'].max() + 1 if len(avg_ratings) else 0
+    values = numpy.full(size, numpy.nan)
+    values[avg_ratings['user']] = avg_ratings['avg_rating']
+    return {'avg_ratings': values}
+
+
+def load_neighbours():
+    """Load each movie's non-zero similarity scores, for a snapshot.
+
+    The scores are those that
+    :func:`movie_recommender.db.read.similar_movies_for_user` considers. If a
+    movie has a list of neighbours, as created by ``mr-analyze ii --top-k``,
+    only those neighbours are loaded. Otherwise, every non-zero score in the
+    similarities table is loaded. Scores are read from the database, never
+    from the similarity store, so they aren't rounded.
+
+    :return: A dict of ``neighbours_*`` arrays.
+    """
+    with common.get_db_conn() as conn:
+        pairs = numpy.fromiter(
+            conn.execute(
+                """
+                SELECT movieAId, movieBId, similarity
+                FROM similarities
+                WHERE similarity != 0
+                """
+            ),
+            dtype=[('a', numpy.int64), ('b', numpy.int64),
+                   ('score', numpy.float64)],
+            count=count.nonzero_similarities(),
+        )
+        try:
+            lists = numpy.array(
+                conn.execute(
+                    'SELECT movieId, neighbourId, similarity FROM neighbours'
+                ).fetchall(),
+                dtype=[('a', numpy.int64), ('b', numpy.int64),
+                       ('score', numpy.float64)],
+            )
+        except sqlite3.OperationalError as err:
+            # Databases created by older versions of this application lack the
+            # neighbours table. See: movie_recommender.db.init.reindex()
+            if 'no such table' not in str(err):
+                raise
+            lists = numpy.array([], dtype=pairs.dtype)
+
+    movies = numpy.concatenate((pairs['a'], pairs['b']))
+    neighbour_ids = numpy.concatenate((pairs['b'], pairs['a']))
+    scores = numpy.concatenate((pairs['score'], pairs['score']))
+    # Movies with a list of neighbours ignore the similarities table.
+    keep = ~numpy.isin(movies, lists['a'])
+    nonzero = lists['score'] != 0
+    return group_entries(
+        'neighbours',
+        numpy.concatenate((movies[keep], lists['a'][nonzero])),
+        ids=numpy.concatenate((neighbour_ids[keep], lists['b'][nonzero])),
+        scores=numpy.concatenate((scores[keep], lists['score'][nonzero])),
+    )
+
+
+@metrics.timed('sql', 'load_ratings')
+def load_ratings(movies=None):
+    """Load every movie's ratings, for a snapshot.
+
+    :param movies: A sequence of movie IDs. If given, load only these movies'
+        ratings.
+    :return: A dict of ``ratings_*`` arrays. User IDs are stored as 32-bit
+        integers, and ratings as 32-bit floats, which represent every half-star
+        rating exactly.
+    """
+    dtype = [('movie', numpy.int64), ('user', numpy.int32),
+             ('rating', numpy.float32)]
+    with common.get_db_conn() as conn:
+        if movies is None:
+            rows = numpy.fromiter(
+                conn.execute('SELECT movieId, userId, rating FROM ratings'),
+                dtype=dtype,
+                count=count.ratings(),
+            )
+        else:
+            rows = numpy.fromiter(
+                conn.execute(
+                    f"""
+                    SELECT movieId, userId, rating FROM ratings
+                    WHERE movieId IN ({', '.join('?' * len(movies))})
+                    """,
+                    tuple(movies),
+                ),
+                dtype=dtype,
+            )
+    return group_entries(
+        'ratings',
+        rows['movie'],
+        user_ids=rows['user'],
+        values=rows['rating'],
+    )
+
+
+def group_entries(group, movies, **arrays):
+    """Sort entries by movie and then by ID, and index them by movie.
+
+    :param group: The prefix of the arrays' names, e.g. "ratings".
+    :param movies: An array of movie IDs, one per entry.
+    :param arrays: Arrays with one element per entry. The first is the array
+        of IDs that entries are sorted by within each movie.
+    :return: A dict of arrays, with ``{group}_movie_ids`` and
+        ``{group}_offsets`` arrays, and one array per element of ``arrays``.
+    """
+    ids = next(iter(arrays.values()))
+    order = numpy.lexsort((ids, movies))
+    movie_ids, starts = numpy.unique(movies[order], return_index=True)
+    grouped = {
+        f'{group}_movie_ids': movie_ids.astype(numpy.int64),
+        f'{group}_offsets': numpy.append(starts, len(movies)).astype(
+            numpy.int64,
+        ),
+    }
+    for name, array in arrays.items():
+        grouped[f'{group}_{name}'] = array[order]
+    return grouped
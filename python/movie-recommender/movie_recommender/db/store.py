@@ -0,0 +1,245 @@
+# coding=utf-8
+"""A read-only, memory-mapped copy of the similarities table.
+
+Reading similarity scores through SQLite costs a query per movie and a Python
+object per row. The similarity store is a flat binary file, exported from the
+similarities table by ``mr-db export-store``, which is memory-mapped and read
+as NumPy arrays. Every process that opens the store shares the same pages of
+the operating system's file cache, and reads copy nothing.
+
+The file consists of a header followed by four arrays, all in native byte
+order:
+
+======================  ==================================================
+Field                   Contents
+======================  ==================================================
+header                  :data:`MAGIC`, then the number of movies and the
+                        number of neighbours, as two ``uint64`` values.
+movie IDs               One ``int64`` per movie with at least one
+                        neighbour, sorted.
+offsets                 One ``int64`` per movie, plus one. Movie ``i``'s
+                        neighbours are entries ``offsets[i]`` to
+                        ``offsets[i + 1]`` of the next two arrays.
+neighbour IDs           One ``int32`` per neighbour. Sorted per movie.
+scores                  One ``float32`` per neighbour.
+======================  ==================================================
+
+Each pair of movies in the similarities table is stored twice, once for each
+movie, so a movie's neighbours are one contiguous slice. Pairs with a score of
+zero aren't stored, as they don't affect predictions. Scores are rounded to
+single precision.
+
+The store is a snapshot. Functions in :mod:`movie_recommender.db.write` that
+change the similarities table delete the store, and readers then fall back to
+the database.
+"""
+import mmap
+import os
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.constants import SIMILARITY_STORE_NAME
+from movie_recommender.db import common, count
+
+MAGIC = b'MRSIM001'
+"""The first bytes of every similarity store."""
+
+_HEADER = numpy.dtype([
+    ('magic', 'S8'),
+    ('num_movies', numpy.uint64),
+    ('num_neighbours', numpy.uint64),
+])
+
+_STORE = None
+"""A ``(path, stat_key, store)`` tuple, as cached by :func:`get_store`."""
+
+
+class SimilarityStore():
+    """A memory-mapped similarity store."""
+
+    def __init__(self, path):
+        """Map the given file into memory.
+
+        :param path: The path to a similarity store.
+        :raise movie_recommender.exceptions.InvalidSimilarityStoreError: If the
+            file isn't a valid similarity store.
+        """
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(
+                handle.fileno(),
+                0,
+                access=mmap.ACCESS_READ,
+            )
+        try:
+            header = numpy.frombuffer(self._mmap, _HEADER, 1)[0]
+        except ValueError as err:
+            raise exceptions.InvalidSimilarityStoreError(
+                f'{path} is too short to be a similarity store.'
+            ) from err
+        if header['magic'] != MAGIC:
+            raise exceptions.InvalidSimilarityStoreError(
+                f'{path} is not a similarity store.'
+            )
+        num_movies = int(header['num_movies'])
+        num_neighbours = int(header['num_neighbours'])
+        self._path = path
+        self._offset = _HEADER.itemsize
+        self.movie_ids = self._read_array(numpy.int64, num_movies)
+        self._offsets = self._read_array(numpy.int64, num_movies + 1)
+        self._neighbour_ids = self._read_array(numpy.int32, num_neighbours)
+        self._scores = self._read_array(numpy.float32, num_neighbours)
+
+    def _read_array(self, dtype, length):
+        """Read the next array from the store, without copying it."""
+        try:
+            array = numpy.frombuffer(self._mmap, dtype, length, self._offset)
+        except ValueError as err:
+            raise exceptions.InvalidSimilarityStoreError(
+                f'{self._path} is truncated.'
+            ) from err
+        self._offset += array.nbytes
+        return array
+
+    def neighbours(self, movie):
+        """Get the neighbours of a movie.
+
+        :param movie: A movie ID.
+        :return: A tuple of two arrays, ``(neighbour_ids, scores)``. The arrays
+            are read-only views of the store. Both are empty if the movie has
+            no neighbours.
+        """
+        i = numpy.searchsorted(self.movie_ids, movie)
+        if i == len(self.movie_ids) or self.movie_ids[i] != movie:
+            return self._neighbour_ids[:0], self._scores[:0]
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        return self._neighbour_ids[start:stop], self._scores[start:stop]
+
+    def similarity(self, movie_a, movie_b):
+        """Get the similarity score for a pair of movies.
+
+        :param movie_a: A movie ID.
+        :param movie_b: A movie ID.
+        :return: The similarity score, or ``None`` if the store lacks the
+            pair. As pairs with a score of zero aren't stored, ``None`` doesn't
+            mean that no score has been computed.
+        """
+        neighbour_ids, scores = self.neighbours(movie_a)
+        i = numpy.searchsorted(neighbour_ids, movie_b)
+        if i == len(neighbour_ids) or neighbour_ids[i] != movie_b:
+            return None
+        return float(scores[i])
+
+
+def get_path():
+    """Return the path to the similarity store.
+
+    The store sits beside the database, whether or not the store exists.
+
+    :return: A path.
+    :raise movie_recommender.exceptions.DatabaseNotFoundError: If no database
+        is found.
+    """
+    return os.path.join(
+        os.path.dirname(common.get_load_path()),
+        SIMILARITY_STORE_NAME,
+    )
+
+
+def get_store():
+    """Return this process' view of the similarity store, if there is one.
+
+    The store is mapped the first time this function is called, and the same
+    object is returned by later calls, until the file is replaced or deleted.
+
+    :return: A :class:`SimilarityStore`, or ``None`` if there's no store.
+    :raise movie_recommender.exceptions.InvalidSimilarityStoreError: If the
+        file isn't a valid similarity store.
+    """
+    global _STORE  # pylint:disable=global-statement
+    path = get_path() if _STORE is None else _STORE[0]
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _STORE = (path, None, None)
+        return None
+    stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _STORE is None or _STORE[1] != stat_key:
+        _STORE = (path, stat_key, SimilarityStore(path))
+    return _STORE[2]
+
+
+def invalidate():
+    """Delete the similarity store, if there is one.
+
+    Processes which have already mapped the store keep their view of it.
+
+    :return: Nothing.
+    """
+    try:
+        os.unlink(get_path())
+    except (FileNotFoundError, exceptions.DatabaseNotFoundError):
+        pass
+
+
+def export():
+    """Export the similarities table to a new similarity store.
+
+    :return: The number of neighbours written. Each non-zero score in the
+        similarities table yields two neighbours.
+    :raise movie_recommender.exceptions.DatabaseNotFoundError: If no database
+        is found.
+    """
+    path = get_path()
+    with common.get_db_conn() as conn:
+        pairs = numpy.fromiter(
+            conn.execute(
+                """
+                SELECT movieAId, movieBId, similarity
+                FROM similarities
+                WHERE similarity != 0
+                """
+            ),
+            dtype=[('a', numpy.int64), ('b', numpy.int64),
+                   ('score', numpy.float64)],
+            count=count.nonzero_similarities(),
+        )
+    return dump(path, pairs['a'], pairs['b'], pairs['score'])
+
+
+def dump(path, movies_a, movies_b, scores):
+    """Write a similarity store.
+
+    The store is written to a temporary file, which then replaces any existing
+    file at ``path``, so readers never see a partially written store.
+
+    :param path: Where to write the store.
+    :param movies_a: An array of movie IDs.
+    :param movies_b: An array of movie IDs, one per element of ``movies_a``.
+    :param scores: An array of non-zero similarity scores, one per pair of
+        movies.
+    :return: The number of neighbours written, i.e. twice the number of pairs.
+    """
+    movies = numpy.concatenate((movies_a, movies_b))
+    neighbour_ids = numpy.concatenate((movies_b, movies_a))
+    scores = numpy.concatenate((scores, scores))
+    order = numpy.lexsort((neighbour_ids, movies))
+    movies = movies[order]
+    movie_ids, starts = numpy.unique(movies, return_index=True)
+    offsets = numpy.append(starts, len(movies)).astype(numpy.int64)
+
+    header = numpy.array(
+        [(MAGIC, len(movie_ids), len(movies))],
+        dtype=_HEADER,
+    )
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        for array in (
+                header,
+                movie_ids.astype(numpy.int64),
+                offsets,
+                neighbour_ids[order].astype(numpy.int32),
+                scores[order].astype(numpy.float32)):
+            handle.write(array.tobytes())
+    os.replace(tmp_path, path)
+    return len(movies)
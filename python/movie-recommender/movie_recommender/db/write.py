@@ -4,11 +4,17 @@
 Some of the functions in this modules use UPSERT-style statements. SQLite added
 support for `UPSERT`_ in version 3.24.0, which was released on 2018-06-24.
 
+Each function increments the versions of the tables it writes to, so that
+cached recommendations made from the old rows are ignored. See
+:mod:`movie_recommender.db.cache`.
+
 .. _UPSERT: https://www.sqlite.org/lang_UPSERT.html
 """
-from movie_recommender.db import common
+from movie_recommender import metrics
+from movie_recommender.db import cache, common, init, store
 
 
+@metrics.timed('write', 'avgRatings')
 def avg_ratings(avg_ratings_):
     """Write user average ratings to the database.
 
@@ -16,7 +22,9 @@ def avg_ratings(avg_ratings_):
         :class:`movie_recommender.db.common.AvgRating` objects.
     """
     with common.get_db_conn() as conn:
+        init.c_table_versions_table(conn)
         with conn:
+            cache.bump_versions(conn, ('avgRatings',))
             values = (
                 avg_rating + (avg_rating.avg_rating,)
                 for avg_rating in avg_ratings_
@@ -30,16 +38,89 @@ def avg_ratings(avg_ratings_):
             )
 
 
-def similarities(similarities_):
+@metrics.timed('write', 'neighbours')
+def neighbours(movies, neighbours_):
+    """Replace movies' lists of neighbours.
+
+    :param movies: Movie IDs. The existing neighbours of these movies are
+        deleted.
+    :param neighbours_: An iterable of
+        :class:`movie_recommender.db.common.Neighbour` objects. Each object's
+        movie should be in ``movies``.
+    """
+    with common.get_db_conn() as conn:
+        init.c_table_versions_table(conn)
+        with conn:
+            cache.bump_versions(conn, ('neighbours',))
+            conn.executemany(
+                'DELETE FROM neighbours WHERE movieId=?',
+                ((movie,) for movie in movies),
+            )
+            conn.executemany(
+                'INSERT INTO neighbours VALUES (?, ?, ?)',
+                neighbours_,
+            )
+
+
+@metrics.timed('write', 'predictors')
+def predictors(predictors_):
+    """Write users' best predictors to the database.
+
+    :param predictors_: An iterable of
+        :class:`movie_recommender.db.common.UserPredictor` objects.
+    """
+    with common.get_db_conn() as conn:
+        init.c_table_versions_table(conn)
+        with conn:
+            cache.bump_versions(conn, ('predictors',))
+            conn.executemany(
+                """
+                INSERT INTO predictors VALUES (?, ?)
+                ON CONFLICT (userId) DO UPDATE SET predictor=excluded.predictor
+                """,
+                predictors_,
+            )
+
+
+def reset_ledger(run_key):
+    """Forget which tiles an analysis has completed.
+
+    :param run_key: The key of an analysis, as made by
+        :func:`movie_recommender.analyze.ii.run_key`.
+    """
+    with common.get_db_conn() as conn:
+        init.c_analysis_ledger_table(conn)
+        with conn:
+            conn.execute(
+                'DELETE FROM analysisLedger WHERE runKey=?',
+                (run_key,),
+            )
+
+
+@metrics.timed('write', 'similarities')
+def similarities(similarities_, run_key=None, tile_ids=()):
     """Write movies similarity scores to the database.
 
+    The similarity store, if any, is deleted, as it would otherwise be stale.
+
     :param similarities_: An iterable of
         :class:`movie_recommender.db.common.Similarity` objects.
+    :param run_key: The key of the analysis that computed the scores, as made
+        by :func:`movie_recommender.analyze.ii.run_key`. Optional.
+    :param tile_ids: The IDs of the tiles that the scores complete. They're
+        recorded in the "analysisLedger" table, in the same transaction as the
+        scores, so that they're recorded if and only if the scores are
+        written. Requires ``run_key``.
     """
+    store.invalidate()
     # SQLite added support for UPSERT in version 3.24.0, which was released on
     # 2018-06-24. See: https://www.sqlite.org/lang_UPSERT.html
     with common.get_db_conn() as conn:
+        init.c_table_versions_table(conn)
+        if tile_ids:
+            init.c_analysis_ledger_table(conn)
         with conn:
+            cache.bump_versions(conn, ('similarities',))
             conn.executemany(
                 """
                 INSERT INTO similarities VALUES (?, ?, ?)
@@ -47,6 +128,11 @@ def similarities(similarities_):
                 """,
                 _similarities_values(similarities_),
             )
+            if tile_ids:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO analysisLedger VALUES (?, ?)',
+                    ((run_key, tile_id) for tile_id in tile_ids),
+                )
 
 
 def _similarities_values(similarities_):
@@ -2,6 +2,13 @@
 """Custom exeptions for :mod:`movie_recommender`."""
 
 
+class BadRequestError(Exception):
+    """Indicates that a request made to a server is malformed.
+
+    See :mod:`movie_recommender.serve`.
+    """
+
+
 class DatabaseAlreadyExistsError(Exception):
     """Indicates that a database already exists when it shouldn't.
 
@@ -28,10 +35,26 @@ class EmptyGraphError(Exception):
     """Indicates that a graph is empty."""
 
 
+class InvalidSimilarityStoreError(Exception):
+    """Indicates that a file isn't a valid similarity store.
+
+    See :mod:`movie_recommender.db.store`.
+    """
+
+
 class MissingAverageRatingError(Exception):
     """Indicates that the average of a user's ratings hasn't been computed."""
 
 
+class MissingMovieFeaturesError(Exception):
+    """Indicates that the database lacks precomputed movie features.
+
+    That is, the "movieFeatures" or "movieGenres" table. Databases created by
+    older versions of this application lack these tables.
+    See :func:`movie_recommender.db.init.reindex`.
+    """
+
+
 class MissingSimilarityError(Exception):
     """Indicates that similarity hasn't been computed for a pair of movies."""
 
@@ -2,9 +2,23 @@
 """Tools for working with a cartesian graph."""
 from collections import namedtuple
 
+import numpy
+
 from movie_recommender import exceptions
 
 
+Moments = namedtuple(
+    'Moments',
+    ('count', 'avg_x', 'avg_y', 'ss_x', 'ss_y', 'ss_xy'),
+)
+"""A summary of the points on a cartesian graph.
+
+``ss_x`` and ``ss_y`` are the sums of squared deviations from ``avg_x`` and
+``avg_y``, and ``ss_xy`` is the sum of the products of those deviations. See
+:class:`StreamingGraph`.
+"""
+
+
 Point = namedtuple('Point', ('x', 'y'))
 """A point on a cartesian graph."""
 
@@ -137,3 +151,306 @@ class Graph():
             error = point.y - self.predict_y(point.x)
             sse += error ** 2
         return sse
+
+
+class ArrayGraph():
+    """A cartesian graph, backed by arrays of coordinates.
+
+    This is a vectorized alternative to :class:`Graph`, with the same
+    interface. Rather than a tuple of :class:`Point` objects, it stores the x
+    and y coordinates of its points in a pair of contiguous float64 arrays,
+    and it computes its line of best fit and SSE with NumPy.
+    """
+
+    def __init__(self, x, y):
+        """Initialize instance attributes.
+
+        :param x: An array-like of x coordinates, such as a list or NumPy
+            array.
+        :param y: An array-like of y coordinates, the same length as ``x``.
+        :raise: ``ValueError`` if ``x`` and ``y`` have different shapes.
+        """
+        self._x = numpy.ascontiguousarray(x, dtype=numpy.float64)
+        self._y = numpy.ascontiguousarray(y, dtype=numpy.float64)
+        if self._x.shape != self._y.shape:
+            raise ValueError(
+                f'Got {self._x.shape} x coordinates and {self._y.shape} y '
+                'coordinates.'
+            )
+        self._avg_point = None
+        self._slope = None
+        self._y_intercept = None
+        self._sse = None
+
+    @property
+    def x(self):
+        """Get the x coordinates of the points on this graph."""
+        return self._x
+
+    @property
+    def y(self):
+        """Get the y coordinates of the points on this graph."""
+        return self._y
+
+    @property
+    def points(self):
+        """Get the points on this graph.
+
+        :returns: A tuple of :class:`Point` objects.
+        """
+        return tuple(
+            Point(*point)
+            for point in zip(self.x.tolist(), self.y.tolist())
+        )
+
+    @property
+    def avg_point(self):
+        """Get the average point on this graph.
+
+        :returns: The average of all points on this graph.
+        :rtype: Point
+        :raise movie_recommender.exceptions.EmptyGraphError: If this graph is
+            empty.
+        """
+        if self._avg_point is None:
+            if not self.x.size:
+                raise exceptions.EmptyGraphError(
+                    "Can't calculate the average point of an empty graph."
+                )
+            self._avg_point = Point(
+                float(self.x.mean()),
+                float(self.y.mean()),
+            )
+        return self._avg_point
+
+    @property
+    def slope(self):
+        """Get the slope of this graph.
+
+        :returns: The "m" term of the following formula: ``y = mx + b``.
+        :raise movie_recommender.exceptions.EmptyGraphError: If this graph is
+            empty.
+        :raise movie_recommender.exceptions.VerticalLineOfBestFitGraphError: If
+            this graph's slope is vertical.
+        """
+        if self._slope is None:
+            avg_point = self.avg_point
+            # All points having the same x is checked for explicitly, because
+            # rounding errors in the average can leave the denominator above
+            # zero.
+            if self.x.min() == self.x.max():
+                raise exceptions.VerticalLineOfBestFitGraphError(
+                    "This graph's line of best fit is vertical. As a result, "
+                    "its slope can't be calculated."
+                )
+            # m = sumOfAll((Xi - Xavg) * (Yi - Yavg)) / sumOfAll((Xi - Xavg)^2)
+            x_deviations = self.x - avg_point.x
+            numerator = x_deviations @ (self.y - avg_point.y)
+            denominator = x_deviations @ x_deviations
+            self._slope = float(numerator / denominator)
+        return self._slope
+
+    @property
+    def y_intercept(self):
+        """Return the y intercept of this graph.
+
+        :returns: The "b" term of the following formula: ``y = mx + b``.
+        """
+        if self._y_intercept is None:
+            avg_point = self.avg_point
+            self._y_intercept = avg_point.y - avg_point.x * self.slope
+        return self._y_intercept
+
+    def predict_y(self, x):
+        """Predict y according to the line of best fit.
+
+        :param x: The x coordinate of a point along the line of best fit, or a
+            NumPy array of x coordinates.
+        :returns: The corresponding y coordinate of a point along the line of
+            best fit, or a NumPy array of y coordinates.
+        """
+        # y = mx + b
+        return self.slope * x + self.y_intercept
+
+    @property
+    def sse(self):
+        """Get the sum of squared errors for this graph."""
+        if self._sse is None:
+            if self.x.size:
+                errors = self.y - self.predict_y(self.x)
+                self._sse = float(errors @ errors)
+            else:
+                self._sse = 0
+        return self._sse
+
+
+class StreamingGraph():
+    """A cartesian graph, summarized by running moments.
+
+    This is an alternative to :class:`Graph` for graphs too large to hold in
+    memory. Points are added in batches, and are then discarded. Only six
+    numbers are kept: the number of points, the average point, the sums of
+    squared deviations from the average x and y, and the sum of the products of
+    those deviations. These are enough to calculate the line of best fit and
+    the SSE.
+
+    Two graphs can be merged, e.g. after different processes have summarized
+    different parts of a file. Batches are summarized and merged with the
+    pairwise algorithm of Chan, Golub and LeVeque, which is less prone to
+    rounding errors than keeping sums of squares.
+    """
+
+    def __init__(self):
+        """Initialize instance attributes."""
+        self._count = 0
+        self._avg_x = 0.0
+        self._avg_y = 0.0
+        self._ss_x = 0.0  # sumOfAll((Xi - Xavg)^2)
+        self._ss_y = 0.0  # sumOfAll((Yi - Yavg)^2)
+        self._ss_xy = 0.0  # sumOfAll((Xi - Xavg) * (Yi - Yavg))
+
+    @property
+    def moments(self):
+        """Get the moments which summarize the points on this graph.
+
+        :rtype: Moments
+        """
+        return Moments(
+            self._count,
+            self._avg_x,
+            self._avg_y,
+            self._ss_x,
+            self._ss_y,
+            self._ss_xy,
+        )
+
+    def add_points(self, x, y):
+        """Add points to this graph.
+
+        :param x: An array-like of x coordinates, such as a list or NumPy
+            array.
+        :param y: An array-like of y coordinates, the same length as ``x``.
+        :return: Nothing.
+        :raise: ``ValueError`` if ``x`` and ``y`` have different shapes.
+        """
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        if x.shape != y.shape:
+            raise ValueError(
+                f'Got {x.shape} x coordinates and {y.shape} y coordinates.'
+            )
+        if not x.size:
+            return
+        # If all x are the same, then x[0] is exactly their average, whereas
+        # x.mean() may be off by a rounding error, which would make a vertical
+        # line of best fit look merely steep.
+        avg_x = float(x[0]) if x.min() == x.max() else float(x.mean())
+        avg_y = float(y.mean())
+        x_deviations = x - avg_x
+        y_deviations = y - avg_y
+        self._merge_moments(Moments(
+            x.size,
+            avg_x,
+            avg_y,
+            float(x_deviations @ x_deviations),
+            float(y_deviations @ y_deviations),
+            float(x_deviations @ y_deviations),
+        ))
+
+    def merge(self, other):
+        """Add the points on another graph to this graph.
+
+        :param other: A :class:`StreamingGraph`.
+        :return: Nothing.
+        """
+        self._merge_moments(other.moments)
+
+    def _merge_moments(self, moments):
+        """Add the points summarized by the given :class:`Moments`."""
+        if not moments.count:
+            return
+        if not self._count:
+            (
+                self._count,
+                self._avg_x,
+                self._avg_y,
+                self._ss_x,
+                self._ss_y,
+                self._ss_xy,
+            ) = moments
+            return
+        count = self._count + moments.count
+        delta_x = moments.avg_x - self._avg_x
+        delta_y = moments.avg_y - self._avg_y
+        weight = self._count * moments.count / count
+        self._ss_x += moments.ss_x + delta_x ** 2 * weight
+        self._ss_y += moments.ss_y + delta_y ** 2 * weight
+        self._ss_xy += moments.ss_xy + delta_x * delta_y * weight
+        self._avg_x += delta_x * moments.count / count
+        self._avg_y += delta_y * moments.count / count
+        self._count = count
+
+    @property
+    def avg_point(self):
+        """Get the average point on this graph.
+
+        :returns: The average of all points on this graph.
+        :rtype: Point
+        :raise movie_recommender.exceptions.EmptyGraphError: If this graph is
+            empty.
+        """
+        if not self._count:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the average point of an empty graph."
+            )
+        return Point(self._avg_x, self._avg_y)
+
+    @property
+    def slope(self):
+        """Get the slope of this graph.
+
+        :returns: The "m" term of the following formula: ``y = mx + b``.
+        :raise movie_recommender.exceptions.EmptyGraphError: If this graph is
+            empty.
+        :raise movie_recommender.exceptions.VerticalLineOfBestFitGraphError: If
+            this graph's slope is vertical.
+        """
+        if not self._count:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the slope of an empty graph."
+            )
+        if self._ss_x == 0:
+            raise exceptions.VerticalLineOfBestFitGraphError(
+                "This graph's line of best fit is vertical. As a result, its "
+                "slope can't be calculated."
+            )
+        return self._ss_xy / self._ss_x
+
+    @property
+    def y_intercept(self):
+        """Return the y intercept of this graph.
+
+        :returns: The "b" term of the following formula: ``y = mx + b``.
+        """
+        avg_point = self.avg_point
+        return avg_point.y - avg_point.x * self.slope
+
+    def predict_y(self, x):
+        """Predict y according to the line of best fit.
+
+        :param x: The x coordinate of a point along the line of best fit, or a
+            NumPy array of x coordinates.
+        :returns: The corresponding y coordinate of a point along the line of
+            best fit, or a NumPy array of y coordinates.
+        """
+        # y = mx + b
+        return self.slope * x + self.y_intercept
+
+    @property
+    def sse(self):
+        """Get the sum of squared errors for this graph."""
+        if not self._count:
+            return 0
+        # sumOfAll((Yi - (m * Xi + b))^2) = Syy - m * Sxy, where m = Sxy / Sxx.
+        # Rounding errors can leave the difference slightly below zero.
+        return max(self._ss_y - self.slope * self._ss_xy, 0.0)
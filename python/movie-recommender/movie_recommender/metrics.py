@@ -0,0 +1,333 @@
+# coding=utf-8
+"""Timers and counters that show where the time goes.
+
+Metrics are kept per process, and keyed by a family and a label. There are two
+kinds of metrics:
+
+* Timers, which count calls and add up the seconds they take. Families are
+  "phase" (labelled by pipeline phase, e.g. "analyze_movies"), "sql" (by type
+  of query, e.g. "rating_pairs"), "write" (by table written to), and "worker"
+  (by pool, the time its workers spent busy). The item-item analysis reads
+  ratings a tile at a time ("load_ratings"), or all at once for the matrix
+  engine ("ratings"), and reads users' average ratings once per process
+  ("avg_ratings"). It doesn't run the per-pair queries "rating_pairs",
+  "avg_rating" and "similarity", which ``mr-db ingest`` and predictions run.
+* Counters, which add up numbers. Families are units of work done by a phase,
+  e.g. "pairs" or "movies", and "capacity", the number of seconds that each
+  pool's workers could have spent busy.
+
+Functions are timed with :func:`timed` and blocks of code with :func:`timer`.
+Work done by a pool's workers is wrapped with :func:`measured`, and their
+results are unwrapped with :func:`collect`, which merges the workers' metrics
+into this process's. Once a pipeline is done, its metrics are summarized by
+:func:`stats`, or written out by :func:`write_prometheus`.
+
+Timing a call takes well under a microsecond, which is negligible next to a
+SQL query, so metrics are always recorded.
+"""
+import contextlib
+import functools
+import inspect
+import os
+import time
+
+PROMETHEUS_PREFIX = 'movie_recommender'
+"""The prefix of the names of metrics written by :func:`write_prometheus`."""
+
+_TIMER_LABELS = {
+    'phase': 'phase',
+    'sql': 'query',
+    'worker': 'pool',
+    'write': 'table',
+}
+"""The families of timers, and the name of each family's label."""
+
+_TIMERS = {}
+"""A dict in the form ``{(family, label): [calls, seconds]}``."""
+
+_COUNTERS = {}
+"""A dict in the form ``{(family, label): value}``."""
+
+_PID = os.getpid()
+"""The ID of the process that recorded the metrics.
+
+A forked worker process inherits its parent's metrics. They're discarded when
+the worker first records its own. See :func:`_call_measured`.
+"""
+
+
+def add_time(family, label, seconds, calls=1):
+    """Add time to a timer.
+
+    :param family: A key from :data:`_TIMER_LABELS`, e.g. "sql".
+    :param label: The timer's label, e.g. "rating_pairs".
+    :param seconds: The number of seconds to add.
+    :param calls: The number of calls to add.
+    :return: Nothing.
+    """
+    timer_ = _TIMERS.setdefault((family, label), [0, 0.0])
+    timer_[0] += calls
+    timer_[1] += seconds
+
+
+def count(family, label, value=1):
+    """Add to a counter.
+
+    :param family: The counter's family, e.g. "pairs".
+    :param label: The counter's label, e.g. "analyze_movies".
+    :param value: The number to add.
+    :return: Nothing.
+    """
+    _COUNTERS[(family, label)] = _COUNTERS.get((family, label), 0) + value
+
+
+@contextlib.contextmanager
+def timer(family, label):
+    """Time a block of code, with the timer of the given family and label.
+
+    :param family: A key from :data:`_TIMER_LABELS`, e.g. "phase".
+    :param label: The timer's label, e.g. "analyze_movies".
+    :return: A context manager.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(family, label, time.perf_counter() - start)
+
+
+def timed(family, label):
+    """Make a decorator which times each call of a function.
+
+    If the function is a generator function, only the time spent producing
+    values is counted, and not the time the caller spends consuming them.
+
+    :param family: A key from :data:`_TIMER_LABELS`, e.g. "sql".
+    :param label: The timer's label, e.g. "rating_pairs".
+    :return: A decorator.
+    """
+    def decorator(func):
+        if not inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    add_time(family, label, time.perf_counter() - start)
+            return wrapper
+
+        @functools.wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            elapsed = 0.0
+            gen = func(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        value = next(gen)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield value
+            finally:
+                gen.close()
+                add_time(family, label, elapsed)
+        return gen_wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def pool(label, processes):
+    """Count the capacity of a pool of processes, while it's in use.
+
+    The capacity is the number of processes times the time spent in the
+    ``with`` block. Comparing it to the time the workers spent busy, as timed
+    by :func:`measured`, tells how well the pool was used.
+
+    :param label: The pool's label, e.g. "analyze_movies".
+    :param processes: The number of processes in the pool.
+    :return: A context manager.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        count('capacity', label, processes * (time.perf_counter() - start))
+
+
+def measured(func, label):
+    """Wrap a function that's called by a pool's workers.
+
+    The wrapper times each call with the "worker" timer of the given label,
+    and returns a ``(result, metrics)`` tuple, where ``metrics`` are the ones
+    the worker has recorded since its last call. Pass the results to
+    :func:`collect`.
+
+    :param func: A function, which must be picklable.
+    :param label: The pool's label, e.g. "analyze_movies".
+    :return: A picklable function.
+    """
+    return functools.partial(_call_measured, func, label)
+
+
+def _call_measured(func, label, *args):
+    """Call a function, as wrapped by :func:`measured`."""
+    if _PID != os.getpid():
+        reset()
+    with timer('worker', label):
+        result = func(*args)
+    return result, drain()
+
+
+def collect(results):
+    """Unwrap the results of a function wrapped by :func:`measured`.
+
+    :param results: An iterable of ``(result, metrics)`` tuples.
+    :return: A generator which yields each result, and merges its metrics into
+        this process's.
+    """
+    for result, metrics in results:
+        merge(metrics)
+        yield result
+
+
+def drain():
+    """Get this process's metrics, and forget them.
+
+    :return: A picklable object, which may be passed to :func:`merge`.
+    """
+    metrics = (dict(_TIMERS), dict(_COUNTERS))
+    reset()
+    return metrics
+
+
+def merge(metrics):
+    """Add metrics from another process to this process's metrics.
+
+    :param metrics: An object returned by :func:`drain`.
+    :return: Nothing.
+    """
+    timers, counters = metrics
+    for (family, label), (calls, seconds) in timers.items():
+        add_time(family, label, seconds, calls)
+    for (family, label), value in counters.items():
+        count(family, label, value)
+
+
+def reset():
+    """Forget this process's metrics.
+
+    :return: Nothing.
+    """
+    global _PID  # pylint:disable=global-statement
+    _TIMERS.clear()
+    _COUNTERS.clear()
+    _PID = os.getpid()
+
+
+def stats():
+    """Summarize this process's metrics.
+
+    :return: A dict which can be encoded as JSON, with the following keys:
+
+        ``phases``
+            For each phase, its wall time in seconds, and for each unit of
+            work it counted, e.g. "pairs", the amount of work done and the
+            work done per second.
+        ``sql``, ``writes``
+            For each type of query or table, the number of calls, and the
+            total and mean seconds per call.
+        ``workers``
+            For each pool, the seconds its workers spent busy, its capacity in
+            seconds, and their ratio, its utilization.
+    """
+    timers = {
+        family: {
+            label: {
+                'calls': calls,
+                'seconds': seconds,
+                'mean_seconds': seconds / calls if calls else 0,
+            }
+            for (family_, label), (calls, seconds) in sorted(_TIMERS.items())
+            if family_ == family
+        }
+        for family in _TIMER_LABELS
+    }
+
+    phases = {
+        label: {'seconds': timer_['seconds']}
+        for label, timer_ in timers['phase'].items()
+    }
+    workers = {}
+    for (family, label), value in sorted(_COUNTERS.items()):
+        if family == 'capacity':
+            busy = timers['worker'].get(label, {'seconds': 0})['seconds']
+            workers[label] = {
+                'busy_seconds': busy,
+                'capacity_seconds': value,
+                'utilization': busy / value if value else 0,
+            }
+            continue
+        phase = phases.setdefault(label, {'seconds': 0})
+        phase[family] = value
+        if phase['seconds']:
+            phase[f'{family}_per_second'] = value / phase['seconds']
+
+    return {
+        'phases': phases,
+        'sql': timers['sql'],
+        'workers': workers,
+        'writes': timers['write'],
+    }
+
+
+def prometheus():
+    """Format this process's metrics in the Prometheus text format.
+
+    Timers become summaries, with ``_count`` and ``_sum`` samples, and
+    counters become counters.
+
+    :return: A string.
+    """
+    lines = []
+    for family, label_name in sorted(_TIMER_LABELS.items()):
+        name = f'{PROMETHEUS_PREFIX}_{family}_seconds'
+        samples = sorted(
+            (label, timer_) for (family_, label), timer_ in _TIMERS.items()
+            if family_ == family
+        )
+        if not samples:
+            continue
+        lines.append(f'# TYPE {name} summary')
+        for label, (calls, seconds) in samples:
+            lines.append(f'{name}_count{{{label_name}="{label}"}} {calls}')
+            lines.append(f'{name}_sum{{{label_name}="{label}"}} {seconds!r}')
+    for family in sorted({family for family, _ in _COUNTERS}):
+        if family == 'capacity':
+            name = f'{PROMETHEUS_PREFIX}_worker_capacity_seconds_total'
+            label_name = 'pool'
+        else:
+            name = f'{PROMETHEUS_PREFIX}_{family}_total'
+            label_name = 'phase'
+        lines.append(f'# TYPE {name} counter')
+        for (family_, label), value in sorted(_COUNTERS.items()):
+            if family_ == family:
+                lines.append(f'{name}{{{label_name}="{label}"}} {value!r}')
+    return ''.join(line + '\n' for line in lines)
+
+
+def write_prometheus(path):
+    """Write this process's metrics to a file, in the Prometheus text format.
+
+    The file is replaced atomically, as expected by the node exporter's
+    textfile collector.
+
+    :param path: The path to a file.
+    :return: Nothing.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        handle.write(prometheus())
+    os.replace(tmp_path, path)
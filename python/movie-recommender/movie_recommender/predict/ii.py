@@ -2,6 +2,8 @@
 """Tools for predicting movie ratings with the item-item algorithm."""
 import math
 
+import numpy
+
 from movie_recommender import exceptions
 from movie_recommender.constants import (
     AVG_RATING,
@@ -74,6 +76,39 @@ def predict_rating_for_recommend(user, movie):
     return Prediction(pred_rating, movie, reason)
 
 
+def predict_rating_from_snapshot(snapshot, user_movies, user_ratings, movie):
+    """Predict a user's rating for the given movie, from a snapshot.
+
+    This function has the same effect as :func:`predict_rating_for_recommend`.
+    However, rather than querying the database, it reads the movie's
+    neighbours from a snapshot, and the user's ratings from arrays.
+
+    :param snapshot: A :class:`movie_recommender.db.snapshot.Snapshot` with
+        ``neighbours_*`` arrays.
+    :param user_movies: A sorted array of the IDs of the movies the user has
+        rated.
+    :param user_ratings: An array of the user's ratings, in the same order as
+        ``user_movies``.
+    :param movie: An movie ID. The movie for which a predicted rating is
+        generated.
+    :return: A predicted rating.
+    :rtype movie_recommender.predict.common.Prediction:
+    """
+    neighbour_ids, scores = snapshot.neighbours(movie)
+    rated = numpy.isin(neighbour_ids, user_movies, assume_unique=True)
+    scores = scores[rated]
+    denominator = numpy.abs(scores).sum()
+    if denominator == 0:
+        return Prediction(MIN_RATING, movie, None)
+    indices = numpy.searchsorted(user_movies, neighbour_ids[rated])
+    numerator = numpy.dot(scores, normalize_rating(user_ratings[indices]))
+    return Prediction(
+        float(denormalize_rating(numerator / denominator)),
+        movie,
+        SIMILAR,
+    )
+
+
 def predict_rating(user, movie):
     """Predict the given user's rating for the given movie.
 
@@ -110,6 +145,28 @@ def predict_rating(user, movie):
     return denormalize_rating(normalized_rating)
 
 
+def predict_ratings(user):
+    """Predict the given user's rating for every movie they haven't rated.
+
+    This function has the same effect as calling :func:`predict_rating` for
+    each movie. However, the weighted sums behind every prediction are
+    calculated with one query, by
+    :func:`movie_recommender.db.calc.weighted_ratings`.
+
+    :param user: A user ID. The user for whom predicted ratings are generated.
+    :return: A dict in the form ``{movie_id: pred_rating}``. Movies for which
+        :func:`predict_rating` would raise
+        :class:`movie_recommender.exceptions.NoSimilarMoviesError` are absent.
+    """
+    return {
+        movie: denormalize_rating(weighted_sum / abs_similarity_sum)
+        for movie, weighted_sum, abs_similarity_sum in calc.weighted_ratings(
+            user,
+            normalize_rating,
+        )
+    }
+
+
 def normalize_rating(denormalized_rating):
     """Normalize a movie rating.
 
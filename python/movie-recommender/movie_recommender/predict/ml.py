@@ -2,10 +2,12 @@
 """Tools for predicting movie ratings with the machine learning algorithm."""
 import functools
 
+import numpy
+
 from movie_recommender import exceptions
-from movie_recommender.constants import GENRES
-from movie_recommender.graph import Graph, Point
-from movie_recommender.db import common, read
+from movie_recommender.constants import GENRE_BITS, GENRES
+from movie_recommender.graph import ArrayGraph
+from movie_recommender.db import read
 
 
 def clamp_rating(rating):
@@ -70,29 +72,7 @@ def make_year_predictor(user_id, forbidden_movie=None):
     :return: A function which accepts a movie ID and returns a predicted
         rating.
     """
-    query = """
-            SELECT movies.title, ratings.rating
-            FROM movies JOIN ratings USING (movieId)
-            WHERE ratings.userId == ?
-            """
-    params = [user_id]
-    if forbidden_movie:
-        query += 'AND movieId != ?'
-        params.append(forbidden_movie)
-
-    # Iterate through movies this user has rated. For each movie, create a
-    # Cartesian point, where X is the movie's year, and Y is the rating this
-    # user has given to this movie.
-    points = []
-    with common.get_db_conn() as conn:
-        for row in conn.execute(query, params):
-            try:
-                year = read.year(row[0])
-            except exceptions.NoMovieYearError:
-                continue
-            rating = row[1]
-            points.append(Point(year, rating))
-    graph = Graph(points)
+    graph = make_year_graph(user_id, forbidden_movie)
 
     def predictor(movie_id):
         """Predict a user's rating for the given movie.
@@ -108,8 +88,7 @@ def make_year_predictor(user_id, forbidden_movie=None):
             include a year, but all of the movies this user has rated lack a
             year.
         """
-        title = read.title(movie_id)
-        year = read.year(title)
+        year = read.movie_year(movie_id)
         try:
             rating = graph.predict_y(year)
         except exceptions.VerticalLineOfBestFitGraphError:
@@ -129,27 +108,8 @@ def make_genre_predictor(genre, user_id, forbidden_movie=None):
     :return: A function which accepts a movie ID and returns a predicted
         rating.
     """
-    query = """
-            SELECT movies.genres, ratings.rating
-            FROM movies JOIN ratings USING (movieId)
-            WHERE ratings.userId == ?
-            """
-    params = [user_id]
-    if forbidden_movie:
-        query += 'AND movieId != ?'
-        params.append(forbidden_movie)
-
-    # Iterate through movies this user has rated. For each movie, create a
-    # Cartesian point, where X is whether the move has the given genre, and Y
-    # is the rating this user has given to this movie.
-    points = []
-    with common.get_db_conn() as conn:
-        for row in conn.execute(query, params):
-            genres = row[0].split('|')
-            genre_present = 1 if genre in genres else 0
-            rating = row[1]
-            points.append(Point(genre_present, rating))
-    graph = Graph(points)
+    graph = make_genre_graph(genre, user_id, forbidden_movie)
+    genre_bit = GENRE_BITS.get(genre, 0)
 
     def predictor(movie_id):
         """Predict a user's rating for the given movie.
@@ -157,8 +117,7 @@ def make_genre_predictor(genre, user_id, forbidden_movie=None):
         :param movie_id: A movie ID.
         :return: A predicted rating for the given movie.
         """
-        genres = read.genres(movie_id)
-        genre_present = 1 if genre in genres else 0
+        genre_present = 1 if read.movie_genres(movie_id) & genre_bit else 0
         try:
             rating = graph.predict_y(genre_present)
         except exceptions.VerticalLineOfBestFitGraphError:
@@ -166,3 +125,87 @@ def make_genre_predictor(genre, user_id, forbidden_movie=None):
         return clamp_rating(rating)
 
     return predictor
+
+
+def make_year_graph(user_id, forbidden_movie=None):
+    """Make a graph of the given user's ratings by year.
+
+    If year information can't be extracted from a movie's title, then that
+    movie is skipped.
+
+    :param user_id: A user ID.
+    :param forbidden_movie: A movie ID. A movie to ignore when creating the
+        graph.
+    :return: A :class:`movie_recommender.graph.ArrayGraph`.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    # For each movie this user has rated, create a Cartesian point, where X is
+    # the movie's year, and Y is the rating this user has given to this movie.
+    rated_years = read.rated_years(user_id, forbidden_movie)
+    years = [year for year, _ in rated_years]
+    ratings = [rating for _, rating in rated_years]
+    return ArrayGraph(years, ratings)
+
+
+def make_genre_graph(genre, user_id, forbidden_movie=None):
+    """Make a graph of the given user's ratings by the presence of a genre.
+
+    :param genre: A genre name, as a string.
+    :param user_id: A user ID.
+    :param forbidden_movie: A movie ID. A movie to ignore when creating the
+        graph.
+    :return: A :class:`movie_recommender.graph.ArrayGraph`.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    # For each movie this user has rated, create a Cartesian point, where X is
+    # whether the movie has the given genre, and Y is the rating this user has
+    # given to this movie.
+    rated_in_genre = read.rated_in_genre(genre, user_id, forbidden_movie)
+    genres_present = [in_genre for in_genre, _ in rated_in_genre]
+    ratings = [rating for _, rating in rated_in_genre]
+    return ArrayGraph(genres_present, ratings)
+
+
+def predict_ratings(user_id, predictor_name):
+    """Predict the given user's rating for every movie they haven't rated.
+
+    This function has the same effect as making a predictor with
+    :func:`make_predictor`, and calling it for each movie. However, the
+    features of every movie are read with one query, from the "movieFeatures"
+    table, and ratings are predicted with vectorized arithmetic.
+
+    :param user_id: A user ID. The user for whom predicted ratings are
+        generated.
+    :param predictor_name: The type of predictor to use. See
+        :func:`make_predictor`.
+    :return: A pair of NumPy arrays: movie IDs, and predicted ratings. Movies
+        for which the predictor would raise
+        :class:`movie_recommender.exceptions.NoMovieYearError` are absent.
+    :raise movie_recommender.exceptions.NoSuchPredictorError: If the requested
+        type of predictor is not yet implemented.
+    :raise movie_recommender.exceptions.EmptyGraphError: If ratings can't be
+        predicted at all, due to a lack of relevant data.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    get_predictor_factory(predictor_name)  # Raise an error if it's unknown.
+    features = read.unrated_movie_features(user_id)
+    if predictor_name == 'year':
+        has_year = ~numpy.isnan(features.years)
+        movie_ids = features.movie_ids[has_year]
+        x = features.years[has_year]
+        graph = make_year_graph(user_id)
+    else:
+        genre = predictor_name[len('genre:'):]
+        movie_ids = features.movie_ids
+        x = (features.genres & GENRE_BITS[genre] != 0).astype(numpy.float64)
+        graph = make_genre_graph(genre, user_id)
+    if not x.size:
+        return movie_ids, x
+    try:
+        ratings = graph.predict_y(x)
+    except exceptions.VerticalLineOfBestFitGraphError:
+        ratings = numpy.full_like(x, graph.avg_point.y)
+    return movie_ids, numpy.clip(ratings, 0.5, 5)
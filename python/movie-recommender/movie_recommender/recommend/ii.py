@@ -1,15 +1,43 @@
 # coding=utf-8
 """Tools for generating top-n recommendations with item-item."""
+import contextlib
 import heapq
 import multiprocessing
 
-from movie_recommender.constants import JOBS_PER_PROCESS_PER_BATCH
+import numpy
+
+from movie_recommender import metrics
+from movie_recommender.constants import (
+    JOBS_PER_PROCESS_PER_BATCH,
+    MIN_RATING,
+    SIMILAR,
+)
 from movie_recommender.db import count as db_count
-from movie_recommender.db import read
-from movie_recommender.predict.ii import predict_rating_for_recommend
+from movie_recommender.db import read, snapshot
+from movie_recommender.predict.common import Prediction
+from movie_recommender.predict.ii import (
+    predict_rating_for_recommend,
+    predict_rating_from_snapshot,
+    predict_ratings,
+)
+
+_SNAPSHOT = None
+"""A :class:`movie_recommender.db.snapshot.Snapshot` of neighbours.
+
+If set, :func:`_call_prfr` predicts ratings from here, with
+:func:`movie_recommender.predict.ii.predict_rating_from_snapshot`. Set by
+:func:`_init_snapshot_worker`.
+"""
+
+_USER_RATINGS = None
+"""The ``user_movies`` and ``user_ratings`` arrays of the user being served.
 
+Set by :func:`_init_snapshot_worker`.
+"""
 
-def recommend(user, count, jobs, reporter=None):
+
+@metrics.timed('phase', 'recommend')
+def recommend(user, count, jobs, reporter=None, use_snapshot=False):
     """Recommend several movies for the given user.
 
     :param user: A user ID. The user for whom recommendations are being
@@ -21,15 +49,26 @@ def recommend(user, count, jobs, reporter=None):
         one argument, where that argument is a multiprocessing ``Connection``
         object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
         progress isn't reported.
+    :param use_snapshot: If true, load every movie's neighbours once, into a
+        :class:`movie_recommender.db.snapshot.Snapshot` shared by every
+        process, rather than having each process query the database for each
+        movie.
     :return: A generator that yields up to ``count``
         :class:`movie_recommender.predict.common.Prediction` objects, in order
         of confidence.
     """
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
     best_predictions = []
-    with multiprocessing.Pool(jobs) as pool:
+    with _make_pool(user, jobs, use_snapshot) as pool, \
+            metrics.pool('recommend', jobs):
         prfr_args = _gen_prfr_args(user, reporter)
-        predictions = pool.imap_unordered(func=_call_prfr, iterable=prfr_args)
+        predictions = metrics.collect(pool.imap_unordered(
+            func=metrics.measured(_call_prfr, 'recommend'),
+            iterable=prfr_args,
+        ))
         for prediction in predictions:
+            metrics.count('movies', 'recommend')
             if len(best_predictions) >= count:
                 heapq.heappushpop(best_predictions, prediction)
             else:
@@ -39,7 +78,87 @@ def recommend(user, count, jobs, reporter=None):
         yield prediction
 
 
+@metrics.timed('phase', 'recommend')
+def recommend_batched(user, count):
+    """Recommend several movies for the given user.
+
+    This function has the same effect as :func:`recommend`. However, rather
+    than predicting a rating for each movie in a pool of processes, it predicts
+    ratings for every movie at once with
+    :func:`movie_recommender.predict.ii.predict_ratings`, in this process.
+
+    :param user: A user ID. The user for whom recommendations are being
+        generated.
+    :param count: The number of recommendations to generate for the given user.
+    :return: A generator that yields up to ``count``
+        :class:`movie_recommender.predict.common.Prediction` objects, in order
+        of confidence.
+    """
+    pred_ratings = predict_ratings(user)
+    movies = tuple(read.unrated_movies(user))
+    metrics.count('movies', 'recommend', len(movies))
+    predictions = (
+        Prediction(pred_ratings[movie], movie, SIMILAR)
+        if movie in pred_ratings
+        else Prediction(MIN_RATING, movie, None)
+        for movie in movies
+    )
+    yield from heapq.nlargest(count, predictions)
+
+
+@contextlib.contextmanager
+def _make_pool(user, jobs, use_snapshot):
+    """Make a pool of processes that can call :func:`_call_prfr`.
+
+    :param user: A user ID. The user for whom recommendations are being
+        generated.
+    :param jobs: The number of processes to spawn. If ``None``, spawn one per
+        CPU.
+    :param use_snapshot: Whether the processes should predict ratings from a
+        snapshot. If so, the snapshot is created first, and freed once the
+        pool has been terminated.
+    :return: A context manager which yields a ``multiprocessing.Pool``.
+    """
+    if not use_snapshot:
+        with multiprocessing.Pool(jobs) as pool:
+            yield pool
+        return
+    ratings = sorted(read.user_ratings(user).items())
+    user_ratings = (
+        numpy.array([movie for movie, _ in ratings], dtype=numpy.int64),
+        numpy.array([rating for _, rating in ratings], dtype=numpy.float64),
+    )
+    with snapshot.Snapshot.create(snapshot.load_neighbours()) as snapshot_:
+        with multiprocessing.Pool(
+                jobs,
+                initializer=_init_snapshot_worker,
+                initargs=(snapshot_.descriptor, user_ratings)) as pool:
+            yield pool
+
+
+def _init_snapshot_worker(descriptor, user_ratings):
+    """Prepare a worker process to call :func:`_call_prfr` with a snapshot.
+
+    :param descriptor: A
+        :class:`movie_recommender.db.snapshot.SnapshotDescriptor` of a snapshot
+        holding neighbours.
+    :param user_ratings: A tuple of ``user_movies`` and ``user_ratings``
+        arrays, as accepted by
+        :func:`movie_recommender.predict.ii.predict_rating_from_snapshot`.
+    :return: Nothing.
+    """
+    global _SNAPSHOT, _USER_RATINGS  # pylint:disable=global-statement
+    _SNAPSHOT = snapshot.Snapshot.attach(descriptor)
+    _USER_RATINGS = user_ratings
+
+
 def _call_prfr(args):
+    if _SNAPSHOT is not None:
+        return predict_rating_from_snapshot(
+            _SNAPSHOT,
+            *_USER_RATINGS,
+            args[1],
+        )
     return predict_rating_for_recommend(*args)
 
 
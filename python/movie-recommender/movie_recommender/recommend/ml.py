@@ -2,11 +2,15 @@
 """Tools for generating top-n recommendations with machine learning."""
 import heapq
 
-from movie_recommender import exceptions
+import numpy
+
+from movie_recommender import exceptions, metrics
 from movie_recommender.db import read
 from movie_recommender.predict.common import Prediction
+from movie_recommender.predict.ml import predict_ratings
 
 
+@metrics.timed('phase', 'recommend')
 def recommend(user, count, predictor):
     """Yield recommended movies for the given user.
 
@@ -24,9 +28,37 @@ def recommend(user, count, predictor):
             prediction = Prediction(predictor(movie), movie, None)
         except exceptions.NoMovieYearError:
             continue
+        metrics.count('movies', 'recommend')
         if len(predictions) >= count:
             heapq.heappushpop(predictions, prediction)
         else:
             heapq.heappush(predictions, prediction)
     for prediction in heapq.nlargest(count, predictions):
         yield prediction
+
+
+@metrics.timed('phase', 'recommend')
+def recommend_batched(user, count, predictor_name):
+    """Yield recommended movies for the given user.
+
+    This function has the same effect as :func:`recommend`. However, rather
+    than calling a predictor for each movie, it predicts ratings for every
+    movie at once with :func:`movie_recommender.predict.ml.predict_ratings`.
+
+    :param user: A user ID. The user for which recommendations are being
+        generated.
+    :param count: The number of recommendations to return.
+    :param predictor_name: The type of predictor to use, e.g. "year".
+    :return: A generator that yields the top ``count`` recommendations.
+    :rtype movie_recommender.recommend.Prediction:
+    :raise movie_recommender.exceptions.NoSuchPredictorError: If the requested
+        type of predictor is not yet implemented.
+    :raise movie_recommender.exceptions.MissingMovieFeaturesError: If the
+        database lacks a "movieFeatures" table.
+    """
+    movie_ids, pred_ratings = predict_ratings(user, predictor_name)
+    metrics.count('movies', 'recommend', len(movie_ids))
+    # Order by rating, then by movie ID, both descending, as heapq.nlargest()
+    # orders Prediction objects.
+    for i in numpy.lexsort((movie_ids, pred_ratings))[::-1][:count]:
+        yield Prediction(float(pred_ratings[i]), int(movie_ids[i]), None)
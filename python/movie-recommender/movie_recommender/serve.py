@@ -0,0 +1,377 @@
+# coding=utf-8
+"""A long-running server that answers requests for predictions.
+
+Each call to ``mr-recommend`` or ``mr-predict`` starts Python, validates its
+arguments against the database, and reads from a cold database connection. The
+server does this work once. It keeps a :class:`Model` of the data that
+requests are validated against, a database connection, and a view of the
+similarity store, and answers requests over a Unix or TCP socket.
+
+Requests and responses are JSON objects, one per line. A request is one of:
+
+* ``{"command": "recommend", "algorithm": "ii", "user": 1, "count": 5}``
+* ``{"command": "predict", "algorithm": "ii", "user": 1, "movie": 10}``
+
+The algorithm is "ii" or "ml". With "ml", an optional ``"predictor"`` selects
+a predictor other than the user's best one. A response is one of:
+
+* ``{"predictions": [{"movie": 10, "pred_rating": 4.5, "reason": null},
+  ...]}``, for "recommend".
+* ``{"prediction": {"movie": 10, "pred_rating": 4.5, "reason": null}}``, for
+  "predict".
+* ``{"error": "A message."}``, if the request can't be answered. If a request
+  is longer than the limit of an ``asyncio.StreamReader``, 64 KiB by default,
+  the connection is closed after this response.
+
+Requests made by concurrent clients are batched. While a batch is being
+answered, new requests are queued, and they're answered together in the next
+batch, in one worker thread. The model is checked for staleness once per batch,
+and identical requests in a batch are answered once. Recommendations are read
+from and written to the cache in :mod:`movie_recommender.db.cache`.
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import stat
+
+from movie_recommender import exceptions
+from movie_recommender.db import cache, read
+from movie_recommender.predict import ii as predict_ii
+from movie_recommender.predict import ml as predict_ml
+from movie_recommender.predict.common import Prediction
+from movie_recommender.recommend import ii as recommend_ii
+from movie_recommender.recommend import ml as recommend_ml
+
+
+class Model():
+    """The data that requests are validated against."""
+
+    def __init__(self, version):
+        """Load the model from the database.
+
+        :param version: The version of the database's data, as returned by
+            :func:`movie_recommender.db.cache.version`, when the model is
+            loaded.
+        """
+        self.version = version
+        self.movies = frozenset(read.all_movies())
+        self.users = frozenset(read.users())
+        self.predictor_names = read.predictor_names()
+
+    def answer(self, request):
+        """Answer a request.
+
+        :param request: A dict, as described in :mod:`movie_recommender.serve`.
+        :return: A dict, as described in :mod:`movie_recommender.serve`.
+        """
+        try:
+            return self._answer(request)
+        except (
+                exceptions.BadRequestError,
+                exceptions.EmptyGraphError,
+                exceptions.MissingAverageRatingError,
+                exceptions.MissingMovieFeaturesError,
+                exceptions.MissingSimilarityError,
+                exceptions.NoMovieRatingsError,
+                exceptions.NoMovieYearError,
+                exceptions.NoPersonalizedPredictorError,
+                exceptions.NoSimilarMoviesError,
+                exceptions.NoSuchPredictorError) as err:
+            return {'error': str(err)}
+
+    def _answer(self, request):
+        """Answer a request, or raise an exception.
+
+        :param request: A dict, as described in :mod:`movie_recommender.serve`.
+        :return: A dict, as described in :mod:`movie_recommender.serve`.
+        """
+        if not isinstance(request, dict):
+            raise exceptions.BadRequestError(
+                'A request must be a JSON object.'
+            )
+        command = request.get('command')
+        algorithm = request.get('algorithm')
+        if algorithm not in ('ii', 'ml'):
+            raise exceptions.BadRequestError(
+                f'Unknown algorithm: {algorithm!r}'
+            )
+        user = self._get_id(request, 'user', self.users)
+        predictor = ''
+        if algorithm == 'ml':
+            predictor = request.get('predictor') or self.predictor_name(user)
+            if not isinstance(predictor, str):
+                raise exceptions.BadRequestError(
+                    f'Invalid predictor: {predictor!r}'
+                )
+
+        if command == 'recommend':
+            count = request.get('count', 5)
+            if isinstance(count, bool) or not isinstance(count, int) \
+                    or count < 0:
+                raise exceptions.BadRequestError(f'Invalid count: {count!r}')
+            if algorithm == 'ii':
+                predictions = cache.recommendations(
+                    user,
+                    algorithm,
+                    predictor,
+                    count,
+                    lambda: recommend_ii.recommend_batched(user, count),
+                )
+            else:
+                predictions = cache.recommendations(
+                    user,
+                    algorithm,
+                    predictor,
+                    count,
+                    lambda: recommend_ml.recommend_batched(
+                        user,
+                        count,
+                        predictor,
+                    ),
+                )
+            return {'predictions': [
+                _prediction_to_dict(pred) for pred in predictions
+            ]}
+
+        if command == 'predict':
+            movie = self._get_id(request, 'movie', self.movies)
+            if algorithm == 'ii':
+                pred = predict_ii.predict_rating_for_predict(user, movie)
+            else:
+                pred = Prediction(
+                    predict_ml.make_predictor(user, predictor)(movie),
+                    movie,
+                    None,
+                )
+            return {'prediction': _prediction_to_dict(pred)}
+
+        raise exceptions.BadRequestError(f'Unknown command: {command!r}')
+
+    def predictor_name(self, user):
+        """Get the personalized predictor name for the given user.
+
+        :param user: A user ID.
+        :return: A predictor name.
+        :raise movie_recommender.exceptions.NoPersonalizedPredictorError: If
+            the given user doesn't have a personalized predictor.
+        """
+        try:
+            return self.predictor_names[user]
+        except KeyError as err:
+            raise exceptions.NoPersonalizedPredictorError(
+                f'User {user} has no personalized predictors. Please generate '
+                'one with "mr-analyze".',
+            ) from err
+
+    @staticmethod
+    def _get_id(request, key, ids):
+        """Get a user or movie ID from a request, and check that it exists.
+
+        :param request: A dict.
+        :param key: The key of the ID in the request, e.g. "user".
+        :param ids: The set of valid IDs.
+        :return: An ID.
+        :raise movie_recommender.exceptions.BadRequestError: If the ID is
+            missing or invalid.
+        """
+        id_ = request.get(key)
+        if isinstance(id_, bool) or not isinstance(id_, int) \
+                or id_ not in ids:
+            raise exceptions.BadRequestError(
+                f'{key.capitalize()} ID {id_} not in database.'
+            )
+        return id_
+
+
+class Server():
+    """Answer requests from clients, in batches."""
+
+    def __init__(self):
+        """Initialize instance attributes."""
+        self._model = None
+        self._queue = None
+        # SQLite connections are per-thread, so a single worker thread keeps a
+        # single warm connection.
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    async def handle_client(self, reader, writer):
+        """Answer a client's requests, one per line, until it disconnects.
+
+        If a request is too long to be read, answer it with an error, and
+        disconnect.
+
+        :param reader: An ``asyncio.StreamReader`` object.
+        :param writer: An ``asyncio.StreamWriter`` object.
+        :return: Nothing.
+        """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as err:
+                    # The line is longer than the reader's buffer. Where it
+                    # ends can't be told, so neither can where the next
+                    # request starts.
+                    writer.write(json.dumps({
+                        'error': f'Request too long: {err}',
+                    }).encode() + b'\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as err:
+                    response = {'error': f'Invalid JSON: {err}'}
+                else:
+                    response = await self.submit(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def submit(self, request):
+        """Queue a request, and wait for its batch to be answered.
+
+        :param request: A dict, as described in :mod:`movie_recommender.serve`.
+        :return: A dict, as described in :mod:`movie_recommender.serve`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, future))
+        return await future
+
+    async def answer_batches(self):
+        """Answer queued requests in batches, forever.
+
+        :return: Never.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                responses = await loop.run_in_executor(
+                    self._executor,
+                    self.answer_batch,
+                    [request for request, _ in batch],
+                )
+            except Exception as err:  # pylint:disable=broad-except
+                responses = [{'error': str(err)}] * len(batch)
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+
+    def answer_batch(self, requests):
+        """Answer a batch of requests.
+
+        The model is re-loaded first if the database has changed since it was
+        loaded. Identical requests are answered once. If answering a request
+        fails unexpectedly, only that request is answered with an error.
+
+        :param requests: A list of dicts, as described in
+            :mod:`movie_recommender.serve`.
+        :return: A list of dicts, one per request.
+        """
+        version = cache.version()
+        if self._model is None or self._model.version != version:
+            self._model = Model(version)
+        responses = {}
+        for request in requests:
+            key = json.dumps(request, sort_keys=True)
+            if key not in responses:
+                try:
+                    responses[key] = self._model.answer(request)
+                except Exception as err:  # pylint:disable=broad-except
+                    responses[key] = {'error': str(err)}
+        return [
+            responses[json.dumps(request, sort_keys=True)]
+            for request in requests
+        ]
+
+    async def serve(
+            self,
+            socket_path=None,
+            host=None,
+            port=None,
+            listening=None):
+        """Listen for clients until SIGINT or SIGTERM is received.
+
+        Listen on a Unix socket if ``socket_path`` is given, and on a TCP
+        socket otherwise.
+
+        :param socket_path: The path to a Unix socket. A socket already at this
+            path is replaced.
+        :param host: The host name or address of a TCP socket.
+        :param port: The port of a TCP socket. If 0, pick a free port.
+        :param listening: A function which accepts the address being listened
+            on, as a string. Called once clients can connect. Optional.
+        :return: Nothing.
+        :raise movie_recommender.exceptions.DatabaseNotFoundError: If no
+            database is found.
+        """
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        # Load the model before the first client connects.
+        await loop.run_in_executor(self._executor, self.answer_batch, [])
+        if socket_path is not None:
+            _unlink_socket(socket_path)
+            server = await asyncio.start_unix_server(
+                self.handle_client,
+                path=socket_path,
+            )
+            address = socket_path
+        else:
+            server = await asyncio.start_server(
+                self.handle_client,
+                host=host,
+                port=port,
+            )
+            host, port = server.sockets[0].getsockname()[:2]
+            address = f'{host}:{port}'
+
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        batches = asyncio.ensure_future(self.answer_batches())
+        if listening is not None:
+            listening(address)
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            batches.cancel()
+            self._executor.shutdown()
+            if socket_path is not None:
+                _unlink_socket(socket_path)
+
+
+def _prediction_to_dict(prediction):
+    """Convert a prediction into a dict, for encoding as JSON.
+
+    :param prediction: A :class:`movie_recommender.predict.common.Prediction`.
+    :return: A dict.
+    """
+    return {
+        'movie': int(prediction.movie),
+        'pred_rating': float(prediction.pred_rating),
+        'reason': prediction.reason,
+    }
+
+
+def _unlink_socket(path):
+    """Delete the Unix socket at the given path, if there is one.
+
+    :param path: A path.
+    :return: Nothing.
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Benchmark Movie Recommender on synthetic, MovieLens-shaped datasets.
+
+Usage:
+
+.. code-block:: sh
+
+    scripts/benchmark.py run --output new.json
+    scripts/benchmark.py compare old.json new.json
+
+The "run" subcommand benchmarks each of several scales. For each scale, a
+dataset is generated with
+:func:`movie_recommender.datasets.write_synthetic_dataset`, in a temporary data
+directory, so that the current database isn't touched. ``mr-db create``, the
+analyses and the predictions are then timed, in that order, in a new process.
+Results are written as JSON, along with the metrics recorded by
+:mod:`movie_recommender.metrics`.
+
+The "compare" subcommand compares two results files, and exits with a non-zero
+status if a step got slower by more than a given tolerance. Results are only
+comparable if they were recorded on the same machine, with the same flags.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SCALES = {
+    'tiny': {'users': 100, 'movies': 300},
+    'small': {'users': 300, 'movies': 1000},
+    'medium': {'users': 1000, 'movies': 2500},
+}
+"""Named sizes of datasets, as fields of a ``SyntheticShape``."""
+
+RECOMMEND_USERS = 3
+"""How many users ``recommend`` is timed for. It spawns a pool per user."""
+
+
+def main():
+    """Parse arguments and call business logic."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark Movie Recommender on synthetic datasets.',
+    )
+    subparsers = parser.add_subparsers(dest='subcommand', required=True)
+
+    run_parser = subparsers.add_parser(
+        'run',
+        help='Benchmark several scales, each in a temporary data directory.',
+    )
+    run_parser.add_argument(
+        '--scales',
+        choices=SCALES,
+        default=['tiny', 'small'],
+        help='The scales to benchmark. Defaults to tiny and small.',
+        nargs='+',
+    )
+    run_parser.add_argument(
+        '--output',
+        help='Write results to this file, instead of stdout.',
+    )
+    add_scale_flags(run_parser)
+    run_parser.set_defaults(func=handle_run)
+
+    scale_parser = subparsers.add_parser(
+        'scale',
+        help="""\
+        Benchmark one scale, in the current data directory, which must not
+        hold a database, and print results to stdout. Used by "run".
+        """,
+    )
+    scale_parser.add_argument('--users', required=True, type=int)
+    scale_parser.add_argument('--movies', required=True, type=int)
+    add_scale_flags(scale_parser)
+    scale_parser.set_defaults(func=handle_scale)
+
+    compare_parser = subparsers.add_parser(
+        'compare',
+        help='Compare two results files.',
+    )
+    compare_parser.add_argument('old', help='A results file, e.g. a baseline.')
+    compare_parser.add_argument('new', help='A results file to check.')
+    compare_parser.add_argument(
+        '--tolerance',
+        default=0.2,
+        help="""\
+        How much slower a step may get before it's reported as a regression.
+        Defaults to 0.2, i.e. 20%%.
+        """,
+        type=float,
+    )
+    compare_parser.set_defaults(func=handle_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+def add_scale_flags(parser):
+    """Add the flags that affect how a scale is benchmarked to a parser."""
+    default = multiprocessing.cpu_count()
+    parser.add_argument(
+        '--jobs',
+        default=default,
+        help=f'Spawn this many processes, instead of {default}.',
+        type=int,
+    )
+    parser.add_argument(
+        '--samples',
+        default=50,
+        help="""\
+        The number of predictions to time, and the number of users to time
+        batched recommendations for. Defaults to 50.
+        """,
+        type=int,
+    )
+    parser.add_argument(
+        '--seed',
+        default=0,
+        help='Seed the dataset and the samples with this. Defaults to 0.',
+        type=int,
+    )
+
+
+def handle_run(args):
+    """Benchmark each scale in a new process, and collect the results."""
+    results = {
+        'commit': get_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'jobs': args.jobs,
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'samples': args.samples,
+        'scales': {},
+        'seed': args.seed,
+    }
+    for name in args.scales:
+        print(f'Benchmarking the {name} scale…', file=sys.stderr)
+        with tempfile.TemporaryDirectory() as data_home:
+            # The xdg module reads these variables when it's imported.
+            env = dict(os.environ, XDG_DATA_HOME=data_home,
+                       XDG_DATA_DIRS=data_home)
+            scale = subprocess.run(
+                (
+                    sys.executable, __file__, 'scale',
+                    '--users', str(SCALES[name]['users']),
+                    '--movies', str(SCALES[name]['movies']),
+                    '--jobs', str(args.jobs),
+                    '--samples', str(args.samples),
+                    '--seed', str(args.seed),
+                ),
+                check=True,
+                env=env,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            ).stdout
+        results['scales'][name] = json.loads(scale)
+        print_timings(results['scales'][name]['timings'])
+
+    if args.output is None:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+
+
+def handle_scale(args):  # pylint:disable=too-many-locals
+    """Benchmark one scale, and print its results as JSON."""
+    # pylint:disable=import-outside-toplevel
+    from xdg import BaseDirectory
+
+    from movie_recommender import exceptions, metrics
+    from movie_recommender.analyze import ii as analyze_ii
+    from movie_recommender.analyze import ml as analyze_ml
+    from movie_recommender.constants import XDG_RESOURCE
+    from movie_recommender.datasets import (
+        SyntheticShape,
+        write_synthetic_dataset,
+    )
+    from movie_recommender.db import count, read
+    from movie_recommender.predict import ii as predict_ii
+    from movie_recommender.recommend import ii as recommend_ii
+
+    shape = SyntheticShape(users=args.users, movies=args.movies)
+    timings = {}
+
+    def timed(name, func, arg_tuples=((),)):
+        """Time calls of ``func``, and record them as step ``name``."""
+        start = time.perf_counter()
+        for arg_tuple in arg_tuples:
+            func(*arg_tuple)
+        timings[name] = {
+            'calls': len(arg_tuples),
+            'seconds': time.perf_counter() - start,
+        }
+
+    timed('generate', lambda: write_synthetic_dataset(
+        os.path.join(BaseDirectory.save_data_path(XDG_RESOURCE), 'synthetic'),
+        shape,
+        args.seed,
+    ))
+    timed('mr-db create', lambda: subprocess.run(
+        ('mr-db', 'create', 'synthetic'),
+        check=True,
+        stdout=subprocess.DEVNULL,
+    ))
+    timed(
+        'analyze.ii.analyze_users',
+        lambda: analyze_ii.analyze_users(False, args.jobs),
+    )
+    timed(
+        'analyze.ii.analyze_movies',
+        lambda: analyze_ii.analyze_movies(
+            read.all_movies(),
+            (),
+            False,
+            args.jobs,
+        ),
+    )
+    timed(
+        'analyze.ml.analyze_users',
+        lambda: analyze_ml.analyze_users(read.users(), False, args.jobs),
+    )
+
+    def predict_rating(user, movie):
+        try:
+            predict_ii.predict_rating(user, movie)
+        except exceptions.NoSimilarMoviesError:
+            pass
+
+    rnd = random.Random(args.seed)
+    users = sorted(read.users())
+    movies = sorted(read.all_movies())
+    timed('predict.ii.predict_rating', predict_rating, [
+        (rnd.choice(users), rnd.choice(movies))
+        for _ in range(args.samples)
+    ])
+    timed(
+        'recommend.ii.recommend_batched',
+        lambda user: tuple(recommend_ii.recommend_batched(user, 5)),
+        [(rnd.choice(users),) for _ in range(args.samples)],
+    )
+    timed(
+        'recommend.ii.recommend',
+        lambda user: tuple(recommend_ii.recommend(user, 5, args.jobs)),
+        [(rnd.choice(users),) for _ in range(RECOMMEND_USERS)],
+    )
+
+    print(json.dumps({
+        'metrics': metrics.stats(),
+        'rows': {
+            'movies': len(movies),
+            'nonzero_similarities': count.nonzero_similarities(),
+            'ratings': count.ratings(),
+            'users': len(users),
+        },
+        'shape': shape._asdict(),
+        'timings': timings,
+    }))
+
+
+def handle_compare(args):
+    """Compare two results files, and exit non-zero on a regression."""
+    with open(args.old, encoding='utf-8') as handle:
+        old = json.load(handle)
+    with open(args.new, encoding='utf-8') as handle:
+        new = json.load(handle)
+
+    regressions = 0
+    print(f'{"step":<36}{"old (ms)":>12}{"new (ms)":>12}{"change":>10}')
+    for name, new_scale in new['scales'].items():
+        old_scale = old['scales'].get(name)
+        if old_scale is None or old_scale['shape'] != new_scale['shape']:
+            print(f'{name}: not in {args.old}, or shaped differently')
+            continue
+        print(f'{name}:')
+        for step, new_timing in new_scale['timings'].items():
+            if step not in old_scale['timings']:
+                continue
+            old_ms = mean_ms(old_scale['timings'][step])
+            new_ms = mean_ms(new_timing)
+            change = new_ms / old_ms - 1 if old_ms else 0
+            flag = ''
+            if change > args.tolerance:
+                flag = ' slower'
+                regressions += 1
+            print(
+                f'  {step:<34}{old_ms:>12.3f}{new_ms:>12.3f}'
+                f'{change:>+10.0%}{flag}'
+            )
+    if regressions:
+        print(f'{regressions} step(s) got slower.', file=sys.stderr)
+        sys.exit(1)
+
+
+def get_commit():
+    """Return the current git commit, or ``None`` if it can't be found."""
+    proc = subprocess.run(
+        ('git', 'rev-parse', 'HEAD'),
+        check=False,
+        stderr=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+
+def mean_ms(timing):
+    """Return the mean milliseconds per call of a step's timing."""
+    return timing['seconds'] / timing['calls'] * 1000
+
+
+def print_timings(timings):
+    """Print each step's mean milliseconds per call to stderr."""
+    for step, timing in timings.items():
+        print(f'  {step:<34}{mean_ms(timing):>12.3f} ms', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Time common queries, with and without the database's secondary indices.
+
+Usage:
+
+.. code-block:: sh
+
+    scripts/time-queries.py "$(mr-db load-path)"
+
+The given database isn't modified. Instead, it's copied to a temporary
+directory, and the copy's secondary indices are dropped. Each query is then
+timed against a sample of movies and users, the indices are re-created with
+:func:`movie_recommender.db.init.reindex`, and each query is timed again.
+Timing similarity lookups is only meaningful if the database has been analyzed
+with ``mr-analyze ii``.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+
+def main():
+    """Parse arguments, and time queries against a copy of the database."""
+    parser = argparse.ArgumentParser(
+        description='Time common queries, with and without indices.',
+    )
+    parser.add_argument('db_path', help='The database to copy and query.')
+    parser.add_argument(
+        '--samples',
+        default=50,
+        type=int,
+        help='The number of times each query is executed. Defaults to 50.',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_home:
+        # The xdg module reads these variables when it's imported.
+        os.environ['XDG_DATA_HOME'] = data_home
+        os.environ['XDG_DATA_DIRS'] = data_home
+        # pylint:disable=import-outside-toplevel
+        from movie_recommender.constants import XDG_RESOURCE
+        from movie_recommender.db import common, init
+
+        copy_path = os.path.join(data_home, XDG_RESOURCE, 'db.db')
+        os.mkdir(os.path.dirname(copy_path))
+        src = sqlite3.connect(args.db_path)
+        dst = sqlite3.connect(copy_path)
+        src.backup(dst)
+        with dst:
+            dst.execute('DROP INDEX IF EXISTS ratingsMovieId')
+            dst.execute('DROP INDEX IF EXISTS similaritiesMovieBId')
+        src.close()
+        dst.close()
+
+        queries = get_queries(args.samples)
+        before = time_queries(queries)
+        common.close_db_conns()
+        init.reindex()
+        common.close_db_conns()
+        after = time_queries(queries)
+
+    print(f'{"query":<28}{"before (ms)":>14}{"after (ms)":>14}')
+    for name in queries:
+        print(f'{name:<28}{before[name]:>14.3f}{after[name]:>14.3f}')
+
+
+def get_queries(samples):
+    """Return a dict of ``{name: (function, argument_tuples)}``."""
+    # pylint:disable=import-outside-toplevel
+    from movie_recommender.db import calc, count, read
+
+    rnd = random.Random(0)
+    movies = sorted(read.rated_movies(read.users()))
+    users = sorted(read.users())
+    movie_pairs = []
+    while len(movie_pairs) < samples and len(movies) > 1:
+        movie_pairs.append(tuple(rnd.sample(movies, 2)))
+    return {
+        'calc.avg_movie_rating': (
+            calc.avg_movie_rating,
+            [(rnd.choice(movies),) for _ in range(samples)],
+        ),
+        'count.rating_pairs': (count.rating_pairs, movie_pairs),
+        'read.rating_pairs': (
+            lambda *args: tuple(read.rating_pairs(*args)),
+            movie_pairs,
+        ),
+        'read.similar_movies_for_user': (
+            lambda *args: tuple(read.similar_movies_for_user(*args)),
+            [
+                (rnd.choice(movies), rnd.choice(users))
+                for _ in range(samples)
+            ],
+        ),
+    }
+
+
+def time_queries(queries):
+    """Return a dict of ``{name: median_milliseconds}``."""
+    medians = {}
+    for name, (func, arg_tuples) in queries.items():
+        durations = []
+        for args in arg_tuples:
+            start = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - start)
+        medians[name] = statistics.median(durations) * 1000
+    return medians
+
+
+if __name__ == '__main__':
+    main()
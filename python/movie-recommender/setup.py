@@ -37,10 +37,12 @@ setup(
         'Intended Audience :: Education',
         ('License :: OSI Approved :: GNU General Public License v3 or later '
          '(GPLv3+)'),
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
     ],
     packages=find_packages(),
-    install_requires=['pyxdg', 'requests'],
+    # multiprocessing.shared_memory is new in Python 3.8.
+    python_requires='>=3.8',
+    install_requires=['numpy', 'pyxdg', 'requests', 'scipy'],
     extras_require={
         'dev': [
             # For `make docs-{clean,html}`
@@ -61,6 +63,7 @@ setup(
             'mr-graph=movie_recommender.cli.mr_graph:main',
             'mr-predict=movie_recommender.cli.mr_predict:main',
             'mr-recommend=movie_recommender.cli.mr_recommend:main',
+            'mr-serve=movie_recommender.cli.mr_serve:main',
         ]
     },
     test_suite='tests',
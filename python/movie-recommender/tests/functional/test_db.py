@@ -0,0 +1,237 @@
+# coding=utf-8
+"""Tests for managing the database with ``mr-db``."""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from movie_recommender.constants import GENRES
+
+from .utils import backup_db, restore_db, run
+
+
+def setUpModule():  # pylint:disable=invalid-name
+    """Back up the current database if one exists, and create a new one."""
+    backup_db()
+    run(('mr-dataset', 'install', 'fixture'))
+    run(('mr-db', 'create', 'fixture'))
+
+
+def tearDownModule():  # pylint:disable=invalid-name
+    """Delete the current database, and restore the old one."""
+    load_path = run(('mr-db', 'load-path'))[0]
+    run(('rm', load_path))
+    restore_db()
+
+
+class ReindexTestCase(unittest.TestCase):
+    """Call ``mr-db reindex``."""
+
+    def test_twice(self):
+        """Drop an index, and reindex the database twice.
+
+        The first call should re-create the index, and the second should be a
+        no-op. Afterwards, the indices on ``ratings (movieId)`` and
+        ``similarities (movieBId)`` should exist.
+        """
+        load_path = run(('mr-db', 'load-path'))[0]
+        with sqlite3.connect(load_path) as conn:
+            conn.execute('DROP INDEX ratingsMovieId')
+        conn.close()
+        run(('mr-db', 'reindex'))
+        run(('mr-db', 'reindex'))
+        with sqlite3.connect(load_path) as conn:
+            indices = {
+                (row[0], row[1]) for row in conn.execute(
+                    'SELECT tbl_name, name FROM sqlite_master '
+                    "WHERE type = 'index'"
+                )
+            }
+            first_columns = {
+                name: conn.execute(
+                    f'PRAGMA index_info({name})'
+                ).fetchone()[2]
+                for _, name in indices
+            }
+        conn.close()
+        self.assertIn(('ratings', 'ratingsMovieId'), indices)
+        self.assertIn(('similarities', 'similaritiesMovieBId'), indices)
+        self.assertEqual(first_columns['ratingsMovieId'], 'movieId')
+        self.assertEqual(first_columns['similaritiesMovieBId'], 'movieBId')
+
+    def test_similarity_sums(self):
+        """Drop the "similaritySums" table, and assert reindexing adds it."""
+        load_path = run(('mr-db', 'load-path'))[0]
+        with sqlite3.connect(load_path) as conn:
+            conn.execute('DROP TABLE IF EXISTS similaritySums')
+        conn.close()
+        run(('mr-db', 'reindex'))
+        with sqlite3.connect(load_path) as conn:
+            tables = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )}
+        conn.close()
+        self.assertIn('similaritySums', tables)
+
+
+class CacheTestCase(unittest.TestCase):
+    """Test the cache of recommendations made by ``mr-recommend``."""
+
+    def test_invalidated_by_ingest(self):
+        """Ingest a rating between requests for recommendations.
+
+        Cached recommendations should match fresh ones, both before and after
+        the user rates one of the recommended movies.
+        """
+        run(('mr-analyze', 'ii', '--overwrite'))
+        run(('mr-analyze', 'ml', '--overwrite'))
+        commands = (
+            ('mr-recommend', 'ii', '1', '--count', '100', '--jobs', '1'),
+            ('mr-recommend', 'ml', '1', '--count', '100', '--format', 'csv'),
+        )
+        for command in commands:
+            with self.subTest(command=command):
+                fresh = run(command + ('--no-cache',))
+                self.assertEqual(run(command + ('--cache',)), fresh)
+                self.assertEqual(run(command + ('--cache',)), fresh)
+        load_path = run(('mr-db', 'load-path'))[0]
+        with sqlite3.connect(load_path) as conn:
+            cached = conn.execute(
+                'SELECT COUNT(*) FROM recommendations'
+            ).fetchone()[0]
+        conn.close()
+        self.assertEqual(cached, len(commands))
+
+        movie = run(commands[1])[1].split(',')[0]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'ratings.csv')
+            with open(path, 'w') as handle:
+                handle.write('userId,movieId,rating,timestamp\n')
+                handle.write(f'1,{movie},5.0,0\n')
+            run(('mr-db', 'ingest', path))
+        for command in commands:
+            with self.subTest(command=command):
+                fresh = run(command + ('--no-cache',))
+                self.assertEqual(run(command), fresh)
+        self.assertNotIn(
+            movie,
+            [line.split(',')[0] for line in run(commands[1])],
+        )
+
+
+class MovieGenresTestCase(unittest.TestCase):
+    """Test the "movieGenres" table."""
+
+    def test_matches_movies(self):
+        """Compare the table to the genres in the "movies" table.
+
+        Drop the table and call ``mr-db reindex`` first, so that re-creating
+        the table is exercised too.
+        """
+        load_path = run(('mr-db', 'load-path'))[0]
+        with sqlite3.connect(load_path) as conn:
+            conn.execute('DROP TABLE movieGenres')
+        conn.close()
+        run(('mr-db', 'reindex'))
+        with sqlite3.connect(load_path) as conn:
+            expected = {
+                (genre, row[0])
+                for row in conn.execute('SELECT movieId, genres FROM movies')
+                for genre in row[1].split('|')
+                if genre in GENRES
+            }
+            actual = set(conn.execute('SELECT genre, movieId FROM movieGenres'))
+        conn.close()
+        self.assertTrue(expected)
+        self.assertEqual(actual, expected)
+
+
+class IngestTestCase(unittest.TestCase):
+    """Call ``mr-db ingest``."""
+
+    def test_matches_analysis(self):
+        """Ingest ratings, and compare the result to a fresh analysis.
+
+        Similarity scores updated by ``mr-db ingest`` should match those
+        computed from scratch by ``mr-analyze ii --overwrite``. Ratings are
+        ingested twice, so that both the initial computation of each pair's
+        sums and their later update are exercised.
+        """
+        run(('mr-analyze', 'ii', '--overwrite'))
+        load_path = run(('mr-db', 'load-path'))[0]
+        pairs = self.first_pairs(load_path)
+        for rating in (1.0, 4.5):
+            self.ingest((user, movie, rating) for user, movie in pairs)
+        ingested = self.read_similarities(load_path)
+
+        run(('mr-analyze', 'ii', '--overwrite'))
+        analyzed = self.read_similarities(load_path)
+        self.assertEqual(set(ingested), set(analyzed))
+        for pair, score in analyzed.items():
+            self.assertAlmostEqual(ingested[pair], score)
+
+    def test_neighbours(self):
+        """Ingest ratings, and assert lists of neighbours are re-computed.
+
+        The lists should match those made from scratch by ``mr-analyze ii
+        --top-k``.
+        """
+        run(('mr-analyze', 'ii', '--overwrite', '--top-k', '2'))
+        load_path = run(('mr-db', 'load-path'))[0]
+        before = self.read_neighbours(load_path)
+        lines = self.ingest(((1, 5, 0.5), (4, 1, 5.0), (4, 2, 0.5)))
+        self.assertIn('lists of neighbours', lines[0])
+        ingested = self.read_neighbours(load_path)
+        self.assertNotEqual(ingested, before)
+
+        run(('mr-analyze', 'ii', '--overwrite', '--top-k', '2'))
+        analyzed = self.read_neighbours(load_path)
+        self.assertEqual(ingested.keys(), analyzed.keys())
+        for key, score in analyzed.items():
+            self.assertAlmostEqual(ingested[key], score)
+
+    @staticmethod
+    def first_pairs(db_path):
+        """Pair each of the first two users with each of the first movies."""
+        with sqlite3.connect(db_path) as conn:
+            users = [row[0] for row in conn.execute(
+                'SELECT DISTINCT userId FROM ratings ORDER BY userId LIMIT 2'
+            )]
+            movies = [row[0] for row in conn.execute(
+                'SELECT movieId FROM movies ORDER BY movieId LIMIT 3'
+            )]
+        conn.close()
+        return [(user, movie) for user in users for movie in movies]
+
+    @staticmethod
+    def ingest(ratings):
+        """Pass ``(user, movie, rating)`` tuples to ``mr-db ingest``."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'ratings.csv')
+            with open(path, 'w', encoding='utf-8') as handle:
+                handle.write('userId,movieId,rating,timestamp\n')
+                for user, movie, rating in ratings:
+                    handle.write(f'{user},{movie},{rating},0\n')
+            return run(('mr-db', 'ingest', path))
+
+    @staticmethod
+    def read_neighbours(db_path):
+        """Read the neighbours table into a dict."""
+        with sqlite3.connect(db_path) as conn:
+            neighbours = {
+                (row[0], row[1]): row[2]
+                for row in conn.execute('SELECT * FROM neighbours')
+            }
+        conn.close()
+        return neighbours
+
+    @staticmethod
+    def read_similarities(db_path):
+        """Read the similarities table into a dict."""
+        with sqlite3.connect(db_path) as conn:
+            similarities = {
+                (row[0], row[1]): row[2]
+                for row in conn.execute('SELECT * FROM similarities')
+            }
+        conn.close()
+        return similarities
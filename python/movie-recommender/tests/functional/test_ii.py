@@ -1,7 +1,15 @@
 # coding=utf-8
 """Tests for the item-item recommendation algorithm."""
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
 import unittest
 
+from movie_recommender.analyze import ii as analyze_ii
+from movie_recommender.db import common
+
 from .utils import backup_db, restore_db, run
 
 
@@ -72,6 +80,158 @@ class AnalyzeTestCase(unittest.TestCase):
         """Pass ``--jobs 2``."""
         run(('mr-analyze', 'ii', '--overwrite', '--jobs', '2'))
 
+    def test_engine_matrix(self):
+        """Pass ``--engine matrix``."""
+        run(('mr-analyze', 'ii', '--overwrite', '--engine', 'matrix'))
+
+    def test_engine_matrix_same_similarities(self):
+        """Assert ``--engine matrix`` writes the same similarities as "sql"."""
+        load_path = run(('mr-db', 'load-path'))[0]
+        similarities = {}
+        for engine in ('sql', 'matrix'):
+            # Make sure each engine writes every row it's compared on.
+            with sqlite3.connect(load_path) as conn:
+                conn.execute('DELETE FROM similarities')
+            conn.close()
+            run(('mr-analyze', 'ii', '--overwrite', '--engine', engine))
+            with sqlite3.connect(load_path) as conn:
+                similarities[engine] = dict(
+                    ((movie_a, movie_b), score)
+                    for movie_a, movie_b, score in conn.execute(
+                        'SELECT movieAId, movieBId, similarity '
+                        'FROM similarities'
+                    )
+                )
+            conn.close()
+        sql_scores = similarities['sql']
+        matrix_scores = similarities['matrix']
+        self.assertGreater(len(sql_scores), 0)
+        self.assertEqual(sql_scores.keys(), matrix_scores.keys())
+        for pair, score in sql_scores.items():
+            with self.subTest(pair=pair):
+                self.assertAlmostEqual(score, matrix_scores[pair], places=9)
+
+    def test_engine_matrix_movie_ids(self):
+        """Pass ``--engine matrix`` and ``--movie-ids``."""
+        run((
+            'mr-analyze', 'ii',
+            '--engine', 'matrix',
+            '--movie-ids', '1', '2',
+            '--no-overwrite',
+        ))
+
+    def test_engine_snapshot(self):
+        """Pass ``--engine snapshot``."""
+        run(('mr-analyze', 'ii', '--overwrite', '--engine', 'snapshot'))
+
+    def test_resume(self):
+        """Pass ``--resume``, after an analysis, and after none."""
+        run(('mr-analyze', 'ii', '--overwrite', '--resume', '-m', '1', '2'))
+        run(('mr-analyze', 'ii', '--overwrite', '-m', '1', '2'))
+        run(('mr-analyze', 'ii', '--overwrite', '--resume', '-m', '1', '2'))
+
+    def test_resume_top_k(self):
+        """Assert ``--resume`` can't be combined with ``--top-k``."""
+        with self.assertRaises(subprocess.CalledProcessError):
+            run(('mr-analyze', 'ii', '--resume', '--top-k', '2'))
+
+    def test_stats(self):
+        """Pass ``--stats``, and assert statistics are printed to stderr.
+
+        The queries that each engine reads ratings with should be timed.
+        """
+        queries = {
+            'sql': {'avg_ratings', 'load_ratings'},
+            'matrix': {'avg_ratings', 'ratings'},
+        }
+        for engine, engine_queries in queries.items():
+            with self.subTest(engine=engine):
+                stats = json.loads(subprocess.run(
+                    (
+                        'mr-analyze', 'ii', '--overwrite', '--stats',
+                        '--engine', engine, '-m', '1', '2',
+                    ),
+                    check=True,
+                    stderr=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    universal_newlines=True,
+                ).stderr)
+                self.assertGreater(
+                    stats['phases']['analyze_movies']['pairs'],
+                    0,
+                )
+                self.assertIn('similarities', stats['writes'])
+                self.assertLessEqual(engine_queries, stats['sql'].keys())
+                if engine == 'sql':
+                    self.assertIn('analyze_movies', stats['workers'])
+
+    def test_prometheus(self):
+        """Pass ``--prometheus``, and assert a metrics file is written."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'metrics.prom')
+            run((
+                'mr-analyze', 'ii',
+                '--overwrite',
+                '--prometheus', path,
+                '-m', '1', '2',
+            ))
+            with open(path, encoding='utf-8') as handle:
+                metrics = handle.read()
+        self.assertIn(
+            'movie_recommender_phase_seconds_count{phase="analyze_movies"} 1',
+            metrics,
+        )
+
+    def test_top_k(self):
+        """Pass ``--top-k``."""
+        run((
+            'mr-analyze', 'ii',
+            '--top-k', '2',
+            '--movie-ids', '1', '2',
+            '--overwrite',
+        ))
+
+    def test_top_k_engine_matrix(self):
+        """Pass ``--top-k`` and ``--engine matrix``."""
+        run((
+            'mr-analyze', 'ii',
+            '--engine', 'matrix',
+            '--top-k', '2',
+            '--movie-ids', '1', '2',
+            '--overwrite',
+        ))
+
+
+class ComputeSimilarityTestCase(unittest.TestCase):
+    """Compare movies one pair at a time, in-process."""
+
+    def test_compute_similarity(self):
+        """Assert per-pair similarities match those of ``mr-analyze ii``."""
+        run(('mr-analyze', 'ii', '--overwrite'))
+        # Later tests replace the database, so this process mustn't keep
+        # connections to it open.
+        self.addCleanup(common.close_db_conns)
+        load_path = run(('mr-db', 'load-path'))[0]
+        with sqlite3.connect(load_path) as conn:
+            rows = conn.execute(
+                'SELECT movieAId, movieBId, similarity FROM similarities '
+                'ORDER BY similarity != 0 DESC, movieAId, movieBId LIMIT 20'
+            ).fetchall()
+        conn.close()
+        self.assertGreater(len(rows), 0)
+        for movie_a, movie_b, score in rows:
+            with self.subTest(movie_a=movie_a, movie_b=movie_b):
+                self.assertTrue(
+                    analyze_ii.similarity_computed(movie_a, movie_b)
+                )
+                self.assertAlmostEqual(
+                    analyze_ii.compute_similarity(movie_a, movie_b),
+                    score,
+                    places=9,
+                )
+        with self.assertRaises(ValueError):
+            analyze_ii.compute_similarity(rows[0][0], rows[0][0])
+
 
 class RecommendTestCase(unittest.TestCase):
     """Generate recommendations for each user."""
@@ -89,3 +249,57 @@ class RecommendTestCase(unittest.TestCase):
             'mr-recommend', 'ii', '1', '--count', '2', '--no-progress'
         ))
         self.assertEqual(len(lines), 2, lines)
+
+    def test_engine_pool(self):
+        """Generate recommendations with ``--engine pool``."""
+        # Cached recommendations are shared by every engine.
+        batch_lines = run((
+            'mr-recommend', 'ii', '1', '--count', '2', '--engine', 'batch',
+            '--no-cache'
+        ))
+        pool_lines = run((
+            'mr-recommend', 'ii', '1', '--count', '2', '--engine', 'pool',
+            '--no-progress', '--no-cache'
+        ))
+        self.assertEqual(batch_lines, pool_lines)
+
+    def test_engine_snapshot(self):
+        """Generate recommendations with ``--engine snapshot``."""
+        pool_lines = run((
+            'mr-recommend', 'ii', '1', '--count', '2', '--engine', 'pool',
+            '--no-progress', '--no-cache'
+        ))
+        snapshot_lines = run((
+            'mr-recommend', 'ii', '1', '--count', '2', '--engine', 'snapshot',
+            '--no-progress', '--no-cache'
+        ))
+        self.assertEqual(pool_lines, snapshot_lines)
+
+    def test_stats(self):
+        """Pass ``--stats``, and assert statistics are printed to stderr."""
+        proc = subprocess.run(
+            (
+                'mr-recommend', 'ii', '1', '--count', '2', '--engine', 'pool',
+                '--no-progress', '--no-cache', '--stats'
+            ),
+            check=True,
+            stderr=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.assertEqual(len(proc.stdout.splitlines()), 2, proc.stdout)
+        stats = json.loads(proc.stderr)
+        self.assertGreater(stats['phases']['recommend']['movies'], 0)
+        self.assertGreater(stats['sql']['similar_movies_for_user']['calls'], 0)
+
+    def test_store(self):
+        """Generate recommendations with a similarity store."""
+        path = run(('mr-db', 'export-store'))[0].split(' to ', 1)[1]
+        try:
+            lines = run((
+                'mr-recommend', 'ii', '1', '--count', '2', '--engine', 'pool',
+                '--no-progress'
+            ))
+            self.assertEqual(len(lines), 2, lines)
+        finally:
+            run(('rm', path))
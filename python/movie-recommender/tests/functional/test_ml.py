@@ -116,3 +116,17 @@ class RecommendTestCase(unittest.TestCase):
         ))
         self.assertEqual(len(lines), 3, lines)
         self.assertEqual(lines[1], '10,4.0')
+
+    def test_engine_per_movie(self):
+        """Generate recommendations with ``--engine per-movie``."""
+        for user in ('1', '2', '3', '4'):
+            with self.subTest(user=user):
+                batch_lines = run((
+                    'mr-recommend', 'ml', user, '--count', '5', '--format',
+                    'csv', '--engine', 'batch',
+                ))
+                per_movie_lines = run((
+                    'mr-recommend', 'ml', user, '--count', '5', '--format',
+                    'csv', '--engine', 'per-movie',
+                ))
+                self.assertEqual(batch_lines, per_movie_lines)
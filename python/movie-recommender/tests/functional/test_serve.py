@@ -0,0 +1,182 @@
+# coding=utf-8
+"""Tests for answering requests with ``mr-serve``."""
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import unittest
+
+from movie_recommender.db import common
+from movie_recommender.serve import Server
+
+from .utils import backup_db, restore_db, run
+
+
+def setUpModule():  # pylint:disable=invalid-name
+    """Back up the current database if one exists, and create a new one."""
+    backup_db()
+    run(('mr-dataset', 'install', 'fixture'))
+    run(('mr-db', 'create', 'fixture'))
+    run(('mr-analyze', 'ii'))
+    run(('mr-analyze', 'ml'))
+
+
+def tearDownModule():  # pylint:disable=invalid-name
+    """Delete the current database, and restore the old one."""
+    load_path = run(('mr-db', 'load-path'))[0]
+    run(('rm', load_path))
+    restore_db()
+
+
+class ServeTestCase(unittest.TestCase):
+    """Send requests to ``mr-serve``, over a Unix socket."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a server, and wait for it to listen."""
+        cls.resources = contextlib.ExitStack()
+        tmpdir = cls.resources.enter_context(tempfile.TemporaryDirectory())
+        cls.socket_path = os.path.join(tmpdir, 'mr.sock')
+        cls.server = cls.resources.enter_context(subprocess.Popen(
+            ('mr-serve', '--socket', cls.socket_path),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ))
+        cls.server.stdout.readline()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the server, and delete its socket's directory."""
+        cls.server.terminate()
+        cls.resources.close()
+
+    def request(self, *requests):
+        """Send requests over one connection, and return the responses."""
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(self.socket_path)
+            with sock.makefile('rw') as handle:
+                responses = []
+                for request in requests:
+                    handle.write(json.dumps(request) + '\n')
+                    handle.flush()
+                    responses.append(json.loads(handle.readline()))
+        return responses
+
+    def test_recommend_ml(self):
+        """Compare recommendations to those of ``mr-recommend ml``."""
+        response = self.request({
+            'command': 'recommend',
+            'algorithm': 'ml',
+            'user': 1,
+            'count': 3,
+        })[0]
+        lines = run((
+            'mr-recommend', 'ml', '1',
+            '--count', '3', '--format', 'csv', '--no-cache',
+        ))
+        self.assertEqual(
+            [
+                f"{pred['movie']},{pred['pred_rating']:.1f}"
+                for pred in response['predictions']
+            ],
+            [line for line in lines[1:] if line],
+        )
+
+    def test_predict(self):
+        """Compare predictions to those of ``mr-predict``."""
+        for algorithm in ('ii', 'ml'):
+            with self.subTest(algorithm=algorithm):
+                response = self.request({
+                    'command': 'predict',
+                    'algorithm': algorithm,
+                    'user': 1,
+                    'movie': 11,
+                })[0]
+                line = run(('mr-predict', algorithm, '1', '11'))[0]
+                self.assertIn(
+                    f"{response['prediction']['pred_rating']:.1f}",
+                    line,
+                )
+
+    def test_repeated(self):
+        """Send identical requests over one connection.
+
+        Each should be answered the same.
+        """
+        request = {
+            'command': 'recommend',
+            'algorithm': 'ii',
+            'user': 2,
+            'count': 2,
+        }
+        responses = self.request(request, request, request)
+        self.assertEqual(len(responses[0]['predictions']), 2)
+        self.assertEqual(responses[1:], responses[:2])
+
+    def test_errors(self):
+        """Send bad requests, and check that errors are returned."""
+        for request in (
+                [],
+                {'command': 'recommend', 'algorithm': 'ii', 'user': -1},
+                {'command': 'predict', 'algorithm': 'ii', 'user': 1},
+                {'command': 'dance', 'algorithm': 'ii', 'user': 1},
+                {'command': 'recommend', 'algorithm': 'xx', 'user': 1},
+                {'command': 'recommend', 'algorithm': 'ii', 'user': True}):
+            with self.subTest(request=request):
+                self.assertIn('error', self.request(request)[0])
+
+    def test_too_long(self):
+        """Send a request longer than the server's buffer.
+
+        An error should be returned, and the connection closed.
+        """
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(self.socket_path)
+            with sock.makefile('rw') as handle:
+                handle.write(json.dumps({
+                    'command': 'x' * 2 ** 16,
+                    'algorithm': 'ii',
+                    'user': 1,
+                }) + '\n')
+                handle.flush()
+                self.assertIn('error', json.loads(handle.readline()))
+                self.assertEqual(handle.readline(), '')
+        # The server should still answer other clients.
+        self.assertIn('predictions', self.request({
+            'command': 'recommend',
+            'algorithm': 'ii',
+            'user': 1,
+        })[0])
+
+
+class AnswerBatchTestCase(unittest.TestCase):
+    """Answer batches of requests in-process, with ``Server.answer_batch``."""
+
+    def test_bad_and_good(self):
+        """Answer a batch of bad and good requests.
+
+        Each bad request should be answered with an error, and each good one
+        should be answered as if it were alone.
+        """
+        good = {'command': 'recommend', 'algorithm': 'ii', 'user': 2,
+                'count': 2}
+        bad = (
+            {'command': 'recommend', 'algorithm': 'ml', 'user': 1,
+             'predictor': ['year']},
+            {'command': 'predict', 'algorithm': 'ml', 'user': 1, 'movie': 11,
+             'predictor': 5},
+            {'command': 'predict', 'algorithm': 'ml', 'user': 1, 'movie': 11,
+             'predictor': 'genre:Nope'},
+        )
+        # Later tests replace the database, so this process mustn't keep
+        # connections to it open.
+        self.addCleanup(common.close_db_conns)
+        server = Server()
+        alone = server.answer_batch([good])[0]
+        responses = server.answer_batch([bad[0], good, *bad[1:]])
+        self.assertEqual(responses[1], alone)
+        self.assertEqual(len(alone['predictions']), 2)
+        for response in responses[:1] + responses[2:]:
+            self.assertIn('error', response)
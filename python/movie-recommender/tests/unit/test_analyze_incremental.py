@@ -0,0 +1,104 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.incremental`."""
+import statistics
+import unittest
+
+from movie_recommender.analyze import incremental
+from movie_recommender.db import common
+
+
+def user_sums(ratings, avg_rating):
+    """Compute one user's contribution to every pair of movies they've rated.
+
+    :param ratings: A dict in the form ``{movie_id: rating}``.
+    :param avg_rating: The average of ``ratings``.
+    :return: A dict in the form ``{(movie_a, movie_b): sums}``.
+    """
+    movies = sorted(ratings)
+    return {
+        (movie_a, movie_b): incremental.pair_terms(
+            ratings[movie_a],
+            ratings[movie_b],
+            avg_rating,
+        )
+        for i, movie_a in enumerate(movies)
+        for movie_b in movies[i + 1:]
+    }
+
+
+class SumsDeltasTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.incremental.sums_deltas`."""
+
+    def check_deltas(self, old_ratings, new_ratings):
+        """Assert that old sums plus deltas equal new sums.
+
+        :param old_ratings: A dict in the form ``{movie_id: rating}``.
+        :param new_ratings: A dict in the form ``{movie_id: rating}``.
+        :return: The deltas.
+        """
+        old_avg = None
+        if old_ratings:
+            old_avg = statistics.mean(old_ratings.values())
+        new_avg = statistics.mean(new_ratings.values())
+        old_sums = user_sums(old_ratings, old_avg) if old_ratings else {}
+        new_sums = user_sums(new_ratings, new_avg)
+        deltas = incremental.sums_deltas(
+            old_ratings,
+            old_avg,
+            new_ratings,
+            new_avg,
+        )
+        for pair in set(old_sums) | set(new_sums):
+            expected = new_sums.get(pair, (0, 0, 0, 0))
+            actual = incremental.add_sums(
+                old_sums.get(pair, (0, 0, 0, 0)),
+                deltas.get(pair, (0, 0, 0, 0)),
+            )
+            for expected_val, actual_val in zip(expected, actual):
+                self.assertAlmostEqual(expected_val, actual_val)
+        return deltas
+
+    def test_new_user(self):
+        """Add ratings for a user who has no ratings."""
+        deltas = self.check_deltas({}, {1: 4.0, 2: 2.5, 3: 1.0})
+        self.assertEqual(set(deltas), {(1, 2), (1, 3), (2, 3)})
+
+    def test_avg_changes(self):
+        """Add a rating which changes the user's average rating."""
+        deltas = self.check_deltas(
+            {1: 4.0, 2: 2.5, 3: 1.0},
+            {1: 4.0, 2: 2.5, 3: 1.0, 4: 5.0},
+        )
+        self.assertEqual(len(deltas), 6)
+
+    def test_avg_unchanged(self):
+        """Add a rating which leaves the user's average rating unchanged.
+
+        Only pairs including the new movie should be touched.
+        """
+        deltas = self.check_deltas(
+            {1: 4.0, 2: 2.0},
+            {1: 4.0, 2: 2.0, 3: 3.0},
+        )
+        self.assertEqual(set(deltas), {(1, 3), (2, 3)})
+
+    def test_replace(self):
+        """Replace one of the user's ratings."""
+        self.check_deltas(
+            {1: 4.0, 2: 2.5, 3: 1.0},
+            {1: 4.0, 2: 0.5, 3: 1.0},
+        )
+
+
+class SimilarityFromSumsTestCase(unittest.TestCase):
+    """Test ``similarity_from_sums``."""
+
+    def test_zero_denominator(self):
+        """Assert a zero denominator yields a score of 0."""
+        sums = common.SimilaritySums(0, 0, 1, 1)
+        self.assertEqual(incremental.similarity_from_sums(sums), 0)
+
+    def test_score(self):
+        """Assert a score is computed from the sums."""
+        sums = common.SimilaritySums(-2, 4, 1, 2)
+        self.assertEqual(incremental.similarity_from_sums(sums), -1)
@@ -0,0 +1,41 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.matrix`."""
+import random
+import unittest
+
+import numpy
+
+from movie_recommender.analyze import ii, matrix
+
+
+class SelectNeighboursTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.matrix.select_neighbours`."""
+
+    def test_zeros(self):
+        """Assert zero scores are never selected."""
+        scores = numpy.array([0, 0.5, 0, -0.25])
+        chosen = matrix.select_neighbours(scores, 3)
+        self.assertEqual(chosen.tolist(), [1, 3])
+
+    def test_magnitude(self):
+        """Assert scores are selected by magnitude, not by value."""
+        scores = numpy.array([0.1, -0.9, 0.5, 0.2])
+        chosen = matrix.select_neighbours(scores, 2)
+        self.assertEqual(chosen.tolist(), [1, 2])
+
+    def test_push_neighbour(self):
+        """Assert the same neighbours are chosen as by ``push_neighbour``.
+
+        Draw scores from a small set of values, so that many scores are tied.
+        """
+        rnd = random.Random(0)
+        for top_k in (1, 3, 10):
+            scores = [rnd.choice((-1, -0.5, 0, 0.5, 1)) for _ in range(50)]
+            heap = []
+            for neighbour, score in enumerate(scores):
+                ii.push_neighbour(heap, top_k, neighbour, score)
+            chosen = matrix.select_neighbours(numpy.array(scores), top_k)
+            self.assertEqual(
+                sorted(chosen.tolist()),
+                sorted(neighbour for _, _, neighbour, _ in heap),
+            )
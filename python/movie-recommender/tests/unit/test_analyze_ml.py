@@ -0,0 +1,113 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.ml`."""
+import random
+import unittest
+
+from movie_recommender import exceptions
+from movie_recommender.analyze import ml
+from movie_recommender.constants import ML_TASKS_PER_PROCESS
+from movie_recommender.graph import Graph, Point
+from movie_recommender.predict.ml import clamp_rating
+
+
+def brute_force_predict(points, point):
+    """Predict a point's y coordinate by fitting a line to the other points.
+
+    This is how :func:`movie_recommender.analyze.ml.calc_sse` used to make
+    predictions.
+    """
+    others = list(points)
+    others.remove(point)
+    graph = Graph(others)
+    try:
+        rating = graph.predict_y(point.x)
+    except exceptions.VerticalLineOfBestFitGraphError:
+        rating = graph.avg_point.y
+    return clamp_rating(rating)
+
+
+class MakeLooPredictorTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.ml.make_loo_predictor`."""
+
+    def assert_matches_brute_force(self, points):
+        """Assert each prediction matches :func:`brute_force_predict`."""
+        predictor = ml.make_loo_predictor(points)
+        for point in points:
+            with self.subTest(point=point):
+                self.assertAlmostEqual(
+                    predictor(point),
+                    brute_force_predict(points, point),
+                )
+
+    def test_one_point(self):
+        """Assert there's nothing to predict from."""
+        point = Point(1995, 4)
+        predictor = ml.make_loo_predictor((point,))
+        with self.assertRaises(exceptions.EmptyGraphError):
+            predictor(point)
+
+    def test_two_points(self):
+        """Assert each point is predicted from the other."""
+        points = (Point(1995, 4), Point(2005, 2.5))
+        predictor = ml.make_loo_predictor(points)
+        self.assertEqual(predictor(points[0]), 2.5)
+        self.assertEqual(predictor(points[1]), 4)
+
+    def test_vertical(self):
+        """Make predictions when the other points have the same x."""
+        self.assert_matches_brute_force(
+            (Point(0, 1), Point(0, 2), Point(0, 4.5), Point(1, 3)),
+        )
+
+    def test_clamped(self):
+        """Assert predictions are clamped."""
+        points = (Point(0, 0.5), Point(1, 5), Point(2, 5), Point(3, 0.5))
+        predictor = ml.make_loo_predictor(points)
+        for point in points:
+            self.assertGreaterEqual(predictor(point), 0.5)
+            self.assertLessEqual(predictor(point), 5)
+        self.assert_matches_brute_force(points)
+
+    def test_years(self):
+        """Make predictions from random years and ratings."""
+        rnd = random.Random(0)
+        self.assert_matches_brute_force(tuple(
+            Point(rnd.randint(1920, 2020), rnd.randint(1, 10) / 2)
+            for _ in range(50)
+        ))
+
+    def test_genre(self):
+        """Make predictions from random genre flags and ratings."""
+        rnd = random.Random(0)
+        self.assert_matches_brute_force(tuple(
+            Point(rnd.randint(0, 1), rnd.randint(1, 10) / 2)
+            for _ in range(50)
+        ))
+
+
+class ScheduleTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.ml.schedule`."""
+
+    def test_empty(self):
+        """Schedule no users."""
+        self.assertEqual(ml.schedule({}, 2), [])
+
+    def test_every_user(self):
+        """Assert each user is scheduled exactly once."""
+        costs = {user_id: (user_id % 7) ** 2 for user_id in range(100)}
+        tasks = ml.schedule(costs, 2)
+        user_ids = [user_id for task in tasks for user_id in task]
+        self.assertEqual(sorted(user_ids), sorted(costs))
+
+    def test_heavy_first(self):
+        """Assert heavy users are scheduled first, in a task of their own."""
+        costs = {user_id: 1 for user_id in range(100)}
+        costs[50] = 10 ** 6
+        tasks = ml.schedule(costs, 2)
+        self.assertEqual(tasks[0], (50,))
+
+    def test_light_batched(self):
+        """Assert light users are packed together."""
+        costs = {user_id: 1 for user_id in range(1000)}
+        tasks = ml.schedule(costs, 2)
+        self.assertEqual(len(tasks), 2 * ML_TASKS_PER_PROCESS)
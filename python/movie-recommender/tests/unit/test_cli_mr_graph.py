@@ -2,7 +2,15 @@
 """Unit tests for :mod:`movie_recommender.cli.mr_graph`."""
 import unittest
 
-from movie_recommender.cli.mr_graph import Columns, get_points
+from movie_recommender.cli.mr_graph import (
+    Columns,
+    get_coordinates,
+    get_points,
+    split_file,
+    summarize_file,
+    summarize_range,
+)
+from movie_recommender.graph import ArrayGraph
 from movie_recommender.graph import Point
 from .utils import get_fixture
 
@@ -35,3 +43,67 @@ class GetPointsTestCase(unittest.TestCase):
             for i, point in enumerate(
                     get_points(handle, Columns(0, 1), header_rows=1)):
                 self.assertEqual(point, self.points[i])
+
+
+class GetCoordinatesTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.cli.mr_graph.get_coordinates`."""
+
+    def test_header_row(self):
+        """Assert the coordinates match those from ``get_points``."""
+        with open(get_fixture('xy.csv')) as handle:
+            points = tuple(get_points(handle, Columns(0, 1)))
+        with open(get_fixture('xy-header.csv')) as handle:
+            x, y = get_coordinates(handle, Columns(0, 1), header_rows=1)
+        self.assertEqual(x.tolist(), [point.x for point in points])
+        self.assertEqual(y.tolist(), [point.y for point in points])
+
+
+class SplitFileTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.cli.mr_graph.split_file`."""
+
+    def test_line_aligned(self):
+        """Assert ranges are contiguous, and start at the start of a line."""
+        path = get_fixture('xy-header.csv')
+        with open(path, 'rb') as handle:
+            content = handle.read()
+        header_end = content.index(b'\n') + 1
+        for jobs in (1, 2, 3, 50):
+            with self.subTest(jobs=jobs):
+                ranges = split_file(path, jobs, header_rows=1)
+                self.assertLessEqual(len(ranges), jobs)
+                self.assertEqual(ranges[0][0], header_end)
+                self.assertEqual(ranges[-1][1], len(content))
+                for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+                    self.assertEqual(end, start)
+                    self.assertEqual(content[start - 1:start], b'\n')
+
+
+class SummarizeTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.cli.mr_graph.summarize_file`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Analyze the points in a fixture."""
+        with open(get_fixture('xy.csv')) as handle:
+            cls.graph = ArrayGraph(*get_coordinates(handle, Columns(0, 1)))
+
+    def test_range(self):
+        """Summarize a whole file as one range."""
+        path = get_fixture('xy-header.csv')
+        (start, end), = split_file(path, 1, header_rows=1)
+        graph = summarize_range(path, start, end, Columns(0, 1))
+        self.assertAlmostEqual(graph.slope, self.graph.slope)
+        self.assertAlmostEqual(graph.sse, self.graph.sse)
+
+    def test_jobs(self):
+        """Summarize a file with several processes."""
+        graph = summarize_file(
+            get_fixture('xy-header.csv'),
+            Columns(0, 1),
+            header_rows=1,
+            jobs=3,
+        )
+        self.assertEqual(graph.moments.count, len(self.graph.x))
+        self.assertAlmostEqual(graph.slope, self.graph.slope)
+        self.assertAlmostEqual(graph.y_intercept, self.graph.y_intercept)
+        self.assertAlmostEqual(graph.sse, self.graph.sse)
@@ -0,0 +1,38 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.cli.utils`."""
+import unittest
+
+from movie_recommender.cli.utils import estimate_remaining, format_duration
+
+
+class EstimateRemainingTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.cli.utils.estimate_remaining`."""
+
+    def test_rate(self):
+        """Assert the observed rate of progress is extrapolated."""
+        self.assertEqual(estimate_remaining((0, 0), (10, 0.25)), 30)
+
+    def test_resumed(self):
+        """Assert progress made before the start doesn't count."""
+        self.assertEqual(estimate_remaining((0, 0.5), (10, 0.75)), 10)
+
+    def test_unknown(self):
+        """Assert no estimate is made without enough information."""
+        for now in ((0.5, 0.5), (10, 0), (10, 1)):
+            with self.subTest(now=now):
+                self.assertIsNone(estimate_remaining((0, 0), now))
+
+
+class FormatDurationTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.cli.utils.format_duration`."""
+
+    def test_units(self):
+        """Assert only the two largest units are shown."""
+        for seconds, formatted in (
+                (0, '0s'),
+                (59.6, '1m 00s'),
+                (200, '3m 20s'),
+                (3900, '1h 05m'),
+                (90061, '25h 01m')):
+            with self.subTest(seconds=seconds):
+                self.assertEqual(format_duration(seconds), formatted)
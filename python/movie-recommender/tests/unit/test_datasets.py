@@ -0,0 +1,78 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.datasets`."""
+import collections
+import csv
+import os
+import tempfile
+import unittest
+
+from movie_recommender import exceptions
+from movie_recommender.constants import GENRES
+from movie_recommender.datasets import SyntheticShape, write_synthetic_dataset
+from movie_recommender.db import read
+
+
+class WriteSyntheticDatasetTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.datasets.write_synthetic_dataset`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Write a small dataset, and read it back."""
+        cls.shape = SyntheticShape(users=30, movies=50, min_ratings=5)
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            cls.num_ratings = write_synthetic_dataset(dataset_dir, cls.shape)
+            cls.files = {}
+            for name in ('links', 'movies', 'ratings', 'tags'):
+                path = os.path.join(dataset_dir, f'{name}.csv')
+                with open(path, encoding='utf-8') as handle:
+                    cls.files[name] = handle.read()
+
+    def rows(self, name):
+        """Parse one of the dataset's files."""
+        return list(csv.DictReader(self.files[name].splitlines()))
+
+    def test_deterministic(self):
+        """Assert the same shape and seed yield the same dataset."""
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            write_synthetic_dataset(dataset_dir, self.shape)
+            path = os.path.join(dataset_dir, 'ratings.csv')
+            with open(path, encoding='utf-8') as handle:
+                self.assertEqual(handle.read(), self.files['ratings'])
+
+    def test_movies(self):
+        """Assert each movie has a unique ID, and known genres."""
+        movies = self.rows('movies')
+        self.assertEqual(len(movies), self.shape.movies)
+        self.assertEqual(len({movie['movieId'] for movie in movies}),
+                         self.shape.movies)
+        for movie in movies:
+            self.assertLessEqual(set(movie['genres'].split('|')), GENRES)
+            try:
+                self.assertLessEqual(read.year(movie['title']), 2018)
+            except exceptions.NoMovieYearError:
+                pass
+
+    def test_ratings(self):
+        """Assert each user rates enough movies, once each, in half stars."""
+        ratings = self.rows('ratings')
+        self.assertEqual(len(ratings), self.num_ratings)
+        movie_ids = {movie['movieId'] for movie in self.rows('movies')}
+        per_user = collections.Counter(rating['userId'] for rating in ratings)
+        self.assertEqual(len(per_user), self.shape.users)
+        self.assertGreaterEqual(min(per_user.values()), self.shape.min_ratings)
+        self.assertEqual(
+            len({(rating['userId'], rating['movieId']) for rating in ratings}),
+            len(ratings),
+        )
+        for rating in ratings:
+            self.assertIn(rating['movieId'], movie_ids)
+            self.assertIn(float(rating['rating']) * 2, range(1, 11))
+
+    def test_no_min_ratings(self):
+        """Assert users may have no ratings, if ``min_ratings`` is 0."""
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            num_ratings = write_synthetic_dataset(
+                dataset_dir,
+                self.shape._replace(min_ratings=0),
+            )
+        self.assertEqual(num_ratings, 0)
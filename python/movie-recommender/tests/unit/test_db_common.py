@@ -1,12 +1,48 @@
 # coding=utf-8
 """Unit tests for :mod:`movie_recommender.db.common`."""
+import gc
+import io
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
 
+import numpy
+
+from movie_recommender.constants import GENRE_BITS
 from movie_recommender.db import common
 
 from .utils import get_fixture
 
 
+class GenreBitmaskTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.db.common.genre_bitmask`."""
+
+    def test_no_genres(self):
+        """Encode an empty iterable of genres."""
+        self.assertEqual(common.genre_bitmask(()), 0)
+
+    def test_genres(self):
+        """Assert each genre sets its own bit."""
+        bitmask = common.genre_bitmask(('Action', 'Comedy'))
+        for genre, bit in GENRE_BITS.items():
+            with self.subTest(genre=genre):
+                self.assertEqual(
+                    bool(bitmask & bit),
+                    genre in ('Action', 'Comedy'),
+                )
+
+    def test_unknown_genre(self):
+        """Assert unknown genres are ignored."""
+        self.assertEqual(
+            common.genre_bitmask(('Action', 'IMAX')),
+            GENRE_BITS['Action'],
+        )
+
+
 class ParseCSVTestCase(unittest.TestCase):
     """Tests for :func:`movie_recommender.db.common.parse_csv`."""
 
@@ -47,3 +83,129 @@ class ParseCSVTestCase(unittest.TestCase):
                     (0.269, 4.47),
                 ),
             )
+
+
+class ParseNumericCSVTestCase(unittest.TestCase):
+    """Tests for :func:`movie_recommender.db.common.parse_numeric_csv`."""
+
+    def test_casts(self):
+        """Verify the function casts each column and skips headers."""
+        with open(get_fixture('xy-header.csv')) as handle:
+            rows = tuple(itertools.chain.from_iterable(
+                common.parse_numeric_csv(
+                    handle,
+                    (numpy.float64, numpy.int64),
+                    header_rows=2,
+                )
+            ))
+        self.assertEqual(
+            rows,
+            (
+                (0.265, 4),
+                (0.250, 3),
+                (0.256, 4),
+                (0.270, 4),
+                (0.250, 4),
+                (0.269, 4),
+            ),
+        )
+        self.assertIsInstance(rows[0][1], int)
+
+    def test_empty(self):
+        """Verify the function yields nothing if there are only headers."""
+        with open(get_fixture('xy-header.csv')) as handle:
+            rows = tuple(common.parse_numeric_csv(
+                handle,
+                (numpy.float64, numpy.float64),
+                header_rows=8,
+            ))
+        self.assertEqual(rows, ())
+
+    def test_too_narrow(self):
+        """Verify the function raises an error if rows are too narrow."""
+        with open(get_fixture('xy.csv')) as handle:
+            with self.assertRaises(ValueError):
+                tuple(common.parse_numeric_csv(
+                    handle,
+                    (numpy.float64, numpy.float64, numpy.float64),
+                    header_rows=0,
+                ))
+
+    def test_uneven(self):
+        """Verify the function raises an error if rows have uneven widths.
+
+        The chunk has a multiple of three fields in total, but they mustn't be
+        re-split into made-up rows.
+        """
+        handle = io.StringIO(
+            'userId,movieId,rating\n1,10,4.0\n2,20,3.5,999,7,8\n'
+        )
+        with self.assertRaises(ValueError):
+            tuple(common.parse_numeric_csv(
+                handle,
+                (numpy.int64, numpy.int64, numpy.float64),
+            ))
+
+
+class GetDbConnTestCase(unittest.TestCase):
+    """Tests for :func:`movie_recommender.db.common.get_db_conn`."""
+
+    def setUp(self):
+        """Create a temporary directory to hold a database."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.db_path = os.path.join(tmpdir, 'db.db')
+
+    def tearDown(self):
+        """Close persistent connections, before the database is deleted."""
+        common.close_db_conns()
+
+    def test_explicit_path(self):
+        """Verify a connection to an explicit path is closed on exit."""
+        with common.get_db_conn(self.db_path) as conn:
+            conn.execute('SELECT 1')
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+
+    def test_persistent(self):
+        """Verify persistent connections are re-used until closed."""
+        conn = common.get_persistent_db_conn(self.db_path)
+        self.assertIs(conn, common.get_persistent_db_conn(self.db_path))
+        common.close_db_conns()
+        self.assertIsNot(conn, common.get_persistent_db_conn(self.db_path))
+
+    def test_thread_exit(self):
+        """Verify a thread's persistent connection is closed when it exits."""
+        conns = []
+        thread = threading.Thread(
+            target=lambda: conns.append(
+                common.get_persistent_db_conn(self.db_path)
+            ),
+        )
+        thread.start()
+        thread.join()
+        gc.collect()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conns[0].execute('SELECT 1')
+
+    def test_replaced(self):
+        """Verify a new connection is opened if the database is replaced."""
+        new_path = self.db_path + '.new'
+        for path, table in ((self.db_path, 'old'), (new_path, 'new')):
+            with common.get_db_conn(path) as conn:
+                conn.execute(f'CREATE TABLE {table} (id INTEGER)')
+        query = 'SELECT name FROM sqlite_master'
+        conn = common.get_persistent_db_conn(self.db_path)
+        self.assertEqual(conn.execute(query).fetchall(), [('old',)])
+        os.replace(new_path, self.db_path)
+        conn = common.get_persistent_db_conn(self.db_path)
+        self.assertEqual(conn.execute(query).fetchall(), [('new',)])
+
+    def test_pragmas(self):
+        """Verify connections are tuned as documented."""
+        conn = common.get_persistent_db_conn(self.db_path)
+        self.assertEqual(
+            conn.execute('PRAGMA journal_mode').fetchone()[0],
+            'wal',
+        )
+        self.assertGreater(conn.execute('PRAGMA mmap_size').fetchone()[0], 0)
@@ -0,0 +1,160 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.snapshot`."""
+import math
+import pickle
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.analyze import ii as analyze_ii
+from movie_recommender.db import snapshot
+
+
+class SnapshotTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.db.snapshot.Snapshot`."""
+
+    def setUp(self):
+        """Create a small snapshot of ratings."""
+        self.snapshot = snapshot.Snapshot.create(snapshot.group_entries(
+            'ratings',
+            numpy.array([2, 1, 2, 1]),
+            user_ids=numpy.array([4, 3, 1, 1], dtype=numpy.int32),
+            values=numpy.array([1, 2, 3, 4], dtype=numpy.float32),
+        ))
+
+    def tearDown(self):
+        """Free the snapshot."""
+        self.snapshot.close()
+
+    def testgroup_entries(self):
+        """Assert entries are sorted by movie, then by ID."""
+        self.assertEqual(self.snapshot['ratings_movie_ids'].tolist(), [1, 2])
+        self.assertEqual(self.snapshot['ratings_offsets'].tolist(), [0, 2, 4])
+        self.assertEqual(
+            self.snapshot['ratings_user_ids'].tolist(),
+            [1, 3, 1, 4],
+        )
+        self.assertEqual(
+            self.snapshot['ratings_values'].tolist(),
+            [4, 2, 3, 1],
+        )
+
+    def test_movie_ratings(self):
+        """Assert a movie's ratings are sorted by user ID."""
+        user_ids, ratings = self.snapshot.movie_ratings(2)
+        self.assertEqual(user_ids.tolist(), [1, 4])
+        self.assertEqual(ratings.tolist(), [3, 1])
+
+    def test_no_movie_ratings(self):
+        """Assert a movie absent from the snapshot has no ratings."""
+        for movie in (0, 3):
+            with self.subTest(movie=movie):
+                user_ids, ratings = self.snapshot.movie_ratings(movie)
+                self.assertEqual(len(user_ids), 0)
+                self.assertEqual(len(ratings), 0)
+
+    def test_attach(self):
+        """Assert an attached snapshot shares memory, and is read-only."""
+        descriptor = pickle.loads(pickle.dumps(self.snapshot.descriptor))
+        with snapshot.Snapshot.attach(descriptor) as attached:
+            self.assertIn('ratings_values', attached)
+            self.assertEqual(
+                attached['ratings_values'].tolist(),
+                [4, 2, 3, 1],
+            )
+            self.snapshot['ratings_values'][0] = 5
+            self.assertEqual(attached['ratings_values'][0], 5)
+            with self.assertRaises(ValueError):
+                attached['ratings_values'][0] = 4
+
+    def test_empty(self):
+        """Assert empty arrays can be shared."""
+        with snapshot.Snapshot.create({'empty': numpy.array([])}) as empty:
+            with snapshot.Snapshot.attach(empty.descriptor) as attached:
+                self.assertEqual(len(attached['empty']), 0)
+
+
+class ComputeTileSimilaritiesTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.ii.compute_tile_similarities`."""
+
+    def setUp(self):
+        """Create a snapshot of random ratings."""
+        rnd = numpy.random.default_rng(0)
+        self.ratings = rnd.choice(
+            numpy.arange(0.5, 5.5, 0.5),
+            size=(20, 4),
+        )
+        self.ratings[rnd.random(self.ratings.shape) < 0.3] = numpy.nan
+        users, movies = numpy.nonzero(~numpy.isnan(self.ratings))
+        arrays = snapshot.group_entries(
+            'ratings',
+            movies,
+            user_ids=users.astype(numpy.int32),
+            values=self.ratings[users, movies].astype(numpy.float32),
+        )
+        arrays['avg_ratings'] = numpy.nanmean(self.ratings, axis=1)
+        self.snapshot = snapshot.Snapshot.create(arrays)
+
+    def tearDown(self):
+        """Free the snapshot."""
+        self.snapshot.close()
+
+    def similarity(self, movie_a, movie_b):
+        """Compute the adjusted cosine similarity between two movies."""
+        both = ~numpy.isnan(self.ratings[:, [movie_a, movie_b]]).any(1)
+        avg_ratings = self.snapshot['avg_ratings'][both, None]
+        centred = self.ratings[both][:, [movie_a, movie_b]] - avg_ratings
+        norm_a = math.sqrt((centred[:, 0] ** 2).sum())
+        norm_b = math.sqrt((centred[:, 1] ** 2).sum())
+        return (centred[:, 0] * centred[:, 1]).sum() / (norm_a * norm_b)
+
+    def test_adjusted_cosine(self):
+        """Assert the adjusted cosine similarity is computed for each pair."""
+        movie_ids = numpy.array([0, 1, 2, 3])
+        target_ids = numpy.array([1, 3])
+        mask = movie_ids[:, None] != target_ids[None, :]
+        scores = analyze_ii.compute_tile_similarities(
+            self.snapshot,
+            target_ids,
+            movie_ids,
+            mask,
+        )
+        for i, j in zip(*numpy.nonzero(mask)):
+            with self.subTest(movie=movie_ids[i], target=target_ids[j]):
+                self.assertAlmostEqual(
+                    scores[i, j],
+                    self.similarity(movie_ids[i], target_ids[j]),
+                )
+
+    def test_mask(self):
+        """Assert scores are only computed for pairs in the mask."""
+        scores = analyze_ii.compute_tile_similarities(
+            self.snapshot,
+            numpy.array([0]),
+            numpy.array([1, 2]),
+            numpy.array([[False], [True]]),
+        )
+        self.assertEqual(scores[0, 0], 0)
+        self.assertAlmostEqual(scores[1, 0], self.similarity(2, 0))
+
+    def test_too_few_pairs(self):
+        """Assert a score of 0 is computed for movies without ratings."""
+        scores = analyze_ii.compute_tile_similarities(
+            self.snapshot,
+            numpy.array([0]),
+            numpy.array([9]),
+            numpy.array([[True]]),
+        )
+        self.assertEqual(scores.tolist(), [[0]])
+
+    def test_missing_avg_rating(self):
+        """Assert an exception is raised for users without an average."""
+        self.snapshot['avg_ratings'][:] = numpy.nan
+        with self.assertRaises(exceptions.MissingAverageRatingError):
+            analyze_ii.compute_tile_similarities(
+                self.snapshot,
+                numpy.array([0]),
+                numpy.array([1]),
+                numpy.array([[True]]),
+            )
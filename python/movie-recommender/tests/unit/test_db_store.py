@@ -0,0 +1,67 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.store`."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.db import store
+
+
+class SimilarityStoreTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.db.store.SimilarityStore`."""
+
+    def setUp(self):
+        """Dump a small store to a temporary directory."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'similarities.bin')
+        self.neighbours = store.dump(
+            self.path,
+            numpy.array([1, 1, 2]),
+            numpy.array([3, 2, 3]),
+            numpy.array([0.5, -0.25, 1.0]),
+        )
+
+    def test_dump(self):
+        """Assert each pair of movies yields two neighbours."""
+        self.assertEqual(self.neighbours, 6)
+
+    def test_neighbours(self):
+        """Assert a movie's neighbours are sorted by movie ID."""
+        neighbour_ids, scores = store.SimilarityStore(self.path).neighbours(3)
+        self.assertEqual(neighbour_ids.tolist(), [1, 2])
+        self.assertEqual(scores.tolist(), [0.5, 1.0])
+
+    def test_no_neighbours(self):
+        """Assert a movie absent from the store has no neighbours."""
+        neighbour_ids, scores = store.SimilarityStore(self.path).neighbours(4)
+        self.assertEqual(len(neighbour_ids), 0)
+        self.assertEqual(len(scores), 0)
+
+    def test_similarity(self):
+        """Assert similarity is symmetric."""
+        similarity_store = store.SimilarityStore(self.path)
+        self.assertEqual(similarity_store.similarity(1, 2), -0.25)
+        self.assertEqual(similarity_store.similarity(2, 1), -0.25)
+
+    def test_missing_similarity(self):
+        """Assert ``None`` is returned for a pair absent from the store."""
+        self.assertIsNone(store.SimilarityStore(self.path).similarity(2, 4))
+
+    def test_invalid(self):
+        """Assert a file that isn't a store is rejected."""
+        with open(self.path, 'wb') as handle:
+            handle.write(b'not a similarity store')
+        with self.assertRaises(exceptions.InvalidSimilarityStoreError):
+            store.SimilarityStore(self.path)
+
+    def test_truncated(self):
+        """Assert a truncated store is rejected."""
+        with open(self.path, 'rb+') as handle:
+            handle.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(exceptions.InvalidSimilarityStoreError):
+            store.SimilarityStore(self.path)
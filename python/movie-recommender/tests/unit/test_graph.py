@@ -1,9 +1,12 @@
 # coding=utf-8
 """Unit tests for :mod:`movie_recommender.graph`."""
+import random
 import unittest
 
+import numpy
+
 from movie_recommender import exceptions
-from movie_recommender.graph import Graph, Point
+from movie_recommender.graph import ArrayGraph, Graph, Point, StreamingGraph
 
 
 class GraphPointsTestCase(unittest.TestCase):
@@ -168,3 +171,134 @@ class NonTrivialGraphTestCase(unittest.TestCase):
         # 4 + 4 + 4 + 4
         # 16
         self.assertEqual(self.graph.sse, 16)
+
+
+class ArrayGraphTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.graph.ArrayGraph`."""
+
+    def test_mismatched_coordinates(self):
+        """Assert a ``ValueError`` is raised if x and y differ in length."""
+        with self.assertRaises(ValueError):
+            ArrayGraph((1, 2), (1,))
+
+    def test_empty(self):
+        """Assert the line of best fit of an empty graph can't be found."""
+        graph = ArrayGraph((), ())
+        for attr in ('avg_point', 'slope', 'y_intercept'):
+            with self.subTest(attr=attr):
+                with self.assertRaises(exceptions.EmptyGraphError):
+                    getattr(graph, attr)
+        self.assertEqual(graph.sse, 0)
+
+    def test_vertical_slope(self):
+        """Assert a vertical line of best fit is detected.
+
+        The points' x coordinates are chosen so that their average isn't
+        exactly representable.
+        """
+        graph = ArrayGraph((0.1, 0.1, 0.1), (1, 2, 3))
+        with self.assertRaises(exceptions.VerticalLineOfBestFitGraphError):
+            graph.slope  # pylint:disable=pointless-statement
+
+    def test_non_trivial(self):
+        """Assert the graph is analyzed like a :class:`Graph`."""
+        points = (Point(-2, 14), Point(2, 10), Point(-2, 10), Point(2, 6))
+        graph = ArrayGraph(*zip(*points))
+        self.assertEqual(graph.points, points)
+        self.assertEqual(graph.avg_point, Point(0, 10))
+        self.assertEqual(graph.slope, -1)
+        self.assertEqual(graph.y_intercept, 10)
+        self.assertEqual(graph.predict_y(0), 10)
+        self.assertEqual(graph.sse, 16)
+
+    def test_matches_graph(self):
+        """Assert random graphs are analyzed like a :class:`Graph`."""
+        rnd = random.Random(0)
+        points = tuple(
+            Point(rnd.randint(1920, 2020), rnd.randint(1, 10) / 2)
+            for _ in range(100)
+        )
+        graph = Graph(points)
+        array_graph = ArrayGraph(*zip(*points))
+        for attr in ('slope', 'y_intercept', 'sse'):
+            with self.subTest(attr=attr):
+                self.assertAlmostEqual(
+                    getattr(array_graph, attr),
+                    getattr(graph, attr),
+                )
+
+    def test_predict_y_batch(self):
+        """Predict y for an array of x coordinates."""
+        # y = 0.5x + 1
+        graph = ArrayGraph((0, 2), (1, 2))
+        numpy.testing.assert_array_equal(
+            graph.predict_y(numpy.array((-2, 0, 1, 4))),
+            (0, 1, 1.5, 3),
+        )
+
+
+class StreamingGraphTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.graph.StreamingGraph`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Define random points, and a graph of them."""
+        rnd = random.Random(0)
+        cls.points = tuple(
+            Point(rnd.randint(1920, 2020), rnd.randint(1, 10) / 2)
+            for _ in range(100)
+        )
+        cls.graph = Graph(cls.points)
+
+    def assert_matches_graph(self, streaming_graph):
+        """Assert the given graph is analyzed like :attr:`graph`."""
+        for attr in ('avg_point', 'slope', 'y_intercept', 'sse'):
+            with self.subTest(attr=attr):
+                numpy.testing.assert_allclose(
+                    getattr(streaming_graph, attr),
+                    getattr(self.graph, attr),
+                )
+
+    def test_empty(self):
+        """Assert the line of best fit of an empty graph can't be found."""
+        graph = StreamingGraph()
+        graph.add_points((), ())
+        graph.merge(StreamingGraph())
+        for attr in ('avg_point', 'slope', 'y_intercept'):
+            with self.subTest(attr=attr):
+                with self.assertRaises(exceptions.EmptyGraphError):
+                    getattr(graph, attr)
+        self.assertEqual(graph.sse, 0)
+
+    def test_vertical_slope(self):
+        """Assert a vertical line of best fit is detected across batches."""
+        graph = StreamingGraph()
+        graph.add_points((0.1, 0.1, 0.1), (1, 2, 3))
+        graph.add_points((0.1,), (4,))
+        with self.assertRaises(exceptions.VerticalLineOfBestFitGraphError):
+            graph.slope  # pylint:disable=pointless-statement
+
+    def test_one_batch(self):
+        """Add all points at once."""
+        graph = StreamingGraph()
+        graph.add_points(*zip(*self.points))
+        self.assert_matches_graph(graph)
+
+    def test_batches(self):
+        """Add points in batches of uneven sizes."""
+        graph = StreamingGraph()
+        x, y = numpy.array(self.points).T
+        for start, end in ((0, 1), (1, 30), (30, 30), (30, 100)):
+            graph.add_points(x[start:end], y[start:end])
+        self.assert_matches_graph(graph)
+
+    def test_merge(self):
+        """Merge graphs of different parts of the points."""
+        graphs = [StreamingGraph() for _ in range(3)]
+        for i, graph in enumerate(graphs):
+            graph.add_points(*zip(*self.points[i::3]))
+        graph = StreamingGraph()
+        for other in graphs:
+            graph.merge(other)
+        self.assert_matches_graph(graph)
+        self.assertEqual(graph.moments.count, len(self.points))
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.metrics`."""
+import pickle
+import unittest
+
+from movie_recommender import metrics
+
+
+def square(value):
+    """Square a value, and count one call."""
+    metrics.count('squares', 'test')
+    return value ** 2
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Test the timers and counters of :mod:`movie_recommender.metrics`."""
+
+    def setUp(self):
+        """Forget metrics recorded by other tests."""
+        metrics.reset()
+
+    def tearDown(self):
+        """Forget metrics recorded by this test."""
+        metrics.reset()
+
+    def test_timed(self):
+        """Assert each call of a timed function is counted."""
+        @metrics.timed('sql', 'double')
+        def double(value):
+            return value * 2
+
+        self.assertEqual([double(1), double(2)], [2, 4])
+        self.assertEqual(metrics.stats()['sql']['double']['calls'], 2)
+
+    def test_timed_generator(self):
+        """Assert a timed generator is counted once, when it's exhausted."""
+        @metrics.timed('sql', 'values')
+        def values():
+            yield from (1, 2, 3)
+
+        gen = values()
+        self.assertEqual(next(gen), 1)
+        self.assertNotIn('values', metrics.stats()['sql'])
+        self.assertEqual(list(gen), [2, 3])
+        self.assertEqual(metrics.stats()['sql']['values']['calls'], 1)
+
+    def test_timed_exception(self):
+        """Assert a call is counted even if it raises an exception."""
+        @metrics.timed('write', 'table')
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertEqual(metrics.stats()['writes']['table']['calls'], 1)
+
+    def test_measured(self):
+        """Assert a worker's metrics are merged by :func:`collect`."""
+        func = pickle.loads(pickle.dumps(metrics.measured(square, 'test')))
+        # Simulate the results of a worker process.
+        results = []
+        for value in (1, 2, 3):
+            results.append(func(value))
+        self.assertEqual(metrics.stats()['phases'], {})
+        self.assertEqual(list(metrics.collect(results)), [1, 4, 9])
+        self.assertEqual(metrics.stats()['phases']['test']['squares'], 3)
+
+    def test_stats(self):
+        """Assert rates and utilization are derived from timers."""
+        metrics.add_time('phase', 'test', 2)
+        metrics.count('pairs', 'test', 10)
+        metrics.add_time('worker', 'test', 3, calls=5)
+        metrics.count('capacity', 'test', 4)
+        stats = metrics.stats()
+        self.assertEqual(stats['phases'], {
+            'test': {'seconds': 2, 'pairs': 10, 'pairs_per_second': 5},
+        })
+        self.assertEqual(stats['workers'], {
+            'test': {
+                'busy_seconds': 3,
+                'capacity_seconds': 4,
+                'utilization': 0.75,
+            },
+        })
+
+    def test_prometheus(self):
+        """Assert timers become summaries, and counters become counters."""
+        metrics.add_time('sql', 'rating_pairs', 0.5, calls=2)
+        metrics.count('pairs', 'analyze_movies', 10)
+        self.assertEqual(metrics.prometheus().splitlines(), [
+            '# TYPE movie_recommender_sql_seconds summary',
+            'movie_recommender_sql_seconds_count{query="rating_pairs"} 2',
+            'movie_recommender_sql_seconds_sum{query="rating_pairs"} 0.5',
+            '# TYPE movie_recommender_pairs_total counter',
+            'movie_recommender_pairs_total{phase="analyze_movies"} 10',
+        ])
@@ -2,6 +2,9 @@
 """Unit tests for :mod:`movie_recommender.predict.ii`."""
 import unittest
 
+import numpy
+
+from movie_recommender.db import snapshot
 from movie_recommender.predict import ii
 
 
@@ -47,3 +50,53 @@ class DenormalizeRatingTestCase(unittest.TestCase):
         target_val = 5
         actual_val = ii.denormalize_rating(1)
         self.assertEqual(target_val, actual_val)
+
+
+class PredictRatingFromSnapshotTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.predict.ii.predict_rating_from_snapshot`."""
+
+    def setUp(self):
+        """Create a snapshot of neighbours."""
+        self.snapshot = snapshot.Snapshot.create(snapshot.group_entries(
+            'neighbours',
+            numpy.array([1, 1, 1, 2]),
+            ids=numpy.array([4, 2, 3, 5]),
+            scores=numpy.array([0.5, -0.25, 1.0, 0.75]),
+        ))
+        self.user_movies = numpy.array([2, 4, 9])
+        self.user_ratings = numpy.array([5.0, 0.5, 3.0])
+
+    def tearDown(self):
+        """Free the snapshot."""
+        self.snapshot.close()
+
+    def test_similar(self):
+        """Assert a weighted average of the user's ratings is predicted."""
+        prediction = ii.predict_rating_from_snapshot(
+            self.snapshot,
+            self.user_movies,
+            self.user_ratings,
+            1,
+        )
+        normalized = 0.5 * ii.normalize_rating(0.5)
+        normalized -= 0.25 * ii.normalize_rating(5)
+        normalized /= 0.75
+        self.assertAlmostEqual(
+            prediction.pred_rating,
+            ii.denormalize_rating(normalized),
+        )
+        self.assertEqual(prediction.movie, 1)
+        self.assertIsNotNone(prediction.reason)
+
+    def test_no_similar(self):
+        """Assert the minimum rating is predicted without rated neighbours."""
+        for movie in (2, 3):
+            with self.subTest(movie=movie):
+                prediction = ii.predict_rating_from_snapshot(
+                    self.snapshot,
+                    self.user_movies,
+                    self.user_ratings,
+                    movie,
+                )
+                self.assertEqual(prediction.pred_rating, 0.5)
+                self.assertIsNone(prediction.reason)